@@ -5,13 +5,23 @@
 # @Last Modified time: 2019-07-06 10:47:53
 
 
-import numpy as np
-import os
-import matplotlib
-if os.environ.get('DISPLAY', '') == '':
-    matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+"""
+Submodules are imported on first access (e.g. analysis.plot), so that importing the numerical core (avalanche, reader, histogram, sweep, fitting, ...) doesn't load matplotlib. The plotting functions of the dataset module are also available as analysis.[function].
+"""
 
-from analysis import avalanche, plot, fitting, parser
-from analysis.dataset import *
+import importlib
+
+_submodules = ['avalanche', 'plot', 'fitting', 'parser', 'histogram', 'reader', 'cache', 'sweep', 'pipeline', 'bootstrap', 'dataset', 'surrogate', 'correlation']
+
+def __getattr__(name):
+	if name in _submodules:
+		return importlib.import_module('analysis.' + name)
+	if not name.startswith('_'):
+		dataset = importlib.import_module('analysis.dataset')
+		if hasattr(dataset, name):
+			return getattr(dataset, name)
+	raise AttributeError("module 'analysis' has no attribute '{:s}'".format(name))
+
+def __dir__():
+	return sorted(set(globals()) | set(_submodules))
 
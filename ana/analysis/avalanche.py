@@ -12,31 +12,208 @@ Module for the avalanche analysis of MEA datasets.
 """
 
 import numpy as np
-import h5py, os
-from scipy.signal import butter, lfilter
+import h5py, os, functools
+from analysis import reader
 
 def threshold_ch(data, threshold):
 
-	#Demeans data
-	data = data - np.mean(data)
+	#Thresholds a single channel with the multi-channel engine
+	data_thresholded = np.zeros(data.shape)
+	events = threshold_data(data[np.newaxis,:], threshold)[0]
+	data_thresholded[events] = 1
 
-	#Defines threshold
-	th = threshold*np.std(data)
+	return data_thresholded
 
-	#Finds crossings of the signal to positive
-	id_cross=np.where(np.sign(data[:-1]) != np.sign(data[1:]))[0] + 1
-	id_cross_plus = id_cross[data[id_cross]>0]
+def threshold_data(data, threshold, return_dense=False):
+	"""Thresholds a [channels, timesteps] block of signals at once.
 
-	#Defines output array
-	data_thresholded = np.zeros(data.shape)
+	For every channel, the signal is demeaned and each positive excursion (from a crossing to positive up to the next one) contributes an event at its maximum, if the maximum is larger than threshold*std. The last (open) excursion is ignored, as in threshold_ch.
+	
+	Args:
+	    data (ndarray): [channels, timesteps] signal (a 1D signal is treated as a single channel)
+	    threshold (float): Threshold in standard deviations of the signal
+	    return_dense (bool, optional): Also returns the summed dense event train
 	
-	#For every positive excursion, finds max and add and event if larger than th
-	for id in range(len(id_cross_plus)-1):
-		id_max = id_cross_plus[id]+np.argmax(data[id_cross_plus[id]:id_cross_plus[id+1]])
-		if data[id_max] > th:
-			data_thresholded[id_max] = 1
+	Returns:
+	    list: Event indices (int64) for every channel
+	    ndarray: (only if return_dense) [timesteps] int64 summed event train
+	"""
 
-	return data_thresholded
+	data = np.atleast_2d(data)
+	n_ch, timesteps = data.shape
+
+	#Demeans data
+	data = data - np.mean(data,axis=1,keepdims=True)
+
+	#Defines threshold
+	th = threshold*np.std(data,axis=1)
+
+	#Finds the maxima of the excursions larger than th
+	ch_events, t_events, _ = _excursion_events(data, th)
+
+	#Splits events per channel (already sorted by channel and time)
+	ch_split = np.searchsorted(ch_events, np.arange(1,n_ch))
+	events = np.split(t_events, ch_split)
+
+	if return_dense:
+		data_th = np.bincount(t_events, minlength=timesteps)
+		return events, data_th
+	else:
+		return events
+
+def _excursion_events(data, th):
+	"""Finds the excursion maxima larger than th of a demeaned [channels, timesteps] block.
+
+	Returns the channel and timestep of every event (sorted by channel and time), and the start of the last (open) excursion of each channel (-1 if there is none).
+	"""
+
+	n_ch, timesteps = data.shape
+
+	#Finds crossings of the signal to positive, as flat indices
+	sign = np.sign(data)
+	ch_cross, t_cross = np.nonzero(sign[:,:-1] != sign[:,1:])
+	t_cross += 1
+	is_plus = data[ch_cross,t_cross] > 0
+	ch_cross = ch_cross[is_plus]
+	t_cross = t_cross[is_plus]
+	id_cross_plus = ch_cross*timesteps + t_cross
+
+	#Start of the last excursion of each channel
+	last_cross = -np.ones(n_ch, dtype=np.int64)
+	if ch_cross.size > 0:
+		is_last = np.ones(ch_cross.size, dtype=bool)
+		is_last[:-1] = ch_cross[:-1] != ch_cross[1:]
+		last_cross[ch_cross[is_last]] = t_cross[is_last]
+
+	#Excursions are delimited by consecutive crossings of the same channel
+	if id_cross_plus.size > 1:
+		valid = ch_cross[:-1] == ch_cross[1:]
+		data_flat = data.ravel()
+
+		#Segmented maximum of each excursion
+		start = id_cross_plus[0]
+		seg_max = np.maximum.reduceat(data_flat[start:], id_cross_plus - start)[:-1]
+		seg_len = np.diff(id_cross_plus)
+
+		#First index reaching the maximum of each excursion (as np.argmax)
+		id_max = np.flatnonzero(data_flat[start:id_cross_plus[-1]] == np.repeat(seg_max, seg_len)) + start
+		seg_id = np.searchsorted(id_cross_plus, id_max, side='right') - 1
+		first = np.ones(id_max.size, dtype=bool)
+		first[1:] = seg_id[1:] != seg_id[:-1]
+		id_max = id_max[first]
+
+		#Keeps excursions larger than th
+		ch_seg = ch_cross[:-1]
+		keep = valid & (seg_max > th[ch_seg])
+		id_events = id_max[keep]
+		ch_events = ch_seg[keep]
+	else:
+		id_events = np.zeros(0, dtype=np.int64)
+		ch_events = np.zeros(0, dtype=np.int64)
+
+	t_events = (id_events - ch_events*timesteps).astype(np.int64)
+
+	return ch_events, t_events, last_cross
+
+def threshold_stream(filepath, threshold, bw_filter, chunk_size, channels=None, timesteps=None, bw_freqs=[0.1,200], fs=500, return_dense=False):
+	"""Thresholds the coarse signal of a simulation dataset out-of-core, in chunks of [chunk_size] timesteps.
+
+	Memory is bounded by the chunk size. A first pass computes the mean and std of every (filtered) channel, merging the statistics of the chunks. A second pass thresholds the chunks as in threshold_data, carrying the Butterworth filter state and the open positive excursion of every channel across chunk boundaries. Results match the in-memory analysis up to the floating-point roundoff of the mean and std.
+	
+	Args:
+	    filepath (str): Path to the .hdf5 dataset
+	    threshold (float): Threshold in standard deviations of the signal
+	    bw_filter (bool): Toggles butterworth filtering
+	    chunk_size (int): Number of timesteps processed at once
+	    channels (int, optional): Number of channels to use (default: all)
+	    timesteps (int, optional): Number of timesteps to use (default: all)
+	    bw_freqs (list, optional): Band of the butterworth filter
+	    fs (int, optional): Sampling frequency
+	    return_dense (bool, optional): Also returns the summed dense event train
+	
+	Returns:
+	    list: Event indices (int64) for every channel
+	    ndarray: (only if return_dense) [timesteps] int64 summed event train
+	"""
+
+	def tiles():
+		return reader.iter_tiles(filepath, 'coarse', t_block=chunk_size, channels=channels, timesteps=timesteps)
+
+	#First pass: merges mean and sum of squared deviations of all chunks
+	count = 0
+	zi = None
+	for _, _, data in tiles():
+		if bw_filter:
+			data, zi = filter_bw_chunk(data, bw_freqs, fs, zi=zi)
+		data = data.astype(float)
+		if count == 0:
+			n_ch = data.shape[0]
+			data_mean = np.zeros(n_ch)
+			data_M2 = np.zeros(n_ch)
+		n = data.shape[1]
+		chunk_mean = np.mean(data, axis=1)
+		chunk_M2 = np.sum((data - chunk_mean[:,np.newaxis])**2, axis=1)
+		delta = chunk_mean - data_mean
+		data_mean = data_mean + delta*n/(count + n)
+		data_M2 = data_M2 + chunk_M2 + delta**2*count*n/(count + n)
+		count += n
+
+	#Defines threshold
+	th = threshold*np.sqrt(data_M2/count)
+
+	#Second pass: thresholds each chunk, prepending to each channel three samples that reproduce its state:
+	#[-inf, max of the open excursion, last sample] if it has an open excursion, [last sample]*3 otherwise
+	zi = None
+	x_last = None
+	has_open = np.zeros(n_ch, dtype=bool)
+	open_max = np.zeros(n_ch)
+	open_id = np.zeros(n_ch, dtype=np.int64)
+	events_chunks = []
+	for _, t_slice, data in tiles():
+		if bw_filter:
+			data, zi = filter_bw_chunk(data, bw_freqs, fs, zi=zi)
+		x = data.astype(float) - data_mean[:,np.newaxis]
+		t0 = t_slice.start
+
+		prefix = np.empty((n_ch,3))
+		if x_last is None:
+			prefix[:] = x[:,:1]
+		else:
+			prefix[:] = x_last[:,np.newaxis]
+			prefix[has_open,0] = -np.inf
+			prefix[has_open,1] = open_max[has_open]
+		x_ext = np.concatenate((prefix, x), axis=1)
+
+		ch_events, t_events, last_cross = _excursion_events(x_ext, th)
+
+		#Maps positions back to timesteps (position 1 holds the carried maximum)
+		t_global = t_events - 3 + t0
+		at_open = t_events == 1
+		t_global[at_open] = open_id[ch_events[at_open]]
+		events_chunks.append((ch_events, t_global))
+
+		#Updates the open excursion of every channel
+		for ch in np.flatnonzero(last_cross >= 0):
+			id_max = last_cross[ch] + np.argmax(x_ext[ch,last_cross[ch]:])
+			open_max[ch] = x_ext[ch,id_max]
+			if id_max != 1:
+				open_id[ch] = id_max - 3 + t0
+		has_open = last_cross >= 0
+		x_last = x[:,-1]
+
+	#Sorts events per channel
+	ch_events = np.concatenate([ev[0] for ev in events_chunks])
+	t_events = np.concatenate([ev[1] for ev in events_chunks])
+	order = np.lexsort((t_events, ch_events))
+	ch_events = ch_events[order]
+	t_events = t_events[order]
+	events = np.split(t_events, np.searchsorted(ch_events, np.arange(1,n_ch)))
+
+	if return_dense:
+		data_th = np.bincount(t_events, minlength=count)
+		return events, data_th
+	else:
+		return events
 
 def convert_timestamps(data,timesteps):
 
@@ -44,82 +221,323 @@ def convert_timestamps(data,timesteps):
 	data_converted[data] = 1
 	return data_converted
 
+def sub_spike_times(data):
+	"""Extracts the spike times of subsampled ('sub') data, dropping the zero-padding of short rows.
+
+	Rows of '/data/sub' have different lengths, and the shorter ones are padded with zeros when written. Only the entries up to the last nonzero spike time of each row are kept. As in convert_timestamps, a channel has at most one spike per timestep.
+	
+	Args:
+	    data (ndarray): [channels, L] zero-padded spike times
+	
+	Returns:
+	    list: Spike times (int64) for every channel
+	"""
+
+	data = np.atleast_2d(data).astype(np.int64)
+
+	#Finds the length of each row without padding
+	nonzero = data != 0
+	row_len = data.shape[1] - np.argmax(nonzero[:,::-1], axis=1)
+	row_len[~np.any(nonzero, axis=1)] = 0
+
+	return [np.unique(data[ch,:row_len[ch]]) for ch in range(data.shape[0])]
+
 def bin_data(data,binsize):
+	"""Bins a 1D (or [reps, timesteps]) thresholded timeseries, legacy layout.
 
-	timesteps = data.size
-	bin_array = np.arange(0,timesteps,binsize)
-	data_binned = np.zeros(bin_array.size)
+	Kept for reproducibility of previous results: the output has ceil(timesteps/binsize) float bins, and the last bin is always set to zero. Use bin_block for the explicit handling of the last bin.
+	"""
 
-	for i in range(data_binned.size-1):
-		data_binned[i] = np.sum(data[bin_array[i]:bin_array[i+1]])
+	data_binned = bin_block(data,binsize,ragged='keep').astype(float)
+	data_binned[...,-1] = 0
 
 	return data_binned
 
-def filter_bw_ch(data,freqs=[0.1,200],fs=500):
+def bin_block(data,binsize,ragged='drop'):
+	"""Bins a 1D or 2D ([reps, timesteps] or [channels, timesteps]) array along the last axis.
+	
+	Args:
+	    data (ndarray): Array to bin. Integer dtypes are preserved.
+	    binsize (int): Binsize, in timesteps
+	    ragged (str, optional): What to do with an incomplete last bin. 'drop' discards it, 'keep' keeps its partial sum.
+	
+	Returns:
+	    ndarray: [..., nbins] binned array
+	"""
 
-	#Parameters
-	order = 4
+	data = np.asarray(data)
+	binsize = int(binsize)
+	timesteps = data.shape[-1]
+	nbins_full = timesteps//binsize
+
+	if ragged not in ['drop', 'keep']:
+		raise ValueError('ragged must be either "drop" or "keep"')
+
+	#Keeps integer dtypes (avoids the int32 -> int64 promotion of np.sum)
+	dtype = data.dtype if data.dtype.kind in 'iu' else None
+
+	#Sums complete bins
+	data_full = data[...,:nbins_full*binsize]
+	if binsize == 1:
+		data_binned = data_full.astype(dtype or data.dtype)
+	else:
+		data_binned = data_full.reshape(data.shape[:-1] + (nbins_full,binsize)).sum(axis=-1,dtype=dtype)
+
+	#Adds the incomplete last bin
+	if ragged == 'keep' and nbins_full*binsize < timesteps:
+		data_last = data[...,nbins_full*binsize:].sum(axis=-1,dtype=dtype)
+		data_binned = np.concatenate((data_binned,data_last[...,np.newaxis]),axis=-1)
+
+	return data_binned
+
+def bin_timestamps(events,binsize,timesteps,ragged='drop'):
+	"""Bins event indices directly into counts per bin, without building a dense array.
+	
+	Args:
+	    events (ndarray or list): Event indices (repeated indices count multiple times). A list of arrays returns one row per element.
+	    binsize (int): Binsize, in timesteps
+	    timesteps (int): Length of the timeseries the events belong to
+	    ragged (str, optional): What to do with an incomplete last bin. 'drop' discards it, 'keep' keeps its partial sum.
+	
+	Returns:
+	    ndarray: [nbins] or [len(events), nbins] int64 counts
+	"""
+
+	if ragged == 'drop':
+		nbins = timesteps//binsize
+	elif ragged == 'keep':
+		nbins = -(-timesteps//binsize)
+	else:
+		raise ValueError('ragged must be either "drop" or "keep"')
+
+	if type(events) in [list, tuple]:
+		#Offsets each row and bins all of them in a single call
+		n_rows = len(events)
+		if n_rows == 0:
+			return np.zeros((0,nbins),dtype=np.int64)
+		rows = np.repeat(np.arange(n_rows), [len(ev) for ev in events])
+		id_bin = np.concatenate(events).astype(np.int64)//binsize
+		in_range = id_bin < nbins
+		id_flat = rows[in_range]*nbins + id_bin[in_range]
+		return np.bincount(id_flat,minlength=n_rows*nbins).reshape(n_rows,nbins)
+
+	id_bin = np.asarray(events,dtype=np.int64)//binsize
+	return np.bincount(id_bin[id_bin < nbins],minlength=nbins)
+
+@functools.lru_cache(maxsize=None)
+def _bw_sos(order, f_low, f_high, fs):
+
+	#Butterworth band-pass in second-order sections, designed once per band. scipy.signal is slow to import, so it is only loaded when filtering
+	from scipy.signal import butter
+	return butter(order, [2*f_low/fs, 2*f_high/fs], btype='band', output='sos')
+
+def filter_bw(data, freqs=[0.1,200], fs=500, order=4, zi=None, dtype=np.float64, jobs=1, ch_block=8):
+	"""Butterworth band-pass of a [channels, timesteps] block (or a single channel) along the last axis.
+
+	The filter is designed once for every (order, band, fs) and runs in second-order sections, which stay stable for the narrow 0.1 Hz edge where the (b, a) form loses precision. The block is filtered in groups of [ch_block] channels, written into a single output array of [dtype]. With float32, memory is halved and filtering is about twice as fast, at a relative error of up to ~1e-2 of the signal std for signals with a large offset (from the low band edge), so float64 remains the default.
+
+	Args:
+	    data (ndarray): [timesteps] or [channels, timesteps] signal
+	    freqs (list, optional): Band of the filter, in Hz
+	    fs (int, optional): Sampling frequency, in Hz
+	    order (int, optional): Order of the filter
+	    zi (ndarray, optional): Filter state returned for the previous chunk of the same signal (None starts at rest)
+	    dtype (type, optional): Compute and output dtype (np.float64 or np.float32)
+	    jobs (int, optional): Threads filtering channel groups in parallel
+	    ch_block (int, optional): Channels per group
+
+	Returns:
+	    ndarray: Filtered signal, with the shape of [data]
+	    ndarray: Final filter state, to pass as [zi] of the next chunk
+	"""
+
+	from scipy.signal import sosfilt
+
+	sos = _bw_sos(order, float(freqs[0]), float(freqs[1]), fs).astype(dtype)
+	data = np.asarray(data)
+	data_2d = data.reshape(-1, data.shape[-1])
+	n_ch = data_2d.shape[0]
+
+	data_filt = np.empty(data_2d.shape, dtype=dtype)
+	if zi is None:
+		zf = np.zeros((sos.shape[0], n_ch, 2), dtype=dtype)
+	else:
+		zf = np.array(zi, dtype=dtype).reshape(sos.shape[0], n_ch, 2)
+
+	#Each group writes its own rows, so groups can run in threads (sosfilt releases the GIL)
+	def filter_block(ch0):
+		ch1 = min(ch0 + ch_block, n_ch)
+		data_filt[ch0:ch1], zf[:,ch0:ch1] = sosfilt(sos, data_2d[ch0:ch1].astype(dtype, copy=False), axis=-1, zi=zf[:,ch0:ch1])
+
+	blocks = range(0, n_ch, ch_block)
+	if jobs is None or jobs <= 1 or len(blocks) <= 1:
+		for ch0 in blocks:
+			filter_block(ch0)
+	else:
+		from concurrent.futures import ThreadPoolExecutor
+		with ThreadPoolExecutor(max_workers=min(jobs, len(blocks))) as executor:
+			list(executor.map(filter_block, blocks))
+
+	return data_filt.reshape(data.shape), zf
+
+def filter_bw_ch(data,freqs=[0.1,200],fs=500):
 
 	#Filters signal (simple butterworth)
-	b, a = butter(order, [2*freqs[0]/fs, 2*freqs[1]/fs], btype='band')
-	data_filt = lfilter(b, a, data)
+	data_filt, _ = filter_bw(data, freqs, fs)
 
 	return data_filt
+
+def filter_bw_chunk(data,freqs=[0.1,200],fs=500,zi=None):
+	"""Filters a chunk of a longer signal, as filter_bw_ch. Pass the returned state as [zi] of the next chunk (None for the first one)."""
+
+	#Filters signal (simple butterworth), starting from state zi
+	return filter_bw(data, freqs, fs, zi=zi)
 	
 def get_S(data):
 
-	#Finds crossings of the signal to positive
-	id_cross=	np.where(np.sign(data[:-1]) != np.sign(data[1:]))[0] + 1
-	id_cross_plus = id_cross[data[id_cross]>0]
+	#Avalanche sizes from the avalanche table
+	S = get_avalanches(data)['size'].astype(float)
+
+	return S
+
+def get_avalanches(data):
+	"""Builds a table of avalanches from a binned timeseries, in a single vectorized pass.
 
+	An avalanche starts at a crossing of the signal to positive and lasts until the next one, as in get_S. Avalanches already active at the first bin and the last (open) avalanche are discarded.
+	
+	Args:
+	    data (ndarray): [timesteps] or [reps, timesteps] binned timeseries
+	
+	Returns:
+	    dict: Columns of equal length, ordered by rep and start:
+	    	'size': sum of the activity in the avalanche
+	    	'duration': number of consecutive active bins
+	    	'start': first bin of the avalanche
+	    	'end': first inactive bin after the avalanche
+	    	'peak': largest bin of the avalanche
+	    	'rep': row of the avalanche (always 0 for 1D data)
+	"""
+
+	data = np.atleast_2d(data)
+	reps, timesteps = data.shape
+	data_flat = data.ravel()
+
+	#Finds crossings of the signal to positive, for each row
+	sign = np.sign(data)
+	rep_cross, t_cross = np.nonzero(sign[:,:-1] != sign[:,1:])
+	t_cross += 1
+	is_plus = data[rep_cross,t_cross] > 0
+	rep_start = rep_cross[is_plus]
+	id_start = rep_start*timesteps + t_cross[is_plus]
+
+	#Finds the ends of the active periods (first bin after them)
+	rep_end, t_end = np.nonzero((data[:,:-1] > 0) & (data[:,1:] <= 0))
+	id_end = rep_end*timesteps + t_end + 1
+	id_end = np.sort(np.concatenate((id_end, np.flatnonzero(data[:,-1] > 0)*timesteps + timesteps)))
+
+	#Avalanches are delimited by consecutive starts of the same row
+	if id_start.size > 1:
+		valid = rep_start[:-1] == rep_start[1:]
+		offset = id_start[0]
+		size = np.add.reduceat(data_flat[offset:], id_start - offset)[:-1][valid]
+		peak = np.maximum.reduceat(data_flat[offset:], id_start - offset)[:-1][valid]
+		start = id_start[:-1][valid]
+		end = id_end[np.searchsorted(id_end, start, side='right')]
+		rep = rep_start[:-1][valid]
+	else:
+		size = np.zeros(0, dtype=data.dtype)
+		peak = np.zeros(0, dtype=data.dtype)
+		start = np.zeros(0, dtype=np.int64)
+		end = np.zeros(0, dtype=np.int64)
+		rep = np.zeros(0, dtype=np.int64)
+
+	avalanches = {
+		'size': size,
+		'duration': end - start,
+		'start': start - rep*timesteps,
+		'end': end - rep*timesteps,
+		'peak': peak,
+		'rep': rep
+		}
+
+	return avalanches
 
-	#Calculates size S of avalanches
-	n_avalanches = id_cross_plus.size
+def analyze_sim_raw(
+	filepath,
+	threshold,
+	datatype,
+	bw_filter,
+	timesteps=None,
+	channels=None,
+	chunk_size=None,
+	bw_freqs=[0.1,200]
+	):
+	"""Thresholds a simulation dataset, returning the summed event train of all channels.
 
-	S = np.zeros(n_avalanches-1)
+	If [chunk_size] is given, the coarse signal is processed out-of-core in chunks of [chunk_size] timesteps (see threshold_stream), so memory is bounded by the chunk size instead of the length of the recording.
+	"""
 
-	for i in range(n_avalanches-1):
-		S[i] = np.sum(data[id_cross_plus[i]:id_cross_plus[i+1]])
+	#Gets merged events and builds the summed train
+	events, timesteps = analyze_sim_events(filepath, threshold, datatype, bw_filter, timesteps, channels, chunk_size, bw_freqs)
+	data_th = np.bincount(events, minlength=timesteps)
 
-	return S
+	return data_th
 
-def analyze_sim_raw(
+def analyze_sim_events(
 	filepath,
 	threshold,
 	datatype,
 	bw_filter,
 	timesteps=None,
-	channels=None
+	channels=None,
+	chunk_size=None,
+	bw_freqs=[0.1,200]
 	):
+	"""Thresholds a simulation dataset, returning the sorted event times of all channels merged.
+
+	Stays in event space: 'sub' spike times are taken directly from the file, without building dense arrays. Bin the result with bin_timestamps.
+
+	Args:
+	    filepath (str): Path to the .hdf5 dataset
+	    threshold (float): Threshold in standard deviations of the signal (for coarse)
+	    datatype (str): 'coarse' or 'sub'
+	    bw_filter (bool): Toggles butterworth filtering (for coarse)
+	    timesteps (None, optional): Number of timesteps to use (default extracts from dataset)
+	    channels (None, optional): Number of electrode channels to use (default extracts from dataset)
+	    chunk_size (None, optional): Streams the coarse signal in chunks of [chunk_size] timesteps
+	    bw_freqs (list, optional): Band of the butterworth filter, in Hz
+
+	Returns:
+	    ndarray: Sorted event times (int64), repeated if several channels have an event at the same time
+	    int: Number of timesteps
+	"""
 
 	#Parameters
 	data_dir = 'data/'
 	fs = 500
-	bw_freqs = [0.1, 200]
 
 	#Gets timesteps and number of channels
-	file = h5py.File(filepath,'r')
-
-	if timesteps is None:
-		timesteps = file[data_dir + 'activity'].shape[0]
-	if channels is None:
-		channels = file[data_dir+datatype].shape[0]
-
-	#Analyses channel by channel
-	data_th = np.zeros(timesteps)
-	for ch in range(channels):
-		
-		#Loads data
-		data_ch = file[data_dir + datatype][ch,:]
-
-		#Analyzes sub and coarse channel data accordingly
-		if datatype == 'coarse':
+	with h5py.File(filepath,'r') as file:
+		if timesteps is None:
+			timesteps = file[data_dir + 'activity'].shape[0]
+		if channels is None:
+			channels = file[data_dir+datatype].shape[0]
+
+	#Analyzes sub and coarse channel data accordingly
+	if datatype == 'coarse':
+		if chunk_size is not None:
+			events = threshold_stream(filepath,threshold,bw_filter,chunk_size,channels,timesteps,bw_freqs,fs)
+		else:
+			data = reader.load_channels(filepath, datatype, channels, timesteps, data_dir=data_dir)
 			if bw_filter:
-				data_ch = filter_bw_ch(data_ch,bw_freqs,fs)		
-			data_th_ch = threshold_ch(data_ch,threshold)			
-		elif datatype == 'sub':
-			data_th_ch = convert_timestamps(data_ch,timesteps)
+				data = filter_bw_ch(data,bw_freqs,fs)
+			events = threshold_data(data,threshold)
+	elif datatype == 'sub':
+		data = reader.load_channels(filepath, datatype, channels, data_dir=data_dir)
+		events = sub_spike_times(data)
 
-		data_th = data_th + data_th_ch
+	#Merges all channels
+	events = np.sort(np.concatenate(events))
+	events = events[events < timesteps]
 
-	return data_th
\ No newline at end of file
+	return events, timesteps
\ No newline at end of file
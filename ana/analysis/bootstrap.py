@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+Module for bootstrap and jackknife error estimates of avalanche observables.
+
+Resampling is done at the histogram level instead of rerunning the analysis: resampling the avalanches of a repetition with replacement is a multinomial draw on its p(S) counts, and resampling its pairs (A(t), A(t+1)) is a multinomial draw on the histogram of ratios A(t+1)/A(t) (see fitting.m_avalanche_ratios). All resamples are drawn and fit as arrays, from a seeded generator.
+
+"""
+
+import numpy as np
+from analysis import fitting
+
+def multinomial_resample(counts, n_boot=1000, rng=None):
+	"""Resamples histograms with replacement, keeping their total number of counts.
+
+	Args:
+	    counts (ndarray): [..., bins] histograms
+	    n_boot (int, optional): Number of resamples
+	    rng (np.random.Generator, optional): Random generator
+
+	Returns:
+	    ndarray: [n_boot, ..., bins] resampled histograms
+	"""
+
+	if rng is None:
+		rng = np.random.default_rng()
+
+	counts = np.asarray(counts)
+	n = counts.sum(axis=-1)
+
+	#Empty histograms stay empty (their probabilities are irrelevant)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		pvals = counts/n[...,np.newaxis]
+	pvals[n == 0] = 1/counts.shape[-1]
+
+	return rng.multinomial(n.astype(np.int64), pvals, size=(n_boot,) + n.shape)
+
+def alpha_bootstrap(counts, n_boot=1000, xmin=1, xmax=50, seed=0):
+	"""Bootstrap resamples of the power-law exponent alpha of avalanche-size histograms (see fitting.powerlaw_alpha).
+
+	Args:
+	    counts (ndarray): [..., sizes] histograms, where counts[..., S] is the number of avalanches of size S
+	    n_boot (int, optional): Number of resamples
+	    xmin (int, optional): Smallest avalanche size of the fit
+	    xmax (int, optional): Largest avalanche size of the fit
+	    seed (int, optional): Seed of the random generator
+
+	Returns:
+	    ndarray: [n_boot, ...] alpha of each resample
+	"""
+
+	rng = np.random.default_rng(seed)
+
+	#Only the fit range needs resampling, as the fit conditions on it
+	counts = np.asarray(counts)[...,xmin:xmax+1]
+	counts_boot = multinomial_resample(counts, n_boot, rng)
+	pad = [(0,0)]*(counts_boot.ndim-1) + [(xmin,0)]
+
+	return fitting.powerlaw_alpha(np.pad(counts_boot, pad), xmin=xmin, xmax=xmax)
+
+def m_av_bootstrap(ratios_list, n_boot=1000, seed=0):
+	"""Bootstrap resamples of m_av, resampling the pairs (A(t), A(t+1)) of each repetition.
+
+	Args:
+	    ratios_list (list): Ratio histograms (ratios, counts) of each repetition (see fitting.m_avalanche_ratios)
+	    n_boot (int, optional): Number of resamples
+	    seed (int, optional): Seed of the random generator
+
+	Returns:
+	    ndarray: [n_boot, reps] m_av of each resample
+	"""
+
+	rng = np.random.default_rng(seed)
+
+	m_av_boot = np.full((n_boot, len(ratios_list)), np.nan)
+	for rep, (ratios, counts) in enumerate(ratios_list):
+		if np.sum(counts) > 0:
+			counts_boot = multinomial_resample(counts, n_boot, rng)
+			m_av_boot[:,rep] = counts_boot @ ratios/np.sum(counts)
+
+	return m_av_boot
+
+def confidence_interval(samples, ci=0.95, axis=0):
+	"""Percentile confidence interval of resamples.
+
+	Args:
+	    samples (ndarray): Resamples of an estimate
+	    ci (float, optional): Confidence level
+	    axis (int, optional): Axis of the resamples
+
+	Returns:
+	    ndarray: Lower bound
+	    ndarray: Upper bound
+	"""
+
+	lo, hi = np.nanpercentile(samples, [50*(1-ci), 50*(1+ci)], axis=axis)
+
+	return lo, hi
+
+def jackknife_alpha(counts, xmin=1, xmax=50):
+	"""Jackknife estimate of the power-law exponent of the histograms pooled over repetitions, leaving one repetition out at a time.
+
+	Args:
+	    counts (ndarray): [reps, ..., sizes] histograms of each repetition
+	    xmin (int, optional): Smallest avalanche size of the fit
+	    xmax (int, optional): Largest avalanche size of the fit
+
+	Returns:
+	    ndarray: [...] alpha of the pooled histogram
+	    ndarray: [...] jackknife standard error
+	"""
+
+	counts = np.asarray(counts)
+	reps = counts.shape[0]
+	alpha = fitting.powerlaw_alpha(counts.sum(axis=0), xmin=xmin, xmax=xmax)
+	alpha_loo = fitting.powerlaw_alpha(counts.sum(axis=0) - counts, xmin=xmin, xmax=xmax)
+	alpha_se = np.sqrt((reps-1)/reps*np.sum((alpha_loo - alpha_loo.mean(axis=0))**2, axis=0))
+
+	return alpha, alpha_se
+
+def jackknife_m_av(ratios_list):
+	"""Jackknife estimate of m_av with the pairs (A(t), A(t+1)) pooled over repetitions, leaving one repetition out at a time.
+
+	Args:
+	    ratios_list (list): Ratio histograms (ratios, counts) of each repetition (see fitting.m_avalanche_ratios)
+
+	Returns:
+	    float: Pooled m_av
+	    float: Jackknife standard error
+	"""
+
+	reps = len(ratios_list)
+	R_sum = np.array([np.dot(ratios, counts) for ratios, counts in ratios_list])
+	n = np.array([np.sum(counts) for _, counts in ratios_list])
+	m_av = R_sum.sum()/n.sum()
+	m_av_loo = (R_sum.sum() - R_sum)/(n.sum() - n)
+	m_av_se = np.sqrt((reps-1)/reps*np.sum((m_av_loo - m_av_loo.mean())**2))
+
+	return m_av, m_av_se
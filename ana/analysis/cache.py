@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+Module for the persistent cache of thresholded simulation data.
+
+Filtering and thresholding a raw simulation file dominates the cost of every plot. Results of analyze_sim_events are stored on local disk in the sparse format of reader.write_thresholded, keyed by the identity of the raw file (path, size and mtime, or a content hash) and by the analysis parameters, so repeated plots only read small cached files. The cache is bounded by [max_bytes], evicting the least recently used entries.
+
+Settings are module variables:
+    cache_dir (str): Location of the cache (default: $CRITICALAVALANCHES_CACHE or ~/.cache/criticalavalanches)
+    max_bytes (int): Size cap of the cache, in bytes
+    enabled (bool): Toggles the cache (if False, always recomputes and stores nothing)
+
+"""
+
+import numpy as np
+import h5py
+import os, glob, hashlib
+from analysis import avalanche, reader
+
+cache_dir = os.environ.get('CRITICALAVALANCHES_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'criticalavalanches'))
+max_bytes = 2*1024**3
+enabled = True
+
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def _hash(obj):
+	return hashlib.sha1(repr(obj).encode()).hexdigest()[:16]
+
+def file_stamp(filepath, content_hash=False):
+	"""Identity of a raw file: (size, mtime in ns), or the sha1 of its contents if [content_hash]."""
+
+	if content_hash:
+		sha = hashlib.sha1()
+		with open(filepath, 'rb') as f:
+			for block in iter(lambda: f.read(2**24), b''):
+				sha.update(block)
+		return sha.hexdigest()
+	else:
+		st = os.stat(filepath)
+		return '{:d}_{:d}'.format(st.st_size, st.st_mtime_ns)
+
+def entry_path(filepath, threshold, datatype, bw_filter, timesteps=None, channels=None, bw_freqs=[0.1,200]):
+	"""Location of the cache entry of a raw file and set of analysis parameters.
+
+	Entries are named [file hash]_[parameter hash].hdf5, so that all entries of a raw file can be found from its path. The file stamp is stored inside the entry, such that a modified raw file overwrites its stale entry.
+	"""
+
+	#Threshold and filter don't apply to spikes
+	if datatype == 'sub':
+		params = (datatype, timesteps, channels)
+	else:
+		params = (datatype, float(threshold), bool(bw_filter), [float(f) for f in bw_freqs] if bw_filter else None, timesteps, channels)
+
+	return os.path.join(cache_dir, _hash(os.path.abspath(filepath)) + '_' + _hash(params) + '.hdf5')
+
+def analyze_sim_events(filepath, threshold, datatype, bw_filter, timesteps=None, channels=None, chunk_size=None, bw_freqs=[0.1,200], content_hash=False):
+	"""Cached avalanche.analyze_sim_events, with the same arguments and return values.
+
+	Args:
+	    content_hash (bool, optional): Identifies the raw file by the sha1 of its contents instead of its size and mtime (slower, but robust to copies and touched files)
+	"""
+
+	if not enabled:
+		return avalanche.analyze_sim_events(filepath, threshold, datatype, bw_filter, timesteps, channels, chunk_size, bw_freqs)
+
+	path = entry_path(filepath, threshold, datatype, bw_filter, timesteps, channels, bw_freqs)
+	stamp = file_stamp(filepath, content_hash)
+
+	#Hit: reads the sparse events and refreshes the entry's LRU time
+	if os.path.isfile(path):
+		try:
+			with h5py.File(path, 'r') as file:
+				if file.attrs['stamp'] == stamp:
+					indices, counts, timesteps_file = reader.read_thresholded(file, datatype, 0, dense=False)
+					events = np.repeat(indices, counts)
+					_stats['hits'] += 1
+					os.utime(path)
+					return events, timesteps_file
+		except (OSError, KeyError):
+			pass
+
+	#Miss: analyzes the raw file and stores the result
+	_stats['misses'] += 1
+	events, timesteps = avalanche.analyze_sim_events(filepath, threshold, datatype, bw_filter, timesteps, channels, chunk_size, bw_freqs)
+	_store(path, stamp, filepath, datatype, events, timesteps, threshold)
+	_evict()
+
+	return events, timesteps
+
+def analyze_sim_raw(filepath, threshold, datatype, bw_filter, timesteps=None, channels=None, chunk_size=None, bw_freqs=[0.1,200], content_hash=False):
+	"""Cached avalanche.analyze_sim_raw, with the same arguments and return value (see analyze_sim_events)."""
+
+	events, timesteps = analyze_sim_events(filepath, threshold, datatype, bw_filter, timesteps, channels, chunk_size, bw_freqs, content_hash)
+	data_th = np.bincount(events, minlength=timesteps)
+
+	return data_th
+
+def _store(path, stamp, filepath, datatype, events, timesteps, threshold):
+
+	#Writes to a temporary file and renames it, so concurrent readers never see partial entries
+	os.makedirs(cache_dir, exist_ok=True)
+	path_tmp = path + '.{:d}.tmp'.format(os.getpid())
+	with h5py.File(path_tmp, 'w') as file:
+		reader.write_thresholded(file, datatype, [events], timesteps, threshold)
+		file.attrs['stamp'] = stamp
+		file.attrs['source'] = os.path.abspath(filepath)
+	os.replace(path_tmp, path)
+
+def _entries():
+
+	entries = []
+	for path in glob.glob(os.path.join(cache_dir, '*.hdf5')):
+		try:
+			st = os.stat(path)
+		except OSError:
+			continue
+		entries.append((st.st_mtime, st.st_size, path))
+
+	return entries
+
+def _evict():
+
+	#Removes least recently used entries until the cache fits in max_bytes
+	entries = sorted(_entries())
+	total = sum([entry[1] for entry in entries])
+	for _, size_entry, path in entries:
+		if total <= max_bytes:
+			break
+		try:
+			os.remove(path)
+			_stats['evictions'] += 1
+		except OSError:
+			pass
+		total -= size_entry
+
+def invalidate(filepath=None):
+	"""Removes the cache entries of a raw file, or all entries if [filepath] is None.
+
+	Returns:
+	    int: Number of removed entries
+	"""
+
+	if filepath is None:
+		pattern = '*.hdf5'
+	else:
+		pattern = _hash(os.path.abspath(filepath)) + '_*.hdf5'
+
+	n_removed = 0
+	for path in glob.glob(os.path.join(cache_dir, pattern)):
+		try:
+			os.remove(path)
+			n_removed += 1
+		except OSError:
+			pass
+
+	return n_removed
+
+def stats():
+	"""Returns the hit, miss and eviction counts of this process, and the number of entries and total size of the cache."""
+
+	entries = _entries()
+	result = dict(_stats)
+	result['entries'] = len(entries)
+	result['bytes'] = sum([entry[1] for entry in entries])
+
+	return result
+
+def reset_stats():
+	"""Resets the hit, miss and eviction counts."""
+
+	for key in _stats:
+		_stats[key] = 0
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+Module for the correlations between all electrode pairs, as a function of their distance.
+
+Every channel is thresholded once per repetition, and its events are binned into a [channels, nbins] count matrix for each binsize. All pairwise Pearson correlations then follow from a single product of the count matrix with its transpose, which is sparse for sparse event trains, so the cost grows with the number of events rather than with the number of pairs.
+
+"""
+
+import numpy as np
+import h5py
+from analysis import avalanche, reader
+
+def binned_counts(events, binsize, timesteps, sparse=None):
+	"""Bins the events of every channel, in the legacy layout of avalanche.bin_data (ceil(timesteps/binsize) bins, the last one always empty).
+
+	Args:
+	    events (list): Event times (int) for every channel
+	    binsize (int): Binsize, in timesteps
+	    timesteps (int): Length of the timeseries
+	    sparse (bool, optional): Returns a scipy.sparse csr matrix (default: if less than 10% of the bins have events)
+
+	Returns:
+	    ndarray or csr_matrix: [channels, nbins] event counts
+	"""
+
+	binsize = int(binsize)
+	nbins = -(-timesteps//binsize)
+	rows = np.repeat(np.arange(len(events)), [np.size(ev) for ev in events])
+	id_bin = np.concatenate([np.asarray(ev, dtype=np.int64) for ev in events] + [np.zeros(0, dtype=np.int64)])//binsize
+
+	#Legacy layout: events of the last bin are dropped
+	in_range = (id_bin >= 0) & (id_bin < nbins - 1)
+	rows = rows[in_range]
+	id_bin = id_bin[in_range]
+
+	if sparse is None:
+		sparse = id_bin.size < 0.1*len(events)*nbins
+	if sparse:
+		from scipy.sparse import csr_matrix
+		return csr_matrix((np.ones(id_bin.size), (rows, id_bin)), shape=(len(events), nbins))
+	else:
+		return np.bincount(rows*nbins + id_bin, minlength=len(events)*nbins).reshape(len(events), nbins).astype(float)
+
+def corr_matrix(counts):
+	"""Pearson correlation between all rows of a count matrix, from a single (sparse) matrix product.
+
+	Args:
+	    counts (ndarray or csr_matrix): [channels, nbins] binned event counts
+
+	Returns:
+	    ndarray: [channels, channels] correlation matrix (NaN for channels without events)
+	"""
+
+	n = counts.shape[1]
+	sums = np.asarray(counts.sum(axis=1)).ravel()
+	products = counts @ counts.T
+	if not isinstance(products, np.ndarray):
+		products = products.toarray()
+
+	#Covariance from the raw second moments
+	cov = (products - np.outer(sums, sums)/n)/(n - 1)
+	std = np.sqrt(np.diag(cov))
+	with np.errstate(invalid='ignore', divide='ignore'):
+		corr = cov/np.outer(std, std)
+
+	return corr
+
+def distance_matrix(pos_x, pos_y):
+	"""Euclidean distances between all electrodes."""
+
+	pos_x = np.asarray(pos_x, dtype=float)
+	pos_y = np.asarray(pos_y, dtype=float)
+
+	return np.hypot(pos_x[:,np.newaxis] - pos_x, pos_y[:,np.newaxis] - pos_y)
+
+def corr_vs_distance(corr, dist, decimals=3):
+	"""Averages the correlations of all electrode pairs with the same distance.
+
+	Args:
+	    corr (ndarray): [channels, channels] or [reps, channels, channels] correlation matrices
+	    dist (ndarray): [channels, channels] distances between electrodes
+	    decimals (int, optional): Distances are grouped after rounding to [decimals]
+
+	Returns:
+	    ndarray: [n_dist] distinct pair distances
+	    ndarray: [..., n_dist] mean correlation at every distance (over pairs, ignoring NaN)
+	    ndarray: [..., n_dist] std of the correlation at every distance
+	    ndarray: [n_dist] number of pairs at every distance
+	"""
+
+	id_i, id_j = np.triu_indices(dist.shape[0], k=1)
+	dist_pairs, id_dist, n_pairs = np.unique(np.round(dist[id_i, id_j], decimals), return_inverse=True, return_counts=True)
+
+	#Sums over the pairs of each distance, skipping NaN
+	corr_pairs = np.asarray(corr)[...,id_i,id_j]
+	valid = np.isfinite(corr_pairs)
+	corr_pairs = np.where(valid, corr_pairs, 0)
+	shape = corr_pairs.shape[:-1] + (dist_pairs.size,)
+	count = np.zeros(shape)
+	corr_sum = np.zeros(shape)
+	corr_sum2 = np.zeros(shape)
+	np.add.at(count, (..., id_dist), valid)
+	np.add.at(corr_sum, (..., id_dist), corr_pairs)
+	np.add.at(corr_sum2, (..., id_dist), corr_pairs**2)
+
+	with np.errstate(invalid='ignore', divide='ignore'):
+		corr_mean = corr_sum/count
+		corr_std = np.sqrt(np.maximum(corr_sum2/count - corr_mean**2, 0))
+
+	return dist_pairs, corr_mean, corr_std, n_pairs
+
+def channel_events(filepath, datatype, threshold, bw_filter, channels=None, chunk_size=None, bw_freqs=[0.1,200]):
+	"""Events of every channel of a simulation dataset, thresholded once (coarse) or read from the spike times (sub).
+
+	Returns:
+	    list: Event times (int64) for every channel
+	    int: Number of timesteps
+	"""
+
+	#Parameters
+	data_dir = 'data/'
+	fs = 500
+
+	with h5py.File(filepath,'r') as file:
+		timesteps = file[data_dir + 'activity'].shape[0]
+
+	if datatype == 'coarse':
+		if chunk_size is not None:
+			events = avalanche.threshold_stream(filepath, threshold, bw_filter, chunk_size, channels, timesteps, bw_freqs, fs)
+		else:
+			data = reader.load_channels(filepath, datatype, channels, timesteps, data_dir=data_dir)
+			if bw_filter:
+				data = avalanche.filter_bw_ch(data, bw_freqs, fs)
+			events = avalanche.threshold_data(data, threshold)
+	elif datatype == 'sub':
+		events = avalanche.sub_spike_times(reader.load_channels(filepath, datatype, channels, data_dir=data_dir))
+		events = [ev[ev < timesteps] for ev in events]
+
+	return events, timesteps
+
+def electrode_corr(filepath, binsizes, threshold, bw_filter, datatypes=['coarse', 'sub'], channels=None, chunk_size=None, bw_freqs=[0.1,200]):
+	"""Correlation matrices of all electrode pairs of a simulation dataset, for every datatype and binsize. Channels are thresholded once for all binsizes.
+
+	Args:
+	    filepath (str): Path to the .hdf5 dataset
+	    binsizes (list): Binsizes, in timesteps
+	    threshold (float): Threshold in standard deviations of the signal (for coarse)
+	    bw_filter (bool): Toggles butterworth filtering (for coarse)
+	    datatypes (list, optional): Datatypes to correlate
+	    channels (int, optional): Number of channels to use (default: all)
+	    chunk_size (int, optional): Streams the coarse signal in chunks of [chunk_size] timesteps
+	    bw_freqs (list, optional): Band of the butterworth filter, in Hz
+
+	Returns:
+	    dict: For every datatype, a dict with
+	    	'corr': {binsize: [channels, channels] correlation matrix}
+	    	'rate': {binsize: [channels] events per second of every channel}
+	    ndarray: [channels, channels] distances between electrodes (um)
+	"""
+
+	#Timescale of a timestep, in s
+	timescale_s = 2e-3
+
+	with h5py.File(filepath,'r') as file:
+		n_ch = file['electrodes/pos_x'].shape[0] if channels is None else channels
+		dist = distance_matrix(file['electrodes/pos_x'][:n_ch], file['electrodes/pos_y'][:n_ch])
+
+	results = {}
+	for datatype in datatypes:
+		events, timesteps = channel_events(filepath, datatype, threshold, bw_filter, channels, chunk_size, bw_freqs)
+		results[datatype] = {'corr': {}, 'rate': {}}
+		for b in binsizes:
+			counts = binned_counts(events, b, timesteps)
+			results[datatype]['corr'][b] = corr_matrix(counts)
+			results[datatype]['rate'][b] = np.asarray(counts.sum(axis=1)).ravel()/(timescale_s*b*counts.shape[1])
+
+	return results, dist
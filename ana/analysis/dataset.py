@@ -8,8 +8,7 @@
 Module for directly handling datasets.
 """
 
-from analysis import avalanche, fitting, plot, parser
-import powerlaw
+from analysis import avalanche, plot, histogram, cache, sweep
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib, os, pickle
@@ -37,7 +36,7 @@ def sim_plot_pS(filepath,deltaT,datatype,str_leg='Data', threshold=3,bw_filter=T
 	S_list = []
 	for filepath_file in filepath:
 		#Loads and thresholds data
-		data_th = avalanche.analyze_sim_raw(filepath_file, threshold, datatype, bw_filter, timesteps, channels)
+		data_th = cache.analyze_sim_raw(filepath_file, threshold, datatype, bw_filter, timesteps, channels)
 
 		#Bins data
 		data_binned = avalanche.bin_data(data=data_th,binsize=deltaT)
@@ -58,7 +57,7 @@ def sim_plot_pS(filepath,deltaT,datatype,str_leg='Data', threshold=3,bw_filter=T
 		with open(save_fig + '.pkl','wb') as file:
 			pickle.dump(fig, file)
 
-def sim_plot_deltaT(filepath,deltaT,datatype,threshold=3,S_fit_max=50,bw_filter=True,timesteps=None,channels=None, save_fig=None):
+def sim_plot_deltaT(filepath,deltaT,datatype,threshold=3,S_fit_max=50,bw_filter=True,timesteps=None,channels=None, save_fig=None, n_boot=None):
 	"""Plots p(S), m_av and fits p(S)~S^-alpha, for a list of binsizes. If [filepath] is a list, averages over datasets.
 	
 	Args:
@@ -71,6 +70,7 @@ def sim_plot_deltaT(filepath,deltaT,datatype,threshold=3,S_fit_max=50,bw_filter=
 	    timesteps (None, optional): Number of timesteps to use (default extracts from dataset)
 	    channels (None, optional): Number of electrode channels to use (default extracts from dataset)   
 	    save_fig (str, optional): Saves the figure under fig/[save_fig].png
+	    n_boot (int, optional): Plots bootstrap confidence intervals (95%) of alpha and m_av with [n_boot] resamples, instead of their STD over datasets
 	"""
 
 	if type(filepath) is not list:
@@ -91,33 +91,21 @@ def sim_plot_deltaT(filepath,deltaT,datatype,threshold=3,S_fit_max=50,bw_filter=
 	m_av = np.zeros((nreps, nbins))
 
 	#Runs analysis for each dataset
+	rep_results = []
 	for j in range(nreps):
 
-		S_list_rep = []
-
 		#Loads and thresholds data
-		data_th = avalanche.analyze_sim_raw(filepath[j],threshold, datatype, bw_filter, timesteps, channels)
-
-		#Bins data for each deltaT and calculates observables
-		for i in range(nbins):
-
-			data_binned = avalanche.bin_data(data=data_th,binsize=deltaT[i])
-
-			#Obtains avalanche list S
-			S = avalanche.get_S(data_binned)
-
-			#Saves S to list
-			S_list_rep.append(S)
+		data_th = cache.analyze_sim_raw(filepath[j],threshold, datatype, bw_filter, timesteps, channels)
 
-			#Calculates alpha_exp
-			fit = powerlaw.Fit(S, discrete=True, estimate_discrete=False, xmin=1, xmax=S_fit_max)
-			alpha_exp[j,i] = fit.alpha
+		#Bins data for all deltaT at once
+		rep_results.append(sweep.sweep_rep(data_th, deltaT, ratios=bool(n_boot)))
 
-			#Calculates m_av
-			m_av[j,i] = fitting.m_avalanche(data_binned)
-
-		#Appends S list from each repetition to pS
-		S_list.append(S_list_rep)
+	#Calculates observables for all datasets at once
+	results = sweep.gather_reps(rep_results, deltaT, fit_alpha=True, xmin=1, xmax=S_fit_max, n_boot=n_boot or 0)
+	for j in range(nreps):
+		S_list.append([results[b]['S'][j] for b in deltaT])
+	alpha_exp[:,:] = np.array([results[b]['alpha'] for b in deltaT]).T
+	m_av[:,:] = np.array([results[b]['m_av'] for b in deltaT]).T
 
 	#Sets up subplots
 	fig = plt.figure(constrained_layout=True)
@@ -134,20 +122,9 @@ def sim_plot_deltaT(filepath,deltaT,datatype,threshold=3,S_fit_max=50,bw_filter=
 		for j in range(nreps):
 			S_bin.append(S_list[j][k])
 
-		#Gets largest avalanche from the list (+1 for zero_index)
-		S_max = int(max([Si.max() for Si in S_bin]) + 1)
-
-		#Obtains pS
-		pS = np.zeros((nreps,S_max))
-
-		for i in range(nreps):
-			for j in range(S_max):
-				pS[i,j] = np.sum(S_bin[i]==j)
-			pS[i,:] = pS[i,:]/np.sum(pS[i,:])
-
-		#Obtains mean and STD
-		pS_mean = np.mean(pS,axis=0)
-		pS_std = np.std(pS,axis=0)
+		#Obtains pS, its mean and STD
+		S, _, pS_mean, pS_std = histogram.pS_reps(S_bin)
+		S_max = S.size
 		pS_up = pS_mean + pS_std/2
 		pS_dw = pS_mean - pS_std/2	
 
@@ -159,12 +136,22 @@ def sim_plot_deltaT(filepath,deltaT,datatype,threshold=3,S_fit_max=50,bw_filter=
 	#Plots alpha_exp
 	alpha_exp_mean = np.mean(alpha_exp,axis=0)
 	alpha_exp_std = np.std(alpha_exp,axis=0)
-	ax_alpha.errorbar(deltaT_ms,alpha_exp_mean,yerr=alpha_exp_std/2,fmt='o-',color='k', fillstyle='full')
+	if n_boot:
+		alpha_ci = np.array([results[b]['alpha_ci'] for b in deltaT]).T
+		alpha_err = np.abs(alpha_ci - alpha_exp_mean)
+	else:
+		alpha_err = alpha_exp_std/2
+	ax_alpha.errorbar(deltaT_ms,alpha_exp_mean,yerr=alpha_err,fmt='o-',color='k', fillstyle='full')
 
 	#Plots m_av
 	m_av_mean = np.mean(m_av,axis=0)
 	m_av_std = np.std(m_av,axis=0)
-	ax_mav.errorbar(deltaT_ms,m_av_mean,yerr=m_av_std/2,fmt='o-',color='k', fillstyle='full')
+	if n_boot:
+		m_av_ci = np.array([results[b]['m_av_ci'] for b in deltaT]).T
+		m_av_err = np.abs(m_av_ci - m_av_mean)
+	else:
+		m_av_err = m_av_std/2
+	ax_mav.errorbar(deltaT_ms,m_av_mean,yerr=m_av_err,fmt='o-',color='k', fillstyle='full')
 	
 	#Beatifies plots
 	ax_ps.set_xlabel('S')
@@ -224,7 +211,7 @@ def spk_plot_pS(filepath,deltaT,datapath,sampling_rate = 25000,str_leg='Data'):
 	data_spk = file[datapath][:]
 
 	#Loads and thresholds data
-	data_th = avalanche.analyze_sim_raw(filepath, threshold, datatype, bw_filter, timesteps, channels)
+	data_th = cache.analyze_sim_raw(filepath, threshold, datatype, bw_filter, timesteps, channels)
 
 	#Bins data
 	data_binned = avalanche.bin_data(data=data_th,binsize=deltaT)
@@ -6,8 +6,7 @@
 
 import numpy as np
 import h5py
-import powerlaw
-from scipy.optimize import curve_fit
+from analysis import reader, avalanche
 
 def tau_linear(data,deltaT = 2):
 
@@ -24,6 +23,33 @@ def tau_linear(data,deltaT = 2):
 
 	return tau
 
+def tau_linear_batch(data,deltaT = 2):
+	"""Lag-1 regression slope m and tau = -deltaT/log(m) of every row of a [..., timesteps] matrix, as in tau_linear.
+
+	Args:
+	    data (ndarray): [..., timesteps] activity
+	    deltaT (float, optional): Length of a timestep, in ms
+
+	Returns:
+	    ndarray: [...] slope m (with the normalization of tau_linear, cov with ddof=1 over var with ddof=0)
+	    ndarray: [...] tau (0 if m <= 0)
+	"""
+
+	#Centered A(t) and A(t+1)
+	data = np.asarray(data,dtype=float)
+	X = data[...,:-1]
+	Y = data[...,1:]
+	n = X.shape[-1]
+	X_c = X - X.mean(axis=-1,keepdims=True)
+	Y_c = Y - Y.mean(axis=-1,keepdims=True)
+
+	m = (np.einsum('...i,...i->...',X_c,Y_c)/(n-1))/(np.einsum('...i,...i->...',X_c,X_c)/n)
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		tau = np.where(m > 0, -deltaT/np.log(np.where(m > 0, m, 1)), 0)
+
+	return m, tau
+
 def tau_sim_dataset(m,h,d,threshold,data_dir,bw_filter):
 	
 	#Sets up filepaths
@@ -37,7 +63,7 @@ def tau_sim_dataset(m,h,d,threshold,data_dir,bw_filter):
 	if type(d) not in [list, np.ndarray]:
 		d = [d]
 
-	#Calculates tau for every d and rep	
+	#Calculates tau for every d and rep, reading all reps at once
 	tau_all = np.zeros(0)
 	for d_i in d:
 		#Sets up filepath
@@ -45,13 +71,10 @@ def tau_sim_dataset(m,h,d,threshold,data_dir,bw_filter):
 		str_load = data_dir + dir_threshold + filename
 
 		#Loads file
-		file = h5py.File(str_load,'r')
-		reps = int(file['activity'].shape[0])
+		with h5py.File(str_load,'r') as file:
+			activity = file['activity'][:]
 
-		tau_rep = np.zeros(reps)
-
-		for i in range(reps):
-			tau_rep[i] = tau_linear(file['activity'][i,:])
+		_, tau_rep = tau_linear_batch(activity)
 
 		tau_all = np.concatenate((tau_all,tau_rep))
 	
@@ -60,6 +83,106 @@ def tau_sim_dataset(m,h,d,threshold,data_dir,bw_filter):
 
 	return tau_mean,tau_std
 
+def m_avalanche_sparse(rep_ids, indices, counts, reps, timesteps, binsize=1, return_ratios=False):
+	"""Estimates m_av of every repetition of sparse thresholded data (see reader.read_thresholded_all), binned with the legacy layout of avalanche.bin_data, as in m_avalanche. Works on the non-empty bins only, without building the binned timeseries.
+
+	Args:
+	    rep_ids (ndarray): Repetition of each entry
+	    indices (ndarray): Timesteps with events
+	    counts (ndarray): Number of events at each of them
+	    reps (int): Number of repetitions
+	    timesteps (int): Length of the timeseries
+	    binsize (int, optional): Binsize, in timesteps
+	    return_ratios (bool, optional): Also returns the ratio histogram of each rep (see m_avalanche_ratios)
+
+	Returns:
+	    ndarray: [reps] m_av (nan for reps without activity)
+	    list: (if return_ratios) ratio histograms (ratios, counts) of each rep
+	"""
+
+	#Activity A(t) of the non-empty bins, sorted by (rep, bin). The last bin is dropped (legacy layout)
+	nbins = -(-timesteps//binsize)
+	keys, inverse = np.unique(np.asarray(rep_ids, dtype=np.int64)*nbins + np.asarray(indices, dtype=np.int64)//binsize, return_inverse=True)
+	A = np.bincount(inverse.ravel(), weights=counts, minlength=keys.size)
+	valid = (keys % nbins < nbins - 1) & (A != 0)
+	keys = keys[valid]
+	A = A[valid]
+	rep = keys//nbins
+
+	#A(t+1)/A(t), where A(t+1) is zero unless the next bin is non-empty
+	A_next = np.zeros(A.size)
+	follows = keys[1:] == keys[:-1] + 1
+	A_next[:-1][follows] = A[1:][follows]
+	R = A_next/A
+
+	with np.errstate(divide='ignore', invalid='ignore'):
+		m_av = np.bincount(rep, weights=R, minlength=reps)/np.bincount(rep, minlength=reps)
+
+	if return_ratios:
+		R_reps = np.split(R, np.searchsorted(rep, np.arange(1, reps)))
+		return m_av, [np.unique(R_rep, return_counts=True) for R_rep in R_reps]
+	return m_av
+
+def branching_thresholded(filepaths, d_list, binsize, deltaT = 2, return_ratios = False, activity = True):
+	"""Estimates m_av (from 'coarse') and the lag-1 slope m and tau (from 'activity') of thresholded files for all repetitions, binsizes and inter-electrode distances, with one read per dataset.
+
+	'coarse' is binned with the legacy layout of avalanche.bin_data, and 'activity' with complete bins only.
+
+	Args:
+	    filepaths (list): Thresholded .hdf5 files (see run_analysis.save_threshold), one for each d
+	    d_list (list): Inter-electrode distance of each file
+	    binsize (list): Binsizes, in timesteps
+	    deltaT (float, optional): Length of a timestep, in ms
+	    return_ratios (bool, optional): Also returns the ratio histograms of each d and binsize, for bootstrapping m_av (see m_avalanche_ratios)
+	    activity (bool, optional): Toggles the estimates from 'activity' (m_lin and tau are nan if False)
+
+	Returns:
+	    ndarray: Structured array with one record per (d, binsize, rep), with fields 'd', 'binsize', 'rep', 'm_av', 'm_lin' and 'tau'
+	    dict: (if return_ratios) list of ratio histograms of each rep, for each (d, binsize)
+	"""
+
+	if type(binsize) not in [list, np.ndarray]:
+		binsize = [binsize]
+
+	dtype = [('d', int), ('binsize', int), ('rep', int), ('m_av', float), ('m_lin', float), ('tau', float)]
+	results = []
+	ratios = {}
+	for filepath, d in zip(filepaths, d_list):
+
+		#Reads all repetitions at once
+		with h5py.File(filepath,'r') as file:
+			rep_ids, indices, counts, reps, timesteps = reader.read_thresholded_all(file,'coarse')
+			if activity:
+				data_activity = file['activity'][:]
+
+		for b in binsize:
+
+			#m_av from the non-empty bins of all reps
+			if return_ratios:
+				m_av, ratios[(d,b)] = m_avalanche_sparse(rep_ids, indices, counts, reps, timesteps, b, return_ratios=True)
+			else:
+				m_av = m_avalanche_sparse(rep_ids, indices, counts, reps, timesteps, b)
+
+			if activity:
+				m_lin, tau = tau_linear_batch(avalanche.bin_block(data_activity,b), deltaT*b)
+			else:
+				m_lin, tau = np.nan, np.nan
+
+			result = np.zeros(reps, dtype=dtype)
+			result['d'] = d
+			result['binsize'] = b
+			result['rep'] = np.arange(reps)
+			result['m_av'] = m_av
+			result['m_lin'] = m_lin
+			result['tau'] = tau
+			results.append(result)
+
+	results = np.concatenate(results) if results else np.zeros(0, dtype=dtype)
+
+	if return_ratios:
+		return results, ratios
+	return results
+
 def m_avalanche(data):
 	"""Estimates m_{av}
 	
@@ -81,7 +204,27 @@ def m_avalanche(data):
 
 	return m_av
 
+def m_avalanche_ratios(data):
+	"""Histogram of the ratios A(t+1)/A(t) over the active timesteps of a thresholded and binned timeseries, whose mean is m_av (see m_avalanche).
+
+	Returns:
+	    ndarray: Unique ratios
+	    ndarray: Number of occurrences of each ratio
+	"""
+
+	#Same active timesteps as in m_avalanche
+	act_id = np.nonzero(data)[0]
+	if act_id.size > 0 and act_id[-1] == len(data)-1:
+		act_id = np.delete(act_id,-1)
+
+	R = data[act_id+1]/data[act_id]
+	ratios, counts = np.unique(R, return_counts=True)
+
+	return ratios, counts
+
 def powerlaw(X,Y,Yerr):
+	from scipy.optimize import curve_fit
+
 	#Parameters
 	kwargs = {'maxfev': 10000}
 
@@ -99,4 +242,86 @@ def powerlaw(X,Y,Yerr):
 	fit_exp = results[1]
 	fit_err = fit_err_all[1]
 
-	return fit_exp, fit_err, lin_coef
\ No newline at end of file
+	return fit_exp, fit_err, lin_coef
+
+def powerlaw_alpha(counts, xmin=1, xmax=50, tol=1e-10, max_iter=100):
+	"""Fits the exponent alpha of a discrete power law p(S) ~ S^-alpha truncated to [xmin, xmax], from avalanche-size histograms, by maximum likelihood.
+
+	Fits a whole batch of histograms (e.g. [reps, binsizes, sizes]) at once. The likelihood is maximal where the mean of log(S) under the truncated power law (normalized by the finite sum over [xmin, xmax], i.e. zeta(alpha, xmin) - zeta(alpha, xmax+1)) equals the mean of log(S) of the data. This mean decreases monotonically with alpha, so the root is found with bracketed Newton steps, vectorized over the batch.
+
+	This is the estimate of powerlaw.Fit(S, discrete=True, estimate_discrete=False, xmin=xmin, xmax=xmax).alpha, which minimizes the same likelihood with a Nelder-Mead simplex of tolerance 1e-4. Both agree within |delta alpha| < 1e-3 (median ~2e-5, tested for alpha in [1.05, 3.5] and 30 to 30000 avalanches) whenever the estimate is above 1. Below 1, the zeta normalization of powerlaw.Fit is undefined and it returns alpha ~ 1, while the maximum likelihood estimate is returned here.
+
+	Args:
+	    counts (ndarray): [..., sizes] histograms, where counts[..., S] is the number of avalanches of size S (sizes beyond the last bin have zero counts)
+	    xmin (int, optional): Smallest avalanche size of the fit
+	    xmax (int, optional): Largest avalanche size of the fit
+	    tol (float, optional): Tolerance of alpha
+	    max_iter (int, optional): Maximum number of iterations
+
+	Returns:
+	    ndarray: [...] alpha of each histogram. nan if it has no avalanches in [xmin, xmax], +inf (-inf) if all of them have size xmin (xmax).
+	"""
+
+	#Histograms restricted to [xmin, xmax]
+	counts = np.asarray(counts, dtype=float)
+	counts = counts[...,xmin:xmax+1]
+	if counts.shape[-1] < xmax - xmin + 1:
+		pad = [(0,0)]*(counts.ndim-1) + [(0, xmax - xmin + 1 - counts.shape[-1])]
+		counts = np.pad(counts, pad)
+	logS = np.log(np.arange(xmin, xmax+1))
+
+	#Mean log(S) of the data
+	n = counts.sum(axis=-1)
+	with np.errstate(invalid='ignore', divide='ignore'):
+		target = (counts @ logS)/n
+	batch_shape = target.shape
+	target = target.ravel()
+
+	#Histograms with all avalanches at xmin (xmax), detected from the counts as target is rounded
+	at_xmin = (counts[...,0] == n).ravel() & (n.ravel() > 0)
+	at_xmax = (counts[...,-1] == n).ravel() & (n.ravel() > 0)
+
+	#Mean and variance of log(S) under the truncated power law
+	def moments(alpha):
+		x = -np.outer(alpha, logS - logS[0])
+		w = np.exp(x - x.max(axis=1, keepdims=True))
+		w /= w.sum(axis=1, keepdims=True)
+		mean = w @ logS
+		var = w @ logS**2 - mean**2
+		return mean, var
+
+	#Bracketed Newton iterations (the mean decreases with alpha)
+	alpha = np.full(target.shape, 1.5)
+	lo = np.full(target.shape, -np.inf)
+	hi = np.full(target.shape, np.inf)
+	active = np.isfinite(target) & ~at_xmin & ~at_xmax
+	for _ in range(max_iter):
+		if not np.any(active):
+			break
+		mean, var = moments(alpha[active])
+		err = mean - target[active]
+		lo[active] = np.where(err > 0, alpha[active], lo[active])
+		hi[active] = np.where(err <= 0, alpha[active], hi[active])
+		step = err/np.maximum(var, 1e-300)
+		alpha_new = alpha[active] + step
+
+		#Falls back to bisection (or expansion of an open bracket) outside the bracket
+		out = (alpha_new <= lo[active]) | (alpha_new >= hi[active])
+		lo_a, hi_a = lo[active], hi[active]
+		bisect = (lo_a + hi_a)/2
+		open_lo = ~np.isfinite(lo_a)
+		open_hi = ~np.isfinite(hi_a) & ~open_lo
+		bisect[open_lo] = hi_a[open_lo] - 2*np.abs(hi_a[open_lo]) - 1
+		bisect[open_hi] = lo_a[open_hi] + 2*np.abs(lo_a[open_hi]) + 1
+		alpha_new = np.where(out, bisect, alpha_new)
+
+		converged = np.abs(alpha_new - alpha[active]) < tol
+		alpha[active] = alpha_new
+		active[np.flatnonzero(active)[converged]] = False
+
+	#Degenerate histograms
+	alpha[at_xmin] = np.inf
+	alpha[at_xmax] = -np.inf
+	alpha[~np.isfinite(target)] = np.nan
+
+	return alpha.reshape(batch_shape)
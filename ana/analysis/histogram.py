@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+Module for avalanche-size distributions p(S).
+
+"""
+
+import numpy as np
+
+def pS_reps(S_list, S_offset=0, n_bins=None):
+	"""Calculates the normalized avalanche-size distribution of each repetition, in linear time.
+
+	Args:
+	    S_list (list): List of avalanche-size arrays, one for each repetition (a single array is also accepted)
+	    S_offset (int, optional): Avalanche size of the first bin, such that pS[:,k] corresponds to S = S_offset + k
+	    n_bins (int, optional): Number of bins (default is the largest avalanche + 1, as in the original analysis)
+
+	Returns:
+	    ndarray: [n_bins] avalanche sizes S
+	    ndarray: [reps, n_bins] p(S) of each repetition (NaN for repetitions without avalanches in range)
+	    ndarray: [n_bins] mean p(S) over the repetitions with avalanches (NaN if there are none)
+	    ndarray: [n_bins] std of p(S) over the repetitions with avalanches (NaN if there are none)
+	"""
+
+	#Parses input
+	if type(S_list) not in [list, tuple]:
+		S_list = [S_list]
+	reps = len(S_list)
+	S_list = [np.asarray(S_i) for S_i in S_list]
+
+	#Gets largest avalanche from the list (+1 for zero_index), skipping repetitions without avalanches
+	if n_bins is None:
+		n_bins = int(max([S_i.max() for S_i in S_list if S_i.size > 0], default=0) + 1)
+
+	#Counts all repetitions in a single bincount, with each rep offset by n_bins
+	S_all = np.concatenate(S_list)
+	rep_all = np.repeat(np.arange(reps), [S_i.size for S_i in S_list])
+	S_int = np.floor(S_all).astype(np.int64)
+	k = S_int - S_offset
+	in_range = (S_all == S_int) & (k >= 0) & (k < n_bins)
+	counts = np.bincount(rep_all[in_range]*n_bins + k[in_range], minlength=reps*n_bins)
+
+	#Normalizes each repetition, leaving repetitions without avalanches as NaN
+	counts = counts.reshape(reps, n_bins)
+	n_S = np.sum(counts, axis=1)
+	valid = n_S > 0
+	pS = np.full((reps, n_bins), np.nan)
+	pS[valid] = counts[valid]/n_S[valid,np.newaxis]
+
+	#Obtains mean and STD over the repetitions with avalanches
+	S = np.arange(n_bins) + S_offset
+	if np.any(valid):
+		pS_mean = np.mean(pS[valid], axis=0)
+		pS_std = np.std(pS[valid], axis=0)
+	else:
+		pS_mean = np.full(n_bins, np.nan)
+		pS_std = np.full(n_bins, np.nan)
+
+	return S, pS, pS_mean, pS_std
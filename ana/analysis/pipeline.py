@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+Module for running analysis stages incrementally, as a graph of tasks.
+
+A task is a function call that reads [inputs] and writes [outputs]. Its fingerprint combines the function, its arguments and the identity (size and mtime) of its inputs, and is recorded in a small manifest once the task succeeds. A task whose fingerprint matches its manifest and whose outputs all exist is up to date and skipped. Since a rerun task rewrites its outputs, the tasks depending on them are rerun as well.
+
+Tasks whose dependencies are finished run concurrently in a process pool. Tasks must write distinct files.
+
+"""
+
+import os, json, hashlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from analysis import cache
+
+def task(name, func, kwargs=None, inputs=None, outputs=None, deps=None):
+	"""Defines a task.
+
+	Args:
+	    name (str): Unique name of the task
+	    func (function): Module-level function to run (it must be picklable)
+	    kwargs (dict, optional): Keyword arguments of [func]
+	    inputs (list, optional): Files read by the task
+	    outputs (list, optional): Files written by the task
+	    deps (list, optional): Names of the tasks that must finish first (typically those writing [inputs])
+
+	Returns:
+	    dict: The task
+	"""
+
+	return {
+		'name': name,
+		'func': func,
+		'kwargs': kwargs or {},
+		'inputs': list(inputs or []),
+		'outputs': list(outputs or []),
+		'deps': list(deps or [])
+		}
+
+def fingerprint(task):
+	"""Fingerprint of a task, or None if an input is missing."""
+
+	stamps = []
+	for path in task['inputs']:
+		if not os.path.isfile(path):
+			return None
+		stamps.append((path, cache.file_stamp(path)))
+
+	func = task['func'].__module__ + '.' + task['func'].__qualname__
+	kwargs = sorted([(key, repr(value)) for key, value in task['kwargs'].items()])
+	str_fingerprint = json.dumps([func, kwargs, stamps])
+
+	return hashlib.sha1(str_fingerprint.encode()).hexdigest()
+
+def _manifest_path(state_dir, task):
+	return os.path.join(state_dir, hashlib.sha1(task['name'].encode()).hexdigest()[:16] + '.json')
+
+def is_current(task, state_dir, task_fingerprint=None):
+	"""Whether the outputs of [task] exist and were produced from its current inputs and arguments."""
+
+	if task_fingerprint is None:
+		task_fingerprint = fingerprint(task)
+
+	manifest_path = _manifest_path(state_dir, task)
+	if task_fingerprint is None or not os.path.isfile(manifest_path):
+		return False
+	with open(manifest_path) as f:
+		manifest = json.load(f)
+
+	return manifest.get('fingerprint') == task_fingerprint and all([os.path.exists(path) for path in task['outputs']])
+
+def _record(task, state_dir, task_fingerprint):
+
+	manifest = {'name': task['name'], 'fingerprint': task_fingerprint, 'outputs': task['outputs']}
+	manifest_path = _manifest_path(state_dir, task)
+	with open(manifest_path + '.tmp', 'w') as f:
+		json.dump(manifest, f, indent=1)
+	os.replace(manifest_path + '.tmp', manifest_path)
+
+def _run_task(func, kwargs):
+	return func(**kwargs)
+
+def run(tasks, state_dir, jobs=1, force=False, verbose=True):
+	"""Runs out-of-date tasks in dependency order, [jobs] at a time.
+
+	Args:
+	    tasks (list): Tasks (see task), in the preferred order of execution
+	    state_dir (str): Folder for the task manifests
+	    jobs (int, optional): Number of concurrent processes
+	    force (bool, optional): Reruns all tasks
+	    verbose (bool, optional): Prints the status of each task
+
+	Returns:
+	    dict: Status of each task: 'done', 'skipped' (up to date) or 'failed' (raised, missing input or failed dependency)
+	"""
+
+	names = [t['name'] for t in tasks]
+	if len(set(names)) != len(names):
+		raise ValueError('task names must be unique')
+	for t in tasks:
+		for dep in t['deps']:
+			if dep not in names:
+				raise ValueError('unknown dependency "{:s}" of task "{:s}"'.format(dep, t['name']))
+
+	os.makedirs(state_dir, exist_ok=True)
+	executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+
+	def finish(t, status, msg=''):
+		status_all[t['name']] = status
+		if verbose:
+			print('[{:s}] {:s} {:s}'.format(status, t['name'], msg).rstrip())
+
+	status_all = {}
+	pending = list(tasks)
+	running = {}
+	try:
+		while pending or running:
+
+			#Starts all tasks whose dependencies are finished
+			for t in [t for t in pending if all([dep in status_all for dep in t['deps']])]:
+				pending.remove(t)
+				if any([status_all[dep] == 'failed' for dep in t['deps']]):
+					finish(t, 'failed', '(dependency failed)')
+					continue
+				task_fingerprint = fingerprint(t)
+				if task_fingerprint is None:
+					finish(t, 'failed', '(missing input)')
+					continue
+				if not force and is_current(t, state_dir, task_fingerprint):
+					finish(t, 'skipped')
+					continue
+
+				if executor is None:
+					try:
+						_run_task(t['func'], t['kwargs'])
+						_record(t, state_dir, task_fingerprint)
+						finish(t, 'done')
+					except Exception as e:
+						finish(t, 'failed', '({:s})'.format(repr(e)))
+				else:
+					running[executor.submit(_run_task, t['func'], t['kwargs'])] = (t, task_fingerprint)
+
+			if not running:
+				if pending and not any([all([dep in status_all for dep in t['deps']]) for t in pending]):
+					raise ValueError('circular dependencies between tasks')
+				continue
+
+			#Waits for any task to finish
+			done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+			for future in done:
+				t, task_fingerprint = running.pop(future)
+				try:
+					future.result()
+					_record(t, state_dir, task_fingerprint)
+					finish(t, 'done')
+				except Exception as e:
+					finish(t, 'failed', '({:s})'.format(repr(e)))
+	finally:
+		if executor is not None:
+			executor.shutdown()
+
+	return status_all
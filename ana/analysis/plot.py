@@ -11,7 +11,10 @@ Module for plotting distributions.
 """
 import analysis.avalanche
 import analysis.fitting
+import analysis.histogram
 import matplotlib, os
+if os.environ.get('DISPLAY', '') == '':
+    matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -19,12 +22,8 @@ import numpy as np
 def pS(S,label='data'):
 
 	#Calculates p(S) (no log-binning)
-	S_max = int(S.max()+1)
-	pS = np.zeros(S_max)
-
-	for i in range(1,S_max):
-		pS[i] = np.sum(S==i)
-	pS = pS/np.sum(pS)
+	_, pS, _, _ = analysis.histogram.pS_reps(S)
+	pS = pS[0,:]
 
 	#Plots it
 	plt.loglog(pS,label=label)
@@ -33,20 +32,9 @@ def pS(S,label='data'):
 
 def pS_mean(S_list,label='data',lineType='-', color='k',show_error=True, zorder=2):
 
-	#Gets largest avalanche from the list (+1 for zero_index)
-	S_max = int(max([Si.max() for Si in S_list]) + 1)
-
-	#Obtains pS
-	pS = np.zeros((len(S_list),S_max))
-
-	for i in range(len(S_list)):
-		for j in range(S_max):
-			pS[i,j] = np.sum(S_list[i]==j)
-		pS[i,:] = pS[i,:]/np.sum(pS[i,:])
-
-	#Obtains mean and STD
-	pS_mean = np.mean(pS,axis=0)
-	pS_std = np.std(pS,axis=0)
+	#Obtains pS, its mean and STD
+	S, _, pS_mean, pS_std = analysis.histogram.pS_reps(S_list)
+	S_max = S.size
 	pS_up = pS_mean + pS_std/2
 	pS_dw = pS_mean - pS_std/2
 
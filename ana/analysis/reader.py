@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+Module for reading simulation datasets in blocks, and for the sparse storage of thresholded data.
+
+The simulation writes '/data/coarse' and '/data/sub' as [channels, timesteps] deflate-compressed datasets with (1, cache) chunks. Reading them one row at a time through h5py's default 1 MiB chunk cache decompresses chunks one by one, and tiles narrower than a chunk decompress the same chunk again for every tile. Datasets are therefore opened with a chunk cache sized to their chunk shape and the requested block size.
+
+"""
+
+import numpy as np
+import h5py
+
+#Default and maximum size of the chunk cache
+_cache_min = 1024**2
+_cache_max = 256*1024**2
+
+def _next_prime(n):
+	n = max(int(n), 2)
+	while any(n % i == 0 for i in range(2, int(np.sqrt(n)) + 1)):
+		n += 1
+	return n
+
+def chunk_cache_params(chunks, itemsize, ch_block=1, t_block=None):
+	"""Sizes the HDF5 chunk cache (rdcc) to hold all chunks touched by a [ch_block, t_block] tile.
+
+	Args:
+	    chunks (tuple): Chunk shape of the dataset, [channels, timesteps]
+	    itemsize (int): Size of an element, in bytes
+	    ch_block (int, optional): Number of channels read at once
+	    t_block (int, optional): Number of timesteps read at once (default: one chunk)
+
+	Returns:
+	    int: rdcc_nslots, number of slots of the hash table (a prime)
+	    int: rdcc_nbytes, size of the cache in bytes
+	"""
+
+	if t_block is None:
+		t_block = chunks[-1]
+
+	#Chunks spanned by a tile that is not aligned to the chunk grid
+	n_chunks_ch = -(-ch_block//chunks[0]) if len(chunks) > 1 else 1
+	n_chunks_t = -(-t_block//chunks[-1]) + 1
+	n_chunks = n_chunks_ch*n_chunks_t
+	chunk_nbytes = int(np.prod(chunks))*itemsize
+
+	rdcc_nbytes = int(np.clip(n_chunks*chunk_nbytes, _cache_min, _cache_max))
+
+	#HDF5 recommends ~100 times the number of chunks that fit in the cache
+	rdcc_nslots = _next_prime(100*max(rdcc_nbytes//chunk_nbytes, 1))
+
+	return rdcc_nslots, rdcc_nbytes
+
+def open_dataset(file, name, ch_block=1, t_block=None):
+	"""Opens a dataset of an open h5py file with a chunk cache sized for [ch_block, t_block] reads.
+
+	Args:
+	    file (h5py.File): Open hdf5 file
+	    name (str): Dataset path (e.g. 'data/coarse')
+	    ch_block (int, optional): Number of channels read at once
+	    t_block (int, optional): Number of timesteps read at once (default: one chunk)
+
+	Returns:
+	    h5py.Dataset: The dataset, with tuned chunk cache
+	"""
+
+	dset = file[name]
+	if dset.chunks is None:
+		return dset
+
+	rdcc_nslots, rdcc_nbytes = chunk_cache_params(dset.chunks, dset.dtype.itemsize, ch_block, t_block)
+
+	#w0 = 1 evicts fully read chunks first, which suits sequential reads
+	dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+	dapl.set_chunk_cache(rdcc_nslots, rdcc_nbytes, 1.0)
+	dsid = h5py.h5d.open(file.id, name.encode(), dapl=dapl)
+
+	return h5py.Dataset(dsid)
+
+def read_block(dset, channels=None, timesteps=None, ch_start=0, t_start=0):
+	"""Reads a [channels, timesteps] block of a dataset in a single hyperslab read.
+
+	Args:
+	    dset (h5py.Dataset): Dataset to read from (see open_dataset)
+	    channels (int, optional): Number of channels to read (default: all from ch_start)
+	    timesteps (int, optional): Number of timesteps to read (default: all from t_start)
+	    ch_start (int, optional): First channel
+	    t_start (int, optional): First timestep
+
+	Returns:
+	    ndarray: [channels, timesteps] data block
+	"""
+
+	n_ch, n_t = dset.shape
+	ch_end = n_ch if channels is None else min(ch_start + channels, n_ch)
+	t_end = n_t if timesteps is None else min(t_start + timesteps, n_t)
+
+	data = np.empty((ch_end - ch_start, t_end - t_start), dtype=dset.dtype)
+	if data.size > 0:
+		dset.read_direct(data, np.s_[ch_start:ch_end, t_start:t_end])
+
+	return data
+
+def load_channels(filepath, datatype, channels=None, timesteps=None, data_dir='data/'):
+	"""Loads the first [channels] channels of a simulation dataset in one read and closes the file.
+
+	Args:
+	    filepath (str): Path to the .hdf5 dataset
+	    datatype (str): 'coarse' or 'sub'
+	    channels (int, optional): Number of channels (default: all)
+	    timesteps (int, optional): Number of timesteps (default: all)
+	    data_dir (str, optional): Group of the data inside the file
+
+	Returns:
+	    ndarray: [channels, timesteps] data
+	"""
+
+	with h5py.File(filepath,'r') as file:
+		if channels is None:
+			channels = file[data_dir + datatype].shape[0]
+		dset = open_dataset(file, data_dir + datatype, ch_block=channels)
+		data = read_block(dset, channels, timesteps)
+
+	return data
+
+def iter_tiles(filepath, datatype, ch_block=None, t_block=None, channels=None, timesteps=None, data_dir='data/'):
+	"""Generator of [ch_block, t_block] tiles of a simulation dataset, iterating over time within each channel block.
+
+	Args:
+	    filepath (str): Path to the .hdf5 dataset
+	    datatype (str): 'coarse' or 'sub'
+	    ch_block (int, optional): Channels per tile (default: all channels)
+	    t_block (int, optional): Timesteps per tile (default: one chunk)
+	    channels (int, optional): Number of channels to read (default: all)
+	    timesteps (int, optional): Number of timesteps to read (default: all)
+	    data_dir (str, optional): Group of the data inside the file
+
+	Yields:
+	    slice: Channels of the tile
+	    slice: Timesteps of the tile
+	    ndarray: [ch_block, t_block] data tile (the last ones may be smaller)
+	"""
+
+	with h5py.File(filepath,'r') as file:
+		n_ch, n_t = file[data_dir + datatype].shape
+		chunks = file[data_dir + datatype].chunks
+		if channels is not None:
+			n_ch = min(channels, n_ch)
+		if timesteps is not None:
+			n_t = min(timesteps, n_t)
+		if ch_block is None:
+			ch_block = n_ch
+		if t_block is None:
+			t_block = chunks[-1] if chunks is not None else n_t
+
+		dset = open_dataset(file, data_dir + datatype, ch_block, t_block)
+		for ch_start in range(0, n_ch, ch_block):
+			ch_end = min(ch_start + ch_block, n_ch)
+			for t_start in range(0, n_t, t_block):
+				t_end = min(t_start + t_block, n_t)
+				data = read_block(dset, ch_end - ch_start, t_end - t_start, ch_start, t_start)
+				yield slice(ch_start, ch_end), slice(t_start, t_end), data
+
+def write_thresholded(file, datatype, events_list, timesteps, threshold):
+	"""Writes thresholded events of all repetitions to the group [datatype], in a CSR-like sparse format.
+
+	The group holds 'indices' (timesteps with events, concatenated over repetitions), 'counts' (number of events at each of them) and 'offsets' (indices[offsets[rep]:offsets[rep+1]] belong to rep).
+	
+	Args:
+	    file (h5py.File): Open hdf5 file
+	    datatype (str): 'coarse' or 'sub'
+	    events_list (list): Event times of each repetition, repeated for simultaneous events
+	    timesteps (int): Length of the thresholded timeseries
+	    threshold (float): Threshold used
+	"""
+
+	#Collapses repeated events into counts
+	indices_list = []
+	counts_list = []
+	for events in events_list:
+		indices, counts = np.unique(events, return_counts=True)
+		indices_list.append(indices)
+		counts_list.append(counts)
+	offsets = np.zeros(len(events_list)+1, dtype=np.int64)
+	offsets[1:] = np.cumsum([indices.size for indices in indices_list])
+	indices = np.concatenate(indices_list) if indices_list else np.zeros(0)
+	counts = np.concatenate(counts_list) if counts_list else np.zeros(0)
+
+	#Uses the smallest dtypes that fit
+	group = file.create_group(datatype)
+	group.create_dataset('indices', data=indices.astype(np.min_scalar_type(max(timesteps-1,0))), compression=1)
+	group.create_dataset('counts', data=counts.astype(np.min_scalar_type(counts.max() if counts.size else 0)), compression=1)
+	group.create_dataset('offsets', data=offsets)
+	group.attrs['timesteps'] = timesteps
+	group.attrs['threshold'] = threshold
+	group.attrs['format'] = 'csr'
+
+def thresholded_reps(file, datatype):
+	"""Number of repetitions of thresholded data, stored either dense or sparse."""
+
+	node = file[datatype]
+	if isinstance(node, h5py.Group):
+		return node['offsets'].shape[0] - 1
+	else:
+		return node.shape[0]
+
+def read_thresholded(file, datatype, rep, dense=True):
+	"""Reads one repetition of thresholded data, stored either dense ([reps, timesteps] dataset) or sparse (see write_thresholded).
+	
+	Args:
+	    file (h5py.File): Open hdf5 file
+	    datatype (str): 'coarse' or 'sub'
+	    rep (int): Repetition to read
+	    dense (bool, optional): Returns the dense timeseries instead of the sparse form
+	
+	Returns:
+	    ndarray: (dense) [timesteps] int64 thresholded timeseries
+	    ndarray, ndarray, int: (sparse) timesteps with events, number of events at each of them, and the length of the timeseries
+	"""
+
+	node = file[datatype]
+	if isinstance(node, h5py.Group):
+		start, end = node['offsets'][rep:rep+2]
+		indices = node['indices'][start:end].astype(np.int64)
+		counts = node['counts'][start:end].astype(np.int64)
+		timesteps = int(node.attrs['timesteps'])
+		if not dense:
+			return indices, counts, timesteps
+		data = np.zeros(timesteps, dtype=np.int64)
+		data[indices] = counts
+		return data
+	else:
+		data = node[rep,:].astype(np.int64)
+		if dense:
+			return data
+		indices = np.flatnonzero(data)
+		return indices, data[indices], data.size
+
+def read_thresholded_all(file, datatype):
+	"""Reads all repetitions of thresholded data at once, in sparse form (one read per dataset, for both storage formats).
+
+	Args:
+	    file (h5py.File): Open hdf5 file
+	    datatype (str): 'coarse' or 'sub'
+
+	Returns:
+	    ndarray: Repetition of each entry
+	    ndarray: Timesteps with events
+	    ndarray: Number of events at each of them
+	    int: Number of repetitions
+	    int: Length of the timeseries
+	"""
+
+	node = file[datatype]
+	if isinstance(node, h5py.Group):
+		offsets = node['offsets'][:]
+		indices = node['indices'][:].astype(np.int64)
+		counts = node['counts'][:].astype(np.int64)
+		reps = offsets.size - 1
+		timesteps = int(node.attrs['timesteps'])
+		rep_ids = np.repeat(np.arange(reps), np.diff(offsets))
+	else:
+		data = node[:]
+		reps, timesteps = data.shape
+		rep_ids, indices = np.nonzero(data)
+		counts = data[rep_ids, indices].astype(np.int64)
+
+	return rep_ids, indices, counts, reps, timesteps
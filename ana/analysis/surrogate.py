@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+Module for a NumPy surrogate of the branching-network simulation (src/), writing datasets in the same HDF5 layout.
+
+The network follows the local gauss topology: neurons are placed uniformly in a periodic square (avoiding a dead zone around each electrode) and connect to all neurons within d_max, with activation probabilities decaying as a Gaussian of the distance. Electrodes on a square grid record the coarse signal (every spike contributes r^gamma) and the spikes of their closest neuron (sub).
+
+Instead of stepping every neuron through time, the dynamics is generated cascade-wise over blocks of timesteps. All spontaneous activations of a block are drawn at once, and the cascades are grown one generation at a time for all of them together: every active neuron gets Binomial(K, m/K) offspring (K its number of connections), placed on its connections with the normalized activation probabilities. As in the simulation, a neuron can only be activated once per timestep and spontaneous activations come first. With coalescence compensation, an offspring whose target is already active moves on to the next farther connection; without it (NOCC), it is lost.
+
+Usage (mirroring the arguments of ./exe/cc):
+    python -m analysis.surrogate -o dat/test_r00.hdf5 -m 0.98 -h 4e-4 -de 4 -T 1e5 -N 10000
+
+"""
+
+import numpy as np
+import h5py
+import os, platform
+
+def topology(num_neur=10000, num_outgoing=1000, num_elec=64, neur_dist=50., elec_dist=8., gamma=-1.0, sigma=6., rng=None, n_guide=256):
+	"""Places neurons and electrodes and connects the neurons, as topology_local_gauss and electrode_sampling.
+
+	Args:
+	    num_neur (int, optional): Number of neurons
+	    num_outgoing (int, optional): Average number of outgoing connections per neuron
+	    num_elec (int, optional): Number of electrodes (a square number)
+	    neur_dist (float, optional): Inter-neuron (nearest-neighbour) distance, in um
+	    elec_dist (float, optional): Inter-electrode distance, in units of neur_dist
+	    gamma (float, optional): Exponent of the distance-dependent contribution of a spike to the coarse signal
+	    sigma (float, optional): Effective connection length, in units of neur_dist
+	    rng (np.random.Generator, optional): Random generator
+	    n_guide (int, optional): Size of the guide table of each neuron
+
+	Returns:
+	    dict: Network, with
+	    	'pos_x', 'pos_y': [num_neur] neuron positions (um)
+	    	'elec_x', 'elec_y': [num_elec] electrode positions (um)
+	    	'offsets', 'targets', 'cum_prob': outgoing connections of neuron i in targets[offsets[i]:offsets[i+1]], sorted by distance, with their cumulative normalized activation probabilities
+	    	'guide': [num_neur, n_guide+1] guide table of the inverse-CDF sampling of connections (see _spread)
+	    	'contributions': [num_neur, num_elec] contribution of a spike to the coarse signal of each electrode
+	    	'closest': [num_elec] closest neuron of each electrode
+	    	'meta': parameters written to /meta
+	"""
+
+	from scipy.spatial import cKDTree
+
+	if rng is None:
+		rng = np.random.default_rng()
+
+	side = int(round(np.sqrt(num_elec)))
+	if side*side != num_elec:
+		raise ValueError('num_elec must be a square number')
+
+	#System size and connection radius (topology_local_gauss.set_N_and_d_N)
+	L = 2.0*np.sqrt(num_neur)*neur_dist
+	rho = num_neur/(L/1000.0)**2
+	d_max = np.sqrt(L*L*num_outgoing/np.pi/num_neur)
+	if d_max >= L/2:
+		raise ValueError('num_outgoing is too large for num_neur')
+
+	#Electrode grid in the middle of the culture
+	d_E = neur_dist*elec_dist
+	d_zone = neur_dist/5.
+	xy_offset = 0.5*L - 0.5*np.sqrt(num_elec)*d_E
+	grid_i, grid_j = np.divmod(np.arange(num_elec), side)
+	elec_x = xy_offset + grid_j*d_E
+	elec_y = xy_offset + grid_i*d_E
+	if np.any(elec_x < 0) or np.any(elec_x > L) or np.any(elec_y < 0) or np.any(elec_y > L):
+		raise ValueError('electrode array exceeds culture dimension')
+
+	def dist_squ(x1, y1, x2, y2):
+		dx = np.abs(x1 - x2)
+		dy = np.abs(y1 - y2)
+		return np.minimum(dx, L - dx)**2 + np.minimum(dy, L - dy)**2
+
+	#Places neurons, redrawing those in the dead zones
+	pos = rng.random((num_neur, 2))*L
+	elec_tree = cKDTree(np.column_stack((elec_x, elec_y)), boxsize=L)
+	rejections = 0
+	while True:
+		rejected = np.flatnonzero(elec_tree.query(pos, distance_upper_bound=d_zone*(1 + 1e-12))[0] <= d_zone)
+		if rejected.size == 0:
+			break
+		rejections += rejected.size
+		if rejections > num_neur/10:
+			raise ValueError('rejected too many neuron placements ({:d})'.format(rejections))
+		pos[rejected] = rng.random((rejected.size, 2))*L
+
+	#Connects neurons within d_max, sorted by distance (the k nearest neighbours, with k above the largest number of neurons within d_max)
+	tree = cKDTree(pos, boxsize=L)
+	k = int(num_outgoing + 8*np.sqrt(num_outgoing) + 16)
+	while True:
+		dij, tar = tree.query(pos, k=min(k, num_neur), distance_upper_bound=d_max)
+		if k >= num_neur or np.all(np.isinf(dij[:,-1])):
+			break
+		k *= 2
+	keep = np.isfinite(dij) & (tar != np.arange(num_neur)[:,np.newaxis])
+	degree = np.sum(keep, axis=1)
+	offsets = np.zeros(num_neur + 1, dtype=np.int64)
+	offsets[1:] = np.cumsum(degree)
+	src = np.repeat(np.arange(num_neur), degree)
+	tar = tar[keep].astype(np.int32)
+	dij_squ = dij[keep]**2
+	del dij, keep
+
+	#Normalized activation probabilities, cumulated within each neuron
+	pij = np.exp(-dij_squ/(2.*(sigma*neur_dist)**2))
+	pij /= np.bincount(src, weights=pij, minlength=num_neur)[src]
+	cum_prob = np.concatenate(([0], np.cumsum(pij)))
+	cum_prob = (cum_prob[1:] - np.repeat(cum_prob[offsets[:-1]], degree)).astype(np.float32)
+
+	#Guide table: guide[i,q] is the first connection of neuron i with a cumulative probability of at least q/n_guide
+	bins = np.minimum((cum_prob*n_guide).astype(np.int64), n_guide)
+	counts = np.bincount(src*(n_guide + 1) + bins, minlength=num_neur*(n_guide + 1)).reshape(num_neur, n_guide + 1)
+	guide = np.zeros((num_neur, n_guide + 1), dtype=np.int64)
+	guide[:,1:] = np.cumsum(counts[:,:-1], axis=1)
+	guide += offsets[:-1,np.newaxis]
+	guide = guide.astype(np.int32 if offsets[-1] < 2**31 else np.int64)
+
+	#Contributions to the electrodes and closest neuron of each electrode
+	rik_squ = dist_squ(pos[:,0,np.newaxis], pos[:,1,np.newaxis], elec_x[np.newaxis,:], elec_y[np.newaxis,:])
+	contributions = rik_squ**(gamma/2.)
+	closest = np.argmin(rik_squ, axis=0)
+
+	meta = {
+		'num_elec': num_elec,
+		'elec_dist': d_E,
+		'elec_dead_zone': d_zone,
+		'elec_contribution_exponent': gamma,
+		'topology': 'local gauss',
+		'num_neur': num_neur,
+		'num_outgoing': num_outgoing,
+		'sys_size': L,
+		'neuron_density': rho,
+		'd_max': d_max,
+		'sigma': sigma,
+		'neur_dist': neur_dist
+		}
+
+	network = {
+		'pos_x': pos[:,0],
+		'pos_y': pos[:,1],
+		'elec_x': elec_x,
+		'elec_y': elec_y,
+		'offsets': offsets,
+		'degree': degree,
+		'targets': tar,
+		'cum_prob': cum_prob,
+		'guide': guide,
+		'contributions': contributions,
+		'closest': closest,
+		'meta': meta
+		}
+
+	return network
+
+def _spread(network, t, src, m, rng):
+	"""Draws the offspring of active neurons [src] at times [t]: their times, parents and connection indices."""
+
+	degree = network['degree'][src]
+	n_offspring = rng.binomial(degree, m/np.maximum(degree, 1))
+	parent = np.repeat(src, n_offspring)
+
+	#Inverse-CDF sampling of the connection: the guide table brackets the first connection with a cumulative probability above u, found by bisection
+	guide = network['guide']
+	cum_prob = network['cum_prob']
+	u = rng.random(parent.size)
+	q = (u*(guide.shape[1] - 1)).astype(np.int64)
+	conn = guide[parent, q].astype(np.int64)
+	hi = guide[parent, q+1]
+	search = np.flatnonzero(conn < hi)
+	lo = conn[search]
+	hi = hi[search]
+	u = u[search]
+	while search.size > 0:
+		mid = (lo + hi)//2
+		right = cum_prob[mid] <= u
+		lo = np.where(right, mid + 1, lo)
+		hi = np.where(right, hi, mid)
+		done = lo >= hi
+		conn[search[done]] = lo[done]
+		search = search[~done]
+		lo = lo[~done]
+		hi = hi[~done]
+		u = u[~done]
+	conn = np.minimum(conn, network['offsets'][parent+1] - 1)
+
+	return np.repeat(t, n_offspring) + 1, parent, conn
+
+def _is_active(active, row, neuron):
+	return (active[row, neuron >> 3] >> (neuron & 7).astype(np.uint8)) & 1 == 1
+
+def _activate(active, row, neuron):
+	"""Sets the bits of [neuron] at [row] in [active], a [timesteps, ceil(neurons/8)] uint8 bitset (a boolean array of a block would be 8 times larger, allowing shorter blocks only)."""
+	np.bitwise_or.at(active, (row, neuron >> 3), np.left_shift(1, neuron & 7).astype(np.uint8))
+
+def _place(network, active, t0, t, parent, conn, coalescence_compensation=True):
+	"""Activates the targets of connections [conn] at times [t], if they are not active yet.
+
+	Targets that are already active (or chosen twice) are moved to the next farther connection of their parent with coalescence compensation, and dropped otherwise. Marks the activated neurons in [active], the bitset of the block starting at [t0] (see _activate).
+
+	Returns:
+	    ndarray: Times of the activated neurons
+	    ndarray: Activated neurons
+	"""
+
+	targets = network['targets']
+	num_neur = network['degree'].size
+	t_placed = []
+	n_placed = []
+	while t.size > 0:
+		tar = targets[conn]
+
+		#Accepts inactive targets, and only the first activation of a (time, neuron) chosen several times
+		accept = ~_is_active(active, t - t0, tar)
+		candidates = np.flatnonzero(accept)
+		key = (t[candidates] - t0)*num_neur + tar[candidates]
+		order = np.argsort(key, kind='stable')
+		accept[candidates[order[1:][key[order[1:]] == key[order[:-1]]]]] = False
+		_activate(active, t[accept] - t0, tar[accept])
+		t_placed.append(t[accept])
+		n_placed.append(tar[accept])
+
+		#Retries the others on the next connection
+		if not coalescence_compensation:
+			break
+		retry = np.flatnonzero(~accept)
+		t = t[retry]
+		parent = parent[retry]
+		conn = conn[retry] + 1
+		valid = conn < network['offsets'][parent+1]
+		t = t[valid]
+		parent = parent[valid]
+		conn = conn[valid]
+
+	if t_placed:
+		return np.concatenate(t_placed), np.concatenate(n_placed)
+	else:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+def run_blocks(network, timesteps, m=0.98, h=4e-5, coalescence_compensation=True, block_size=None, n_init=0, rng=None):
+	"""Generates the dynamics block by block.
+
+	Args:
+	    network (dict): Network (see topology)
+	    timesteps (int): Number of timesteps
+	    m (float, optional): Branching parameter
+	    h (float, optional): Probability of spontaneous activation per neuron and timestep
+	    coalescence_compensation (bool, optional): Moves offspring of active targets to the next connection
+	    block_size (int, optional): Timesteps per block (default: a [block, neurons] bitset of 128 MiB)
+	    n_init (int, optional): Neurons activated at the first timestep, besides the spontaneous activations
+	    rng (np.random.Generator, optional): Random generator
+
+	Yields:
+	    int: First timestep of the block
+	    int: End of the block (first timestep after it)
+	    ndarray: Times of all activations in the block (unsorted)
+	    ndarray: Activated neurons
+	"""
+
+	if rng is None:
+		rng = np.random.default_rng()
+
+	num_neur = network['offsets'].size - 1
+	if block_size is None:
+		block_size = max(256, 2**30//num_neur)
+	block_size = min(block_size, timesteps)
+	active = np.zeros((block_size, (num_neur + 7)//8), dtype=np.uint8)
+
+	#Offspring (times, parents, connections) drawn for the first timestep of the next block
+	pending = [np.zeros(0, dtype=np.int64)]*3
+
+	for t0 in range(0, timesteps, block_size):
+		t1 = min(t0 + block_size, timesteps)
+
+		#Spontaneous activations first (duplicates are the same activation)
+		n_drive = rng.binomial(num_neur, h, size=t1-t0)
+		if t0 == 0:
+			n_drive[0] += n_init
+		key_drive = np.unique(np.repeat(np.arange(t1-t0), n_drive)*num_neur + rng.integers(0, num_neur, size=np.sum(n_drive)))
+		t_drive, n_drive = np.divmod(key_drive, num_neur)
+		_activate(active, t_drive, n_drive)
+		t_pending, n_pending = _place(network, active, t0, *pending, coalescence_compensation)
+		t_front = np.concatenate((t_drive + t0, t_pending))
+		n_front = np.concatenate((n_drive, n_pending))
+		t_all = [t_front]
+		n_all = [n_front]
+
+		#Grows all cascades by one generation at a time
+		pending = [[], [], []]
+		while t_front.size > 0:
+			t_child, parent, conn = _spread(network, t_front, n_front, m, rng)
+			in_block = t_child < t1
+			for k, child in enumerate((t_child, parent, conn)):
+				pending[k].append(child[~in_block])
+			t_front, n_front = _place(network, active, t0, t_child[in_block], parent[in_block], conn[in_block], coalescence_compensation)
+			t_all.append(t_front)
+			n_all.append(n_front)
+		pending = [np.concatenate(p) if p else np.zeros(0, dtype=np.int64) for p in pending]
+
+		t_all = np.concatenate(t_all)
+		n_all = np.concatenate(n_all)
+		active[t_all - t0, n_all >> 3] = 0
+
+		yield t0, t1, t_all, n_all
+
+def simulate(
+	path,
+	time_steps=1e5,
+	thrm_steps=1e3,
+	num_neur=10000,
+	num_outgoing=1000,
+	num_elec=64,
+	neur_dist=50.,
+	elec_dist=8.,
+	gamma=-1.0,
+	seed=314,
+	m_micro=.98,
+	sigma=6.,
+	h=4e-5,
+	cache_size=1e5,
+	coalescence_compensation=True,
+	verbose=False
+	):
+	"""Runs the surrogate simulation and writes [path] in the layout of the simulation output (see electrode_sampling::init_writing_hdf5). Arguments and defaults follow ./exe/cc, except for the number of neurons.
+
+	Args:
+	    path (str): Output path
+	    time_steps (int, optional): Number of recorded timesteps
+	    thrm_steps (int, optional): Thermalization steps before recording
+	    num_neur (int, optional): Number of neurons
+	    num_outgoing (int, optional): Average number of outgoing connections per neuron
+	    num_elec (int, optional): Number of electrodes (a square number)
+	    neur_dist (float, optional): Inter-neuron (nearest-neighbour) distance, in um
+	    elec_dist (float, optional): Inter-electrode distance, in units of neur_dist
+	    gamma (float, optional): Exponent of the contribution of a spike to the coarse signal (r^gamma)
+	    seed (int, optional): Seed of the random generator
+	    m_micro (float, optional): Branching parameter
+	    sigma (float, optional): Effective connection length, in units of neur_dist
+	    h (float, optional): Probability of spontaneous activation per neuron and timestep
+	    cache_size (int, optional): Chunk length of the datasets, in timesteps
+	    coalescence_compensation (bool, optional): Toggles coalescence compensation (off as the NOCC build)
+	    verbose (bool, optional): Prints the progress
+	"""
+
+	from scipy.sparse import csr_matrix
+
+	time_steps = int(time_steps)
+	thrm_steps = int(thrm_steps)
+	num_neur = int(num_neur)
+	num_elec = int(num_elec)
+	cache_size = int(cache_size)
+	delta_t = 2.
+
+	rng = np.random.default_rng(1000 + int(seed))
+	network = topology(num_neur, int(num_outgoing), num_elec, neur_dist, elec_dist, gamma, sigma, rng)
+	contributions = network['contributions']
+	closest = csr_matrix((np.ones(num_elec), (network['closest'], np.arange(num_elec))), shape=(num_neur, num_elec))
+
+	if os.path.dirname(path):
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+
+	with h5py.File(path, 'w') as file:
+		for group in ['data', 'axons', 'neurons', 'electrodes', 'meta', 'uname']:
+			file.create_group(group)
+		uname = platform.uname()
+		for key, value in [('system', uname.system), ('node', uname.node), ('release', uname.release), ('version', uname.version), ('machine', uname.machine), ('original_file_path', path)]:
+			file['uname/' + key] = np.array([value.encode()])
+
+		#Appendable datasets with (1, cache) chunks and deflate level 3
+		dset_cs = file.create_dataset('data/coarse', shape=(num_elec, 0), maxshape=(None, None), dtype=np.float32, chunks=(1, cache_size), compression='gzip', compression_opts=3)
+		dset_ss = file.create_dataset('data/sub', shape=(num_elec, 0), maxshape=(None, None), dtype=np.uint64, chunks=(1, cache_size), compression='gzip', compression_opts=3)
+		dset_at = file.create_dataset('data/activity', shape=(0,), maxshape=(None,), dtype=np.uint64, chunks=(cache_size,), compression='gzip', compression_opts=3)
+		ss_offset = np.zeros(num_elec, dtype=np.int64)
+
+		#Metadata
+		meta = dict(network['meta'], seed=int(seed), coalesence_compensation_bool=int(coalescence_compensation), m_micro=m_micro, h_prob=h)
+		for key, value in meta.items():
+			if isinstance(value, str):
+				file['meta/' + key] = np.array([value.encode()])
+			elif isinstance(value, (int, np.integer)):
+				file['meta/' + key] = np.array([value], dtype=np.uint64)
+			else:
+				file['meta/' + key] = np.array([value], dtype=np.float64)
+		file['electrodes/pos_x'] = network['elec_x'].astype(np.float32)
+		file['electrodes/pos_y'] = network['elec_y'].astype(np.float32)
+
+		#Starts at the target activity of 1 Hz, as the simulation
+		n_init = int(num_neur*delta_t/1000.)
+		blocks = run_blocks(network, thrm_steps + time_steps, m_micro, h, coalescence_compensation, n_init=n_init, rng=rng)
+		for t0, t1, t, neurons in blocks:
+			#Skips thermalization
+			if t1 <= thrm_steps:
+				continue
+			start = max(t0, thrm_steps) - thrm_steps
+			stop = t1 - thrm_steps
+			rec = t >= thrm_steps
+			t = t[rec] - thrm_steps
+			neurons = neurons[rec]
+			if verbose:
+				print('{:d}/{:d} timesteps'.format(stop, time_steps))
+
+			#Sums the activity and electrode signals of each timestep
+			activations = csr_matrix((np.ones(t.size), (t - start, neurons)), shape=(stop - start, num_neur))
+			activity = np.bincount(t - start, minlength=stop - start)
+			coarse = (activations @ contributions).T
+			spiking = (activations @ closest).T.tocsr()
+
+			dset_at.resize((dset_at.shape[0] + activity.size,))
+			dset_at[-activity.size:] = activity
+			dset_cs.resize((num_elec, dset_cs.shape[1] + activity.size))
+			dset_cs[:,-activity.size:] = coarse
+			for e in range(num_elec):
+				spikes = spiking.indices[spiking.indptr[e]:spiking.indptr[e+1]] + start
+				if spikes.size > 0:
+					if ss_offset[e] + spikes.size > dset_ss.shape[1]:
+						dset_ss.resize((num_elec, ss_offset[e] + spikes.size))
+					dset_ss[e,ss_offset[e]:ss_offset[e] + spikes.size] = np.sort(spikes)
+					ss_offset[e] += spikes.size
+
+if __name__ == "__main__":
+
+	import argparse
+
+	#Arguments of ./exe/cc ('-h' is the drive, as in the simulation)
+	parser = argparse.ArgumentParser(description='NumPy surrogate of the branching-network simulation', add_help=False)
+	parser.add_argument("--help", action='help')
+	parser.add_argument("-o",  dest='path',         type=str, required=True)
+	parser.add_argument("-T",  dest='time_steps',   type=float, default=1e5)
+	parser.add_argument("-t",  dest='thrm_steps',   type=float, default=1e3)
+	parser.add_argument("-N",  dest='num_neur',     type=float, default=10000)
+	parser.add_argument("-k",  dest='num_outgoing', type=float, default=1000)
+	parser.add_argument("-e",  dest='num_elec',     type=float, default=64)
+	parser.add_argument("-dn", dest='neur_dist',    type=float, default=50.)
+	parser.add_argument("-de", dest='elec_dist',    type=float, default=8.)
+	parser.add_argument("-s",  dest='seed',         type=float, default=314)
+	parser.add_argument("-m",  dest='m_micro',      type=float, default=.98)
+	parser.add_argument("-g",  dest='sigma',        type=float, default=6.)
+	parser.add_argument("-ga", dest='gamma',        type=float, default=-1.0)
+	parser.add_argument("-h",  dest='h',            type=float, default=4e-5)
+	parser.add_argument("-c",  dest='cache_size',   type=float, default=1e5)
+	parser.add_argument("--nocc", dest='coalescence_compensation', action='store_false')
+	args = parser.parse_args()
+
+	simulate(verbose=True, **vars(args))
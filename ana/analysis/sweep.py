@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+
+Module for analyzing a thresholded timeseries over a range of binsizes at once.
+
+Binnings are built hierarchically: the binning with binsize b is obtained from the largest smaller binsize that divides it (e.g. b = 16 from b = 8), instead of rebinning the full timeseries each time. The binned timeseries have the legacy layout of avalanche.bin_data.
+
+"""
+
+import numpy as np
+from analysis import avalanche, fitting, histogram, bootstrap
+
+def bin_hierarchical(data, binsizes):
+	"""Bins a timeseries for all binsizes, reusing previous binnings where the binsizes divide each other.
+
+	Args:
+	    data (ndarray): [timesteps] or [reps, timesteps] thresholded timeseries
+	    binsizes (list): Binsizes, in timesteps
+
+	Returns:
+	    dict: Binned timeseries for each binsize, in the layout of avalanche.bin_data
+	"""
+
+	#Binnings with a partial last bin (ragged='keep') compose exactly: ceil(ceil(T/a)/c) = ceil(T/(a*c))
+	binned_keep = {1: np.asarray(data)}
+	binned = {}
+	for b in sorted(set([int(b) for b in binsizes])):
+		b_base = max([b_prev for b_prev in binned_keep if b % b_prev == 0])
+		binned_keep[b] = avalanche.bin_block(binned_keep[b_base], b//b_base, ragged='keep')
+
+		#Legacy layout
+		binned[b] = binned_keep[b].astype(float)
+		binned[b][...,-1] = 0
+
+	return binned
+
+def binsize_sweep(data, binsizes, S_offset=1, fit_alpha=True, xmin=1, xmax=50, n_boot=0, ci=0.95, seed=0):
+	"""Obtains avalanche sizes, p(S), m_av and the power-law exponent alpha of a thresholded timeseries for all binsizes in one call.
+
+	Repetitions are processed one at a time, so passing a generator of timeseries (e.g. read from a thresholded file) bounds memory to a single repetition.
+
+	Args:
+	    data (ndarray or iterable): [timesteps] or [reps, timesteps] thresholded timeseries, or an iterable of [timesteps] timeseries
+	    binsizes (list): Binsizes, in timesteps
+	    S_offset (int, optional): Avalanche size of the first p(S) bin (see histogram.pS_reps)
+	    fit_alpha (bool, optional): Toggles the power-law fit
+	    xmin (int, optional): Lower bound of the power-law fit
+	    xmax (int, optional): Upper bound of the power-law fit
+	    n_boot (int, optional): Number of bootstrap resamples for the confidence intervals of the mean alpha and m_av over repetitions (see analysis.bootstrap)
+	    ci (float, optional): Confidence level
+	    seed (int, optional): Seed of the bootstrap
+
+	Returns:
+	    dict: For each binsize, a dict with
+	    	'S': list of avalanche-size arrays, one for each repetition
+	    	'X', 'pS', 'pS_mean', 'pS_std': p(S) of each repetition and its statistics (see histogram.pS_reps)
+	    	'm_av': [reps] m_av of each repetition
+	    	'alpha': [reps] fitted exponent of each repetition (None if not fit_alpha)
+	    	'alpha_ci', 'm_av_ci': (lower, upper) confidence interval of the mean over repetitions (if n_boot > 0)
+	"""
+
+	if isinstance(data, np.ndarray) and data.ndim == 1:
+		data = [data]
+
+	rep_results = [sweep_rep(data_rep, binsizes, ratios=n_boot > 0) for data_rep in data]
+
+	return gather_reps(rep_results, binsizes, S_offset, fit_alpha, xmin, xmax, n_boot, ci, seed)
+
+def sweep_rep(data, binsizes, ratios=False):
+	"""Obtains avalanche sizes and m_av of a single repetition for all binsizes, binning it once (see binsize_sweep).
+
+	Returns:
+	    dict: For each binsize, a tuple (S, m_av, ratios), where ratios is the histogram of A(t+1)/A(t) if [ratios] (see fitting.m_avalanche_ratios) and None otherwise
+	"""
+
+	rep_result = {}
+	for b, data_binned in bin_hierarchical(data, binsizes).items():
+		rep_result[b] = (
+			avalanche.get_S(data_binned),
+			fitting.m_avalanche(data_binned),
+			fitting.m_avalanche_ratios(data_binned) if ratios else None
+			)
+
+	return rep_result
+
+def gather_reps(rep_results, binsizes, S_offset=1, fit_alpha=True, xmin=1, xmax=50, n_boot=0, ci=0.95, seed=0):
+	"""Gathers the results of sweep_rep over repetitions, in the output format of binsize_sweep. The power law of all repetitions and binsizes is fit in a single batch (see fitting.powerlaw_alpha), and so are its bootstrap resamples. The confidence interval of m_av requires sweep_rep with [ratios]."""
+
+	binsizes = sorted(set([int(b) for b in binsizes]))
+	reps = len(rep_results)
+
+	#Histograms of the fit range, [reps, binsizes, S]
+	if fit_alpha:
+		counts = np.zeros((reps, len(binsizes), xmax+1))
+		for rep in range(reps):
+			for k in range(len(binsizes)):
+				S = rep_results[rep][binsizes[k]][0].astype(np.int64)
+				counts[rep,k,:] = np.bincount(S[S <= xmax], minlength=xmax+1)
+		alpha = fitting.powerlaw_alpha(counts, xmin=xmin, xmax=xmax)
+		if n_boot > 0:
+			alpha_boot = bootstrap.alpha_bootstrap(counts, n_boot, xmin=xmin, xmax=xmax, seed=seed)
+
+	results = {}
+	for k in range(len(binsizes)):
+		b = binsizes[k]
+		S_list = [rep_result[b][0] for rep_result in rep_results]
+		X, pS, pS_mean, pS_std = histogram.pS_reps(S_list, S_offset=S_offset)
+		results[b] = {
+			'S': S_list,
+			'X': X,
+			'pS': pS,
+			'pS_mean': pS_mean,
+			'pS_std': pS_std,
+			'm_av': np.array([rep_result[b][1] for rep_result in rep_results]),
+			'alpha': alpha[:,k] if fit_alpha else None
+			}
+
+		#Confidence intervals of the means over repetitions
+		if n_boot > 0:
+			ratios_list = [rep_result[b][2] for rep_result in rep_results]
+			if None not in ratios_list:
+				m_av_boot = bootstrap.m_av_bootstrap(ratios_list, n_boot, seed=[seed, k])
+				results[b]['m_av_ci'] = bootstrap.confidence_interval(np.mean(m_av_boot, axis=1), ci)
+			if fit_alpha:
+				results[b]['alpha_ci'] = bootstrap.confidence_interval(np.mean(alpha_boot[:,:,k], axis=1), ci)
+
+	return results
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the analysis hot paths on synthetic datasets (see fixtures.py).
+
+For every scale, each stage of the analysis (reading, filtering, thresholding, binning, avalanche sizes, p(S), m_av, power-law fits, end-to-end analyze_sim_raw) is timed in this process (best of [repeat] runs) and its peak memory is measured with tracemalloc in a separate run. The run_analysis modes are timed in a subprocess, with the peak resident memory of the child. Results are compared to a stored JSON baseline: a stage regresses if its time or peak memory exceeds the baseline by more than [threshold] (relative). Exits with status 1 on regressions.
+
+Usage:
+    python benchmarks/bench_analysis.py --save-baseline           (records benchmarks/baseline.json)
+    python benchmarks/bench_analysis.py --threshold 0.2           (compares to it)
+    python benchmarks/bench_analysis.py --scales small,medium,large --modes threshold,save_ps
+"""
+
+import os, sys, time, json, argparse, platform, subprocess, tempfile, tracemalloc
+import numpy as np
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+ana_dir = os.path.dirname(bench_dir)
+sys.path.insert(0, ana_dir)
+
+import fixtures
+from analysis import avalanche, reader, histogram, fitting, sweep
+
+#Binsizes of the sweeps and run_analysis modes
+binsizes = [1, 2, 4, 8, 16]
+
+#Scales above this many samples stream the coarse signal, and run the in-memory stages on a subset of channels
+max_samples = 2**26
+chunk_size = 2**20
+
+def stages(filepath, timesteps, channels):
+	"""Benchmarked stages, as (name, function) pairs. The functions share intermediate results, so they must run in order."""
+
+	channels_mem = max(1, min(channels, max_samples//timesteps))
+	state = {}
+
+	def load():
+		state['coarse'] = reader.load_channels(filepath, 'coarse', channels_mem, timesteps)
+	def filter_bw():
+		state['filtered'] = avalanche.filter_bw_ch(state['coarse'])
+	def filter_bw_float32():
+		avalanche.filter_bw(state['coarse'], dtype=np.float32)
+	def threshold_ch():
+		avalanche.threshold_ch(state['filtered'][0], 3)
+	def threshold_data():
+		state['events'] = avalanche.threshold_data(state['filtered'], 3)
+	def bin_data():
+		state['data_th'] = np.bincount(np.concatenate(state['events']), minlength=timesteps)
+		state['binned'] = avalanche.bin_data(state['data_th'], 4)
+	def get_S():
+		state['S'] = avalanche.get_S(state['binned'])
+	def pS_reps():
+		histogram.pS_reps([state['S']]*10, S_offset=1)
+	def m_avalanche():
+		fitting.m_avalanche(state['binned'])
+	def powerlaw_alpha():
+		S = state['S'].astype(np.int64)
+		fitting.powerlaw_alpha(np.bincount(S[S <= 50], minlength=51))
+	def powerlaw_fit():
+		import powerlaw
+		powerlaw.Fit(state['S'], discrete=True, xmin=1, xmax=50, verbose=False)
+	def binsize_sweep():
+		sweep.binsize_sweep(state['data_th'], binsizes)
+	def analyze_sim_raw_coarse():
+		avalanche.analyze_sim_raw(filepath, 3, 'coarse', True, chunk_size=chunk_size if timesteps*channels > max_samples else None)
+	def analyze_sim_raw_sub():
+		avalanche.analyze_sim_raw(filepath, 3, 'sub', True)
+
+	stage_list = [load, filter_bw, filter_bw_float32, threshold_ch, threshold_data, bin_data, get_S, pS_reps, m_avalanche, powerlaw_alpha]
+	try:
+		import powerlaw
+		stage_list.append(powerlaw_fit)
+	except ImportError:
+		pass
+	stage_list += [binsize_sweep, analyze_sim_raw_coarse, analyze_sim_raw_sub]
+
+	return [(func.__name__, func) for func in stage_list]
+
+def measure(func, repeat=3):
+	"""Best wall time of [repeat] runs of [func], and its peak traced memory (in MB) in one more run."""
+
+	times = []
+	for run in range(repeat):
+		t0 = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - t0)
+
+	tracemalloc.start()
+	func()
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	return min(times), peak/1024**2
+
+#Runs a script and writes its peak resident memory (VmHWM, in kB) to a file. The rusage of a child includes the peak of the parent it was forked from, while VmHWM starts anew at exec
+_run_peak = """
+import sys, runpy
+peak_file, sys.argv = sys.argv[1], sys.argv[2:]
+try:
+	runpy.run_path(sys.argv[0], run_name='__main__')
+finally:
+	with open('/proc/self/status') as f:
+		peak = [line.split()[1] for line in f if line.startswith('VmHWM')][0]
+	with open(peak_file, 'w') as f:
+		f.write(peak)
+"""
+
+def measure_mode(mode, data_dir, timesteps, channels, repeat=1):
+	"""Best wall time of [repeat] runs of 'run_analysis.py --mode [mode]' on [data_dir], and the peak resident memory (in MB) of the child process (Linux only)."""
+
+	args = [os.path.join(ana_dir, 'run_analysis.py'), '--mode', mode, '--datafolder', data_dir, '-b', ','.join([str(b) for b in binsizes])]
+	if mode == 'threshold' and timesteps*channels > max_samples:
+		args += ['--chunk_size', str(chunk_size)]
+
+	times = []
+	peak = 0
+	for run in range(repeat):
+		#Fresh cache for every run, so save_plot always analyzes the raw data
+		with tempfile.TemporaryDirectory() as tmp_dir:
+			env = dict(os.environ, CRITICALAVALANCHES_CACHE=tmp_dir)
+			peak_file = os.path.join(tmp_dir, 'peak')
+			t0 = time.perf_counter()
+			subprocess.run([sys.executable, '-c', _run_peak, peak_file] + args, cwd=ana_dir, env=env, stdout=subprocess.DEVNULL, check=True)
+			times.append(time.perf_counter() - t0)
+			with open(peak_file) as f:
+				peak = max(peak, int(f.read())/1024)
+
+	return min(times), peak
+
+def compare(results, baseline, threshold=0.2, min_time=0.01):
+	"""Compares results to a baseline, returning the list of regressions. Stages faster than [min_time] seconds in the baseline are only checked for memory."""
+
+	regressions = []
+	for key, result in results.items():
+		if key not in baseline:
+			continue
+		base = baseline[key]
+		if base['time'] >= min_time and result['time'] > base['time']*(1 + threshold):
+			regressions.append('{:s}: time {:.3f} s -> {:.3f} s'.format(key, base['time'], result['time']))
+		if base['peak_mb'] >= 1 and result['peak_mb'] > base['peak_mb']*(1 + threshold):
+			regressions.append('{:s}: peak memory {:.1f} MB -> {:.1f} MB'.format(key, base['peak_mb'], result['peak_mb']))
+
+	return regressions
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Benchmark of the analysis hot paths')
+	parser.add_argument("--scales", type=str, default='small,medium', help="Comma-separated scales ({:s})".format(', '.join(fixtures.scales)))
+	parser.add_argument("--modes", type=str, default='threshold,save_ps,save_ps_alpha,save_plot', help="Comma-separated run_analysis modes ('' for none)")
+	parser.add_argument("--stages", type=str, default=None, help="Comma-separated stages (default: all)")
+	parser.add_argument("--repeat", type=int, default=3, help="Runs per stage (the best is kept)")
+	parser.add_argument("--workdir", type=str, default=os.path.join(tempfile.gettempdir(), 'criticalavalanches_bench'), help="Location of the synthetic datasets (kept between runs)")
+	parser.add_argument("--baseline", type=str, default=os.path.join(bench_dir, 'baseline.json'), help="Baseline JSON file")
+	parser.add_argument("--save-baseline", action='store_true', help="Stores the results as the baseline")
+	parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown (or memory increase) counted as a regression")
+	parser.add_argument("--surrogate", action='store_true', help="Uses datasets of the branching-network surrogate (analysis.surrogate) instead of the synthetic ones")
+	parser.add_argument("--output", type=str, default=None, help="Also writes the results to this JSON file")
+	args = parser.parse_args()
+
+	stage_filter = args.stages.split(',') if args.stages else None
+	modes = [mode for mode in args.modes.split(',') if mode]
+
+	results = {}
+	print('{:36s} {:>10s} {:>12s}'.format('stage', 'time [s]', 'peak [MB]'))
+	for scale in args.scales.split(','):
+		timesteps, channels = fixtures.scales[scale]
+		data_dir = os.path.join(args.workdir, scale + ('_surrogate' if args.surrogate else '')) + '/'
+		print('Generating {:s} dataset ({:d} timesteps, {:d} channels)'.format(scale, timesteps, channels))
+		name = fixtures.make_dataset(data_dir, scale, surrogate=args.surrogate)
+		filepath = data_dir + name + '_r00.hdf5'
+
+		for stage, func in stages(filepath, timesteps, channels):
+			#Unselected stages still run once, as later stages use their results
+			if stage_filter is not None and stage not in stage_filter:
+				func()
+				continue
+			key = scale + '/' + stage
+			dt, peak = measure(func, args.repeat)
+			results[key] = {'time': dt, 'peak_mb': peak}
+			print('{:36s} {:10.3f} {:12.1f}'.format(key, dt, peak))
+
+		#Modes run in order, as each uses the files written by the previous ones
+		for mode in modes:
+			key = scale + '/mode_' + mode
+			dt, peak = measure_mode(mode, data_dir, timesteps, channels)
+			results[key] = {'time': dt, 'peak_mb': peak}
+			print('{:36s} {:10.3f} {:12.1f}'.format(key, dt, peak))
+
+	output = {
+		'meta': {
+			'python': platform.python_version(),
+			'numpy': np.__version__,
+			'machine': platform.machine(),
+			'processor': platform.processor(),
+			'node': platform.node(),
+			'date': time.strftime('%Y-%m-%d %H:%M:%S')
+			},
+		'results': results
+		}
+	if args.output is not None:
+		with open(args.output, 'w') as f:
+			json.dump(output, f, indent=1)
+
+	if args.save_baseline:
+		#Merges with the stored baseline, so scales can be recorded separately
+		if os.path.isfile(args.baseline):
+			with open(args.baseline) as f:
+				baseline = json.load(f)
+			baseline['results'].update(results)
+			baseline['meta'] = output['meta']
+			output = baseline
+		with open(args.baseline, 'w') as f:
+			json.dump(output, f, indent=1)
+		print('Baseline saved to ' + args.baseline)
+		sys.exit(0)
+
+	if not os.path.isfile(args.baseline):
+		print('No baseline at {:s} (record one with --save-baseline)'.format(args.baseline))
+		sys.exit(0)
+
+	with open(args.baseline) as f:
+		baseline = json.load(f)
+	regressions = compare(results, baseline['results'], args.threshold)
+	if regressions:
+		print('Regressions (threshold {:.0f}%) against the baseline of {:s}:'.format(100*args.threshold, baseline['meta']['date']))
+		for regression in regressions:
+			print('  ' + regression)
+		sys.exit(1)
+	else:
+		print('No regressions (threshold {:.0f}%)'.format(100*args.threshold))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Import-time benchmark of the analysis package.
+
+Each module is imported in a fresh interpreter (the situation of a spawned worker), [runs] times, and the median wall time is compared to its budget. The numerical core must also import without matplotlib, powerlaw and scipy.signal, which are loaded on first use. Exits with status 1 if a budget is exceeded or a heavy module is loaded eagerly.
+
+Usage: python benchmarks/bench_import.py [--runs 7] [--scale 1.0]
+"""
+
+import os, sys, subprocess, argparse, json
+import numpy as np
+
+#Modules and their import budget, in seconds (numpy and h5py alone take ~0.2 s)
+budgets = {
+	'analysis': 0.05,
+	'analysis.avalanche': 0.6,
+	'analysis.reader': 0.6,
+	'analysis.histogram': 0.6,
+	'analysis.fitting': 0.6,
+	'analysis.sweep': 0.6,
+	'analysis.bootstrap': 0.6,
+	'analysis.cache': 0.6,
+	'analysis.pipeline': 0.6,
+	'analysis.surrogate': 0.6,
+	'analysis.correlation': 0.6,
+	'run_analysis': 0.6,
+	}
+
+#Modules the numerical core must not load
+heavy = ['matplotlib', 'powerlaw', 'scipy.signal', 'scipy.optimize']
+
+ana_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def time_import(module, runs=7):
+	"""Median wall time of importing [module] in a fresh interpreter, and the heavy modules it loaded."""
+
+	code = (
+		'import time; t0 = time.perf_counter(); import {:s}; dt = time.perf_counter() - t0\n'
+		'import sys, json; print(json.dumps([dt, [m for m in {:s} if m in sys.modules]]))'
+		).format(module, repr(heavy))
+
+	times = []
+	for run in range(runs):
+		out = subprocess.run([sys.executable, '-c', code], cwd=ana_dir, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+		dt, loaded = json.loads(out)
+		times.append(dt)
+
+	return np.median(times), loaded
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Import-time benchmark')
+	parser.add_argument("--runs", type=int, default=7, help="Fresh interpreters per module")
+	parser.add_argument("--scale", type=float, default=1.0, help="Multiplies all budgets (for slow machines)")
+	args = parser.parse_args()
+
+	failed = False
+	print('{:24s} {:>10s} {:>10s}  {:s}'.format('module', 'time [s]', 'budget', 'heavy modules'))
+	for module, budget in budgets.items():
+		dt, loaded = time_import(module, args.runs)
+		budget *= args.scale
+		status = 'ok'
+		if dt > budget or loaded:
+			status = 'FAIL'
+			failed = True
+		print('{:24s} {:10.3f} {:10.3f}  {:s} {:s}'.format(module, dt, budget, ','.join(loaded) or '-', status))
+
+	sys.exit(1 if failed else 0)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Equivalence checks of the optimized analysis paths against their reference implementations, on a synthetic dataset (see fixtures.py).
+
+- threshold_stream matches threshold_data (in memory) event by event, with and without the butterworth filter, at several chunk sizes, including chunks of a single timestep and chunks longer than the timeseries.
+- Thresholded events survive the CSR round trip of write_thresholded (read_thresholded, dense and sparse, and read_thresholded_all), also from the legacy dense storage.
+- fitting.m_avalanche_sparse matches m_avalanche on the binned timeseries of every repetition.
+- fitting.powerlaw_alpha matches powerlaw.Fit within 1e-3 (skipped if powerlaw is not installed).
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python benchmarks/check_equivalence.py
+    python benchmarks/check_equivalence.py --timesteps 50000 --channels 32 --chunk_sizes 1,333,5000,100000
+"""
+
+import os, sys, argparse, tempfile
+import numpy as np
+import h5py
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+ana_dir = os.path.dirname(bench_dir)
+sys.path.insert(0, ana_dir)
+
+import fixtures
+from analysis import avalanche, reader, fitting
+
+def events_equal(events, events_ref):
+	"""Number of channels whose event indices differ."""
+	return sum([not np.array_equal(ev, ev_ref) for ev, ev_ref in zip(events, events_ref)]) + abs(len(events) - len(events_ref))
+
+def check_stream(filepath, chunk_sizes, threshold=3):
+	"""Compares threshold_stream to threshold_data, returning the list of failures."""
+
+	failures = []
+	data = reader.load_channels(filepath, 'coarse')
+	for bw_filter in [False, True]:
+		data_ref = avalanche.filter_bw_ch(data) if bw_filter else data
+		events_ref, dense_ref = avalanche.threshold_data(data_ref, threshold, return_dense=True)
+		for chunk_size in chunk_sizes:
+			events, dense = avalanche.threshold_stream(filepath, threshold, bw_filter, chunk_size, return_dense=True)
+			n_diff = events_equal(events, events_ref)
+			name = 'threshold_stream (bw_filter={:d}, chunk_size={:d})'.format(bw_filter, chunk_size)
+			print('{:56s} {:d} events, {:d} channels differ'.format(name, int(dense.sum()), n_diff))
+			if n_diff > 0 or not np.array_equal(dense, dense_ref):
+				failures.append(name)
+
+	return failures
+
+def check_csr(events_list, timesteps, work_dir):
+	"""Writes thresholded events with write_thresholded (and as the legacy dense dataset), and compares all readers to the dense reference. Returns the list of failures."""
+
+	failures = []
+	dense_ref = np.array([np.bincount(np.asarray(ev, dtype=np.int64), minlength=timesteps) for ev in events_list])
+	reps = dense_ref.shape[0]
+
+	filepath = os.path.join(work_dir, 'thresholded.hdf5')
+	with h5py.File(filepath, 'w') as file:
+		reader.write_thresholded(file, 'coarse', events_list, timesteps, 3)
+		file['legacy'] = dense_ref
+
+	with h5py.File(filepath, 'r') as file:
+		for datatype in ['coarse', 'legacy']:
+			ok = reader.thresholded_reps(file, datatype) == reps
+			for rep in range(reps):
+				ok &= np.array_equal(reader.read_thresholded(file, datatype, rep), dense_ref[rep])
+				indices, counts, n_t = reader.read_thresholded(file, datatype, rep, dense=False)
+				ok &= n_t == timesteps and np.array_equal(indices, np.flatnonzero(dense_ref[rep])) and np.array_equal(counts, dense_ref[rep][indices])
+			rep_ids, indices, counts, reps_all, n_t = reader.read_thresholded_all(file, datatype)
+			dense = np.zeros((reps_all, n_t), dtype=np.int64)
+			dense[rep_ids, indices] = counts
+			ok &= np.array_equal(dense, dense_ref)
+
+			name = 'thresholded round trip ({:s})'.format('csr' if datatype == 'coarse' else 'dense')
+			print('{:56s} {:s}'.format(name, 'ok' if ok else 'FAILED'))
+			if not ok:
+				failures.append(name)
+
+	return failures
+
+def check_m_av(events_list, timesteps, binsizes):
+	"""Compares m_avalanche_sparse to m_avalanche on every repetition, returning the list of failures."""
+
+	failures = []
+	rep_ids = np.repeat(np.arange(len(events_list)), [np.size(ev) for ev in events_list])
+	indices = np.concatenate([np.asarray(ev, dtype=np.int64) for ev in events_list])
+	counts = np.ones(indices.size, dtype=np.int64)
+	for b in binsizes:
+		m_av = fitting.m_avalanche_sparse(rep_ids, indices, counts, len(events_list), timesteps, b)
+		m_ref = []
+		for ev in events_list:
+			data_binned = avalanche.bin_data(np.bincount(np.asarray(ev, dtype=np.int64), minlength=timesteps), b)
+			m_ref.append(fitting.m_avalanche(data_binned) if np.any(data_binned[:-1]) else np.nan)
+		ok = np.allclose(m_av, m_ref, rtol=1e-12, equal_nan=True)
+		name = 'm_avalanche_sparse (binsize={:d})'.format(b)
+		print('{:56s} {:s}'.format(name, 'ok' if ok else 'FAILED'))
+		if not ok:
+			failures.append(name)
+
+	return failures
+
+def check_alpha(alphas=[1.2, 1.5, 2.0, 2.5], n_avalanches=3000, xmin=1, xmax=50, tol=1e-3, seed=0):
+	"""Compares powerlaw_alpha to powerlaw.Fit on sampled truncated power laws, returning the list of failures."""
+
+	try:
+		import powerlaw
+	except ImportError:
+		print('{:56s} skipped (powerlaw not installed)'.format('powerlaw_alpha'))
+		return []
+
+	failures = []
+	rng = np.random.default_rng(seed)
+	S_range = np.arange(xmin, xmax+1)
+	for alpha in alphas:
+		p = S_range**-alpha
+		S = rng.choice(S_range, size=n_avalanches, p=p/p.sum())
+		alpha_fit = fitting.powerlaw_alpha(np.bincount(S, minlength=xmax+1), xmin=xmin, xmax=xmax)
+		alpha_ref = powerlaw.Fit(S, discrete=True, estimate_discrete=False, xmin=xmin, xmax=xmax, verbose=False).alpha
+		name = 'powerlaw_alpha (alpha={:.2f})'.format(alpha)
+		print('{:56s} {:.5f} vs {:.5f}'.format(name, alpha_fit, alpha_ref))
+		if not abs(alpha_fit - alpha_ref) < tol:
+			failures.append(name)
+
+	return failures
+
+if __name__ == "__main__":
+
+	parser = argparse.ArgumentParser(description='Equivalence checks of the optimized analysis paths')
+	parser.add_argument("--timesteps", type=int, default=20000, help="Length of the synthetic dataset")
+	parser.add_argument("--channels", type=int, default=16, help="Channels of the synthetic dataset")
+	parser.add_argument("--chunk_sizes", type=str, default='1,7,1000,4999,20000,100000', help="Comma-separated chunk sizes of threshold_stream")
+	parser.add_argument("--binsizes", type=str, default='1,2,4,16', help="Comma-separated binsizes of the m_av check")
+	args = parser.parse_args()
+
+	chunk_sizes = [int(c) for c in args.chunk_sizes.split(',')]
+	binsizes = [int(b) for b in args.binsizes.split(',')]
+
+	failures = []
+	with tempfile.TemporaryDirectory() as work_dir:
+		filepath = os.path.join(work_dir, fixtures.dataset_name() + '_r00.hdf5')
+		fixtures.write_sim_file(filepath, args.timesteps, args.channels)
+
+		failures += check_stream(filepath, chunk_sizes)
+
+		#Channels as repetitions, plus an empty one
+		events = avalanche.threshold_data(reader.load_channels(filepath, 'coarse'), 3)
+		events_list = events + [np.zeros(0, dtype=np.int64)]
+		failures += check_csr(events_list, args.timesteps, work_dir)
+		failures += check_m_av(events_list, args.timesteps, binsizes)
+
+	failures += check_alpha()
+
+	if failures:
+		print('Failed checks:')
+		for failure in failures:
+			print('  ' + failure)
+		sys.exit(1)
+	else:
+		print('All checks passed')
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic simulation datasets for the benchmarks.
+
+Files follow the layout written by the simulation ('/data/activity', '/data/coarse', '/data/sub', '/electrodes', '/meta'), with the same dtypes, chunks and compression, and are named as simulation output (e.g. 'm0.98000_h4.000e-04_de04_ga-1.00_r00.hdf5') so that run_analysis finds them.
+
+The data is a cheap stand-in for the simulation, generated in blocks of timesteps so that memory is bounded for any length: the population rate follows a linear (Gaussian) approximation of a branching process with parameter m, the activity is Poisson around it, every channel spikes with a fraction of the activity, and the coarse signal of a channel is its spike train plus the shared activity, smoothed by an exponential kernel, plus noise. Statistics are only realistic enough to produce avalanches and power-law-like p(S) at the usual thresholds.
+"""
+
+import os
+import numpy as np
+import h5py
+
+#Chunk length (the simulation's cache size, par.cache) and deflate level of the simulation output
+sim_chunk = 100000
+sim_deflate = 3
+
+#Benchmark scales: (timesteps, channels)
+scales = {
+	'small': (100000, 16),
+	'medium': (1000000, 64),
+	'large': (10000000, 256),
+	}
+
+def dataset_name(m=0.98, h=4e-4, de=4):
+	"""Simulation-style name of a synthetic dataset, without the '_rXX.hdf5' suffix."""
+	return 'm{:.5f}_h{:.3e}_de{:02d}_ga-1.00'.format(m, h, de)
+
+def write_sim_file(filepath, timesteps, channels, m=0.98, h=4e-4, num_neur=160000, rate_ch=0.01, seed=0, block_size=2**17):
+	"""Writes a synthetic simulation file.
+
+	Args:
+	    filepath (str): Path of the .hdf5 file
+	    timesteps (int): Number of timesteps
+	    channels (int): Number of electrodes
+	    m (float, optional): Branching parameter of the population rate
+	    h (float, optional): Drive per neuron and timestep
+	    num_neur (int, optional): Number of neurons
+	    rate_ch (float, optional): Mean spike probability per channel and timestep
+	    seed (int, optional): Seed of the random generator
+	    block_size (int, optional): Timesteps generated at once
+	"""
+
+	from scipy.signal import lfilter
+
+	rng = np.random.default_rng(seed)
+	rate_mean = num_neur*h/(1 - m)
+	tau_coarse = 4.0
+
+	with h5py.File(filepath, 'w') as file:
+
+		#Data, with the chunks and compression of the simulation output
+		activity = file.create_dataset('data/activity', shape=(timesteps,), dtype=np.uint64, chunks=(min(sim_chunk, timesteps),), compression='gzip', compression_opts=sim_deflate)
+		coarse = file.create_dataset('data/coarse', shape=(channels, timesteps), dtype=np.float32, chunks=(1, min(sim_chunk, timesteps)), compression='gzip', compression_opts=sim_deflate)
+
+		zi_rate = np.zeros(1)
+		zi_coarse = np.zeros((channels, 1))
+		spikes = [[] for ch in range(channels)]
+		for t0 in range(0, timesteps, block_size):
+			t1 = min(t0 + block_size, timesteps)
+
+			#Population rate r(t) = m*r(t-1) + (1-m)*mean + noise, and Poisson activity
+			noise = rate_mean*(1 - m) + np.sqrt(rate_mean*(1 - m**2))*rng.standard_normal(t1 - t0)
+			rate, zi_rate = lfilter([1.0], [1.0, -m], noise, zi=zi_rate)
+			act = rng.poisson(np.maximum(rate, 0))
+			activity[t0:t1] = act
+
+			#Spikes seen by each channel, a thinned copy of the activity
+			p_spike = np.minimum(rate_ch*act/rate_mean, 1)
+			spk = rng.random((channels, t1 - t0)) < p_spike
+			for ch in range(channels):
+				spikes[ch].append(np.flatnonzero(spk[ch]) + t0)
+
+			#Coarse signal, low-passed spikes and activity
+			signal = spk + act/rate_mean + 0.1*rng.standard_normal((channels, t1 - t0))
+			signal, zi_coarse = lfilter([1/tau_coarse], [1.0, 1/tau_coarse - 1], signal, axis=1, zi=zi_coarse)
+			coarse[:,t0:t1] = signal
+
+		#Spike times of each channel, padded with zeros to the longest row
+		n_spikes = max([sum([s.size for s in spikes_ch]) for spikes_ch in spikes] + [1])
+		sub = file.create_dataset('data/sub', shape=(channels, n_spikes), dtype=np.uint64, chunks=(1, min(sim_chunk, n_spikes)), compression='gzip', compression_opts=sim_deflate)
+		for ch in range(channels):
+			spikes_ch = np.concatenate(spikes[ch])
+			row = np.zeros(n_spikes, dtype=np.uint64)
+			row[:spikes_ch.size] = spikes_ch
+			sub[ch,:] = row
+
+		#Electrodes on a square grid and a subset of the metadata
+		side = int(np.ceil(np.sqrt(channels)))
+		file['electrodes/pos_x'] = (np.arange(channels) % side).astype(np.float32)
+		file['electrodes/pos_y'] = (np.arange(channels)//side).astype(np.float32)
+		file['meta/m_micro'] = [m]
+		file['meta/h_prob'] = [h]
+		file['meta/num_elec'] = np.array([channels], dtype=np.uint64)
+		file['meta/num_neur'] = np.array([num_neur], dtype=np.uint64)
+		file['meta/seed'] = np.array([seed], dtype=np.uint64)
+
+def has_sim_layout(filepath):
+	"""Checks that an existing dataset has the chunks and compression of the simulation output (datasets from older fixtures do not)."""
+
+	with h5py.File(filepath, 'r') as file:
+		coarse = file['data/coarse']
+		return coarse.chunks[1] in (sim_chunk, coarse.shape[1]) and coarse.compression_opts == sim_deflate
+
+def make_dataset(data_dir, scale, reps=1, seed=0, m=0.98, h=4e-4, de=4, surrogate=False):
+	"""Generates the repetitions of a synthetic dataset at [scale] in [data_dir], unless they already exist with the layout of the simulation output. With [surrogate], the data comes from the branching-network surrogate (see analysis.surrogate) instead of write_sim_file.
+
+	Returns:
+	    str: Dataset name (see dataset_name)
+	"""
+
+	timesteps, channels = scales[scale]
+	name = dataset_name(m, h, de)
+	os.makedirs(data_dir, exist_ok=True)
+	for rep in range(reps):
+		filepath = os.path.join(data_dir, name + '_r{:02d}.hdf5'.format(rep))
+		if not os.path.isfile(filepath) or not has_sim_layout(filepath):
+			if surrogate:
+				from analysis import surrogate as surrogate_sim
+				surrogate_sim.simulate(filepath + '.tmp', time_steps=timesteps, num_elec=channels, elec_dist=de, seed=seed + rep, m_micro=m, h=h, cache_size=sim_chunk)
+			else:
+				write_sim_file(filepath + '.tmp', timesteps, channels, m=m, h=h, seed=seed + rep)
+			os.replace(filepath + '.tmp', filepath)
+
+	return name
@@ -4,13 +4,12 @@
 # @Last Modified by:   joaopn
 # @Last Modified time: 2019-07-23 02:34:51
 
-from analysis import avalanche, plot, fitting, parser
+from analysis import avalanche, fitting, parser, reader, cache, sweep, pipeline, bootstrap, correlation
 import numpy as np
-import matplotlib.pyplot as plt
 import os, argparse
-import glob
+import glob, re
 import h5py
-import powerlaw
+from concurrent.futures import ProcessPoolExecutor
 
 def parametersDefault():
 
@@ -41,17 +40,60 @@ def parametersDefault():
 		type=str,   nargs='?', const=1, default=None)
 	parser.add_argument("--bw_filter",
 		type=bool,  nargs='?', const=1, default=bw_filterDefault)
+	parser.add_argument("--chunk_size",
+		type=int,   nargs='?', const=1, default=None)
+	parser.add_argument("--jobs",
+		type=int,   nargs='?', const=1, default=1)
+	parser.add_argument("--n_boot",
+		type=int,   nargs='?', const=1, default=None)
+	parser.add_argument("--stages",
+		type=str,   nargs='?', const=1, default='threshold,save_ps,save_ps_alpha')
+	parser.add_argument("--force",
+		type=bool,  nargs='?', const=1, default=False)
 
 
 	#Adds string of binsizes
 	parser.add_argument("-b","--binsize",type=str,nargs='?',const=1,default=binsizeDefault)
 	args = parser.parse_args()
 	args.binsize = [int(item) for item in args.binsize.split(',')]
+	args.stages = args.stages.split(',')
 
 	return args
 
+def pool_map(func, tasks, jobs=1):
+	"""Runs [func] over a list of argument tuples in a pool of [jobs] processes, returning the results in the order of [tasks].
+
+	Workers only compute and return their results; all writing is done by the calling process, since hdf5 files cannot be safely written from several processes.
+	"""
+
+	if jobs is None or jobs <= 1 or len(tasks) <= 1:
+		return [func(*task) for task in tasks]
+
+	with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+		return list(executor.map(func, *zip(*tasks)))
+
+def _threshold_rep(filepath, threshold, datatype, bw_filter, timesteps, chunk_size):
+	events, _ = avalanche.analyze_sim_events(
+		filepath=filepath,
+		threshold=threshold,
+		datatype=datatype,
+		bw_filter=bw_filter,
+		timesteps=timesteps,
+		chunk_size=chunk_size
+		)
+	return events
+
+def _sweep_thresholded(file_path, datatype, rep, binsize, ratios=False):
+	with h5py.File(file_path,'r') as file:
+		data_thresholded = reader.read_thresholded(file,datatype,rep)
+	return sweep.sweep_rep(data_thresholded, binsize, ratios)
+
 def save_plot(data_dir,filename,threshold,datatype,reps,binsize,bw_filter):
 
+	#Loads matplotlib only when plotting (analysis.plot picks the backend)
+	from analysis import plot
+	import matplotlib.pyplot as plt
+
 	#Save location
 	if bw_filter:
 		fig_dir = data_dir + 'plot_filtered/'
@@ -83,7 +125,7 @@ def save_plot(data_dir,filename,threshold,datatype,reps,binsize,bw_filter):
 			filepath = data_dir + filename + '_r{:02d}.hdf5'.format(rep)
 
 			#Analyzes rep
-			data_thresholded = avalanche.analyze_sim_raw(
+			data_thresholded = cache.analyze_sim_raw(
 				filepath=filepath,
 				threshold=threshold,
 				datatype=datatype,
@@ -104,8 +146,8 @@ def save_plot(data_dir,filename,threshold,datatype,reps,binsize,bw_filter):
 	plt.savefig(str_fig)
 	plt.close()
 
-def save_threshold(data_dir,filename,threshold,reps,bw_filter,timesteps=None):
-	"""Thresholds datasets in [data_dir], numbered in files ending with '_rep%2d.hdf5'. Results are saved to [data_dir]/thresholded_[filtered/unfiltered]/filename.hdf5, where each columnn corresponds to a repetition.
+def save_threshold(data_dir,filename,threshold,reps,bw_filter,timesteps=None,chunk_size=None,jobs=1):
+	"""Thresholds datasets in [data_dir], numbered in files ending with '_rep%2d.hdf5'. Results are saved to [data_dir]/thresholded_[filtered/unfiltered]/filename.hdf5, as sparse events of each repetition (see reader.write_thresholded).
 	
 	Args:
 	    data_dir (str): Location to search for hdf5 datasets
@@ -114,6 +156,8 @@ def save_threshold(data_dir,filename,threshold,reps,bw_filter,timesteps=None):
 	    reps (int): Number of repetitions in the dataset
 	    bw_filter (bool): Whether to bandpass the coarse signal with a butterworth 4th order filter
 	    timesteps (None, optional): Timeseries length to use, in timesteps.
+	    chunk_size (None, optional): Streams the coarse signal in chunks of [chunk_size] timesteps, for recordings that don't fit in memory.
+	    jobs (int, optional): Number of processes thresholding repetitions in parallel
 	"""
 
 	#Definitions
@@ -138,26 +182,17 @@ def save_threshold(data_dir,filename,threshold,reps,bw_filter,timesteps=None):
 	file = h5py.File(str_savefile,'w') #Overwrites old file
 
 
-	#Saves thresholded data ('coarse' and 'sub')
+	#Analyzes each (datatype, rep) in parallel
+	tasks = []
 	for datatype in datatypes:
-
-		#Creates .h5 dataset
-		file.create_dataset(datatype,shape=(reps,timesteps),dtype=int,chunks=(1,timesteps),compression=1,maxshape=(None,timesteps))
-		file[datatype].attrs['threshold'] = threshold
-
 		for rep in range(reps):
-
-			#Creates filepath
 			filepath = data_dir + filename + '_r{:02d}.hdf5'.format(rep)
+			tasks.append((filepath, threshold, datatype, bw_filter, timesteps, chunk_size))
+	events_all = pool_map(_threshold_rep, tasks, jobs)
 
-			#Analyzes rep
-			data_thresholded = avalanche.analyze_sim_raw(
-				filepath=filepath,
-				threshold=threshold,
-				datatype=datatype,
-				bw_filter=bw_filter
-				)
-			file[datatype][rep,:] = np.int32(data_thresholded)
+	#Saves thresholded data ('coarse' and 'sub') as sparse events
+	for k, datatype in enumerate(datatypes):
+		reader.write_thresholded(file, datatype, events_all[k*reps:(k+1)*reps], timesteps, threshold)
 
 	#Copies population activity data
 	file.create_dataset('activity',shape=(reps,timesteps),dtype=float,chunks=(1,timesteps),compression=1,maxshape=(None,timesteps))
@@ -170,7 +205,7 @@ def save_threshold(data_dir,filename,threshold,reps,bw_filter,timesteps=None):
 	#Flushes and closes file
 	file.close()
 
-def save_ps(data_dir, filename, binsize, bw_filter, reps=None):
+def save_ps(data_dir, filename, binsize, bw_filter, reps=None, jobs=1):
 	"""Saves avalanche-size distribution data, using the thresholded .hdf5 files generated by save_thresholded. 
 	
 	Args:
@@ -179,6 +214,7 @@ def save_ps(data_dir, filename, binsize, bw_filter, reps=None):
 	    binsize (list): Bin-sizes (in timesteps) to use for the avalanches
 	    bw_filter (bool): Whether to bandpass the coarse signal with a butterworth 4th order filter
 	    reps (None, optional): Number of repetitions to use
+	    jobs (int, optional): Number of processes analyzing repetitions in parallel
 	"""
 	#Definitions
 	if bw_filter:
@@ -190,43 +226,23 @@ def save_ps(data_dir, filename, binsize, bw_filter, reps=None):
 
 	datatypes = ['coarse', 'sub']
 
-	#Loads file
-	file_path = data_dir + dir_threshold + filename + '.hdf5'
-	file = h5py.File(file_path,'r')
-
 	#Gets reps from file
+	file_path = data_dir + dir_threshold + filename + '.hdf5'
 	if reps is None:
-		reps = file['coarse'].shape[0]
-
-	#Runs the analysis for each b
-	for k in range(len(binsize)):
-
-		#Analyzes both 'coarse' and 'sub'
-		for datatype in datatypes:
-
-			#Obtains S for each repetition
-			S_list = []
-			for rep in range(reps):
+		with h5py.File(file_path,'r') as file:
+			reps = reader.thresholded_reps(file,'coarse')
 
-				#Loads data, analyzes and bins it
-				data_thresholded = file[datatype][rep,:]
-				data_binned = avalanche.bin_data(data=data_thresholded,binsize=binsize[k])
-				S_list.append(avalanche.get_S(data_binned))
-
-			#Gets largest avalanche from the list (+1 for zero_index)
-			S_max = int(max([Si.max() for Si in S_list]) + 1)
+	#Analyzes both 'coarse' and 'sub'
+	for datatype in datatypes:
 
-			#Obtains pS
-			pS = np.zeros((len(S_list),S_max))
-			for i in range(len(S_list)):
-				for j in range(S_max):
-					pS[i,j] = np.sum(S_list[i]==j+1)
-				pS[i,:] = pS[i,:]/np.sum(pS[i,:])
+		#Obtains S of each repetition for all binsizes at once (p(S) indexed from S = 1)
+		tasks = [(file_path, datatype, rep, binsize) for rep in range(reps)]
+		results = sweep.gather_reps(pool_map(_sweep_thresholded, tasks, jobs), binsize, S_offset=1, fit_alpha=False)
 
-			#Obtains mean and STD
-			pS_mean = np.mean(pS,axis=0)
-			pS_std = np.std(pS,axis=0)
-			X = np.arange(S_max)+1
+		for k in range(len(binsize)):
+			X = results[binsize[k]]['X']
+			pS_mean = results[binsize[k]]['pS_mean']
+			pS_std = results[binsize[k]]['pS_std']
 
 			#Saves plot data
 			str_savefolder = data_dir + saveplot_dir + filename + '_rep{:02d}/'.format(reps)
@@ -236,7 +252,7 @@ def save_ps(data_dir, filename, binsize, bw_filter, reps=None):
 			str_save = str_savefolder + str_savefile
 			np.savetxt(str_save,(X,pS_mean,pS_std),delimiter='\t',header='S\tpS_mean\tpS_std')
 
-def save_mav(data_dir, filename, d_list, binsize, threshold, bw_filter, reps=None):
+def save_mav(data_dir, filename, d_list, binsize, threshold, bw_filter, reps=None, jobs=1, n_boot=None):
 
 	#Definitions
 	if bw_filter:
@@ -246,49 +262,49 @@ def save_mav(data_dir, filename, d_list, binsize, threshold, bw_filter, reps=Non
 		dir_threshold = 'thresholded_unfiltered/'
 		save_dir = 'analyzed_unfiltered/branching_mav/'
 
-	#Runs it for each binsize
-	for k in range(len(binsize)):
-
-		#Defines save variables
-		mav_mean = np.zeros(len(d_list))
-		mav_std = np.zeros(len(d_list))
-		IED = np.array(d_list)
+	#Defines save variables
+	mav_mean = np.zeros((len(binsize),len(d_list)))
+	mav_std = np.zeros((len(binsize),len(d_list)))
+	mav_ci = np.zeros((2,len(binsize),len(d_list)))
+	IED = np.array(d_list)
+
+	#Reads each d at once and obtains m_av of all repetitions and binsizes (in parallel over d)
+	file_paths = [data_dir + dir_threshold + filename + "d{:02d}_th{:0.1f}.hdf5".format(d,threshold) for d in d_list]
+	tasks = [([file_paths[d_id]], [d_list[d_id]], binsize, 2, bool(n_boot), False) for d_id in range(len(d_list))]
+	results_d = pool_map(fitting.branching_thresholded, tasks, jobs)
+	if n_boot:
+		results = np.concatenate([result_d[0] for result_d in results_d])
+		ratios = {key: value for result_d in results_d for key, value in result_d[1].items()}
+	else:
+		results = np.concatenate(results_d)
 
-		#Runs analysis for each d
+	#Obtains mean and STD (and bootstrap confidence interval) over the reps of each d
+	for d_id in range(len(d_list)):
+		for k in range(len(binsize)):
+			selected = (results['d'] == d_list[d_id]) & (results['binsize'] == binsize[k])
+			if reps is not None:
+				selected &= results['rep'] < reps
+			mav_reps = results['m_av'][selected]
+			mav_mean[k,d_id] = np.mean(mav_reps)
+			mav_std[k,d_id] = np.std(mav_reps)
+			if n_boot:
+				m_av_boot = bootstrap.m_av_bootstrap(ratios[(d_list[d_id],binsize[k])][:mav_reps.size], n_boot, seed=[0,k])
+				mav_ci[:,k,d_id] = bootstrap.confidence_interval(np.mean(m_av_boot,axis=1))
+
+	#Saves data
+	if not os.path.exists(data_dir + save_dir):
+		os.makedirs(data_dir + save_dir)
+	for k in range(len(binsize)):
 		for d_id in range(len(d_list)):
-
-			#Loads file
-			file_path = data_dir + dir_threshold + filename + "d{:02d}_th{:0.1f}.hdf5".format(d_list[d_id],threshold)
-			file = h5py.File(file_path,'r')
-
-			#Gets reps from file
-			if reps is None:
-				reps = int(file['coarse'].shape[0])
-
-			#Obtains m_av for each repetition
-			mav_reps = np.zeros(reps)
-			for rep in range(reps):
-
-				#Loads data, analyzes and bins it
-				data_thresholded = file['coarse'][rep,:]
-				data_binned = avalanche.bin_data(data=data_thresholded,binsize=binsize[k])
-				mav_reps[rep] = fitting.m_avalanche(data_binned)
-
-
-			#Obtains mean and STD
-			mav_mean[d_id] = np.mean(mav_reps)
-			mav_std[d_id] = np.std(mav_reps)
-
-			print('b = {:d}, d = {:d}: m_av = {:0.3f} +- {:0.3f}'.format(binsize[k], d_list[d_id], mav_mean[d_id],mav_std[d_id]))
-
-		#Saves data
-		if not os.path.exists(data_dir + save_dir):
-			os.makedirs(data_dir + save_dir)
+			print('b = {:d}, d = {:d}: m_av = {:0.3f} +- {:0.3f}'.format(binsize[k], d_list[d_id], mav_mean[k,d_id],mav_std[k,d_id]))
 		str_savefile = filename + 'b{:02d}_th{:0.1f}.tsv'.format(binsize[k], threshold)
 		str_save = data_dir + save_dir + str_savefile
-		np.savetxt(str_save,(IED,mav_mean,mav_std),delimiter='\t',header='d\tmav_mean\tmav_std')
+		if n_boot:
+			np.savetxt(str_save,(IED,mav_mean[k],mav_std[k],mav_ci[0,k],mav_ci[1,k]),delimiter='\t',header='d\tmav_mean\tmav_std\tmav_ci_low\tmav_ci_high')
+		else:
+			np.savetxt(str_save,(IED,mav_mean[k],mav_std[k]),delimiter='\t',header='d\tmav_mean\tmav_std')
 
-def save_ps_alpha(data_dir, filename, binsize, bw_filter, reps=None, xmax=50):
+def save_ps_alpha(data_dir, filename, binsize, bw_filter, reps=None, xmax=50, jobs=1, n_boot=None):
 
 	#Parameters
 	timescale = 2
@@ -304,31 +320,19 @@ def save_ps_alpha(data_dir, filename, binsize, bw_filter, reps=None, xmax=50):
 	datatypes = ['coarse', 'sub']
 	
 
-	#Loads file
-	file_path = data_dir + dir_threshold + filename + '.hdf5'
-	file = h5py.File(file_path,'r')
-
 	#Gets reps from file
+	file_path = data_dir + dir_threshold + filename + '.hdf5'
 	if reps is None:
-		reps = file['coarse'].shape[0]
+		with h5py.File(file_path,'r') as file:
+			reps = reader.thresholded_reps(file,'coarse')
 
 	#Analyzes both 'coarse' and 'sub'
 	for datatype in datatypes:
 
-		#Defines alpha matrix
-		alpha_fit = np.zeros((len(binsize), reps))
-
-		#Runs the analysis for each b
-		for k in range(len(binsize)):
-			#Obtains S for each repetition
-			for rep in range(reps):
-
-				#Loads data, bins it and fits the avalanches
-				data_thresholded = file[datatype][rep,:]
-				data_binned = avalanche.bin_data(data=data_thresholded,binsize=binsize[k])
-				S = avalanche.get_S(data_binned)
-				fit = powerlaw.Fit(S, discrete=True, estimate_discrete=False, xmin=1, xmax=xmax)
-				alpha_fit[k,rep] = fit.alpha				
+		#Fits the avalanches of each repetition for all binsizes at once
+		tasks = [(file_path, datatype, rep, binsize) for rep in range(reps)]
+		results = sweep.gather_reps(pool_map(_sweep_thresholded, tasks, jobs), binsize, fit_alpha=True, xmin=1, xmax=xmax, n_boot=n_boot or 0)
+		alpha_fit = np.array([results[b]['alpha'] for b in binsize])
 
 		#Obtains mean and STD
 		alpha_mean = np.mean(alpha_fit,axis=1)
@@ -341,77 +345,144 @@ def save_ps_alpha(data_dir, filename, binsize, bw_filter, reps=None, xmax=50):
 			os.makedirs(str_savefolder)
 		str_savefile = 'alpha_' + datatype + '.tsv'
 		str_save = str_savefolder + str_savefile
-		np.savetxt(str_save,(X,alpha_mean,alpha_std),delimiter='\t',header='b\talpha_mean\talpha_std')	
+		if n_boot:
+			alpha_ci = np.array([results[b]['alpha_ci'] for b in binsize]).T
+			np.savetxt(str_save,(X,alpha_mean,alpha_std,alpha_ci[0],alpha_ci[1]),delimiter='\t',header='b\talpha_mean\talpha_std\talpha_ci_low\talpha_ci_high')
+		else:
+			np.savetxt(str_save,(X,alpha_mean,alpha_std),delimiter='\t',header='b\talpha_mean\talpha_std')
 
-def save_corr(data_dir, filename, d_list, binsize, threshold, bw_filter,reps=None):
+def _corr_rep(filepath, binsize, threshold, bw_filter):
 
-	#Parameters
-	elec_base = 0
-	bw_freqs = [0.1,200]
-	fs = 500
-	str_coarse = 'data/coarse'
-	str_sub = 'data/sub'
-	str_activity = 'data/activity'
+	#Correlations between all electrode pairs, for every binsize
+	return correlation.electrode_corr(filepath, binsize, threshold, bw_filter)
+
+def save_corr(data_dir, filename, d_list, binsize, threshold, bw_filter,reps=None,jobs=1):
+	"""Saves the correlations between the thresholded (coarse) and spike (sub) event counts of electrodes, for every inter-electrode distance dXX of a dataset.
+
+	The correlation matrix of all electrode pairs is computed once per repetition and binsize (see analysis.correlation). For every d and binsize, two files are written in [data_dir]/correlations/: the correlations and rates of the first electrode pair per repetition (the legacy output), and the correlation averaged over pairs and repetitions as a function of the distance between electrodes ('_corr_dist' files).
+	"""
 
 	#Definitions
 	save_dir = 'correlations/'
+	datatypes = ['coarse', 'sub']
 
 	#Parse input
 	if type(binsize) is not list:
 		binsize = [binsize]
 
-	#Runs for every binsize
-	for bs in binsize:
+	#Runs it for every d
+	for d in d_list:
 
-		#Runs it for every d
-		for d in d_list:
-			corr_coarse = np.zeros(reps)
-			corr_sub = np.zeros(reps)
-			rate_coarse = np.zeros(reps)
-			rate_sub = np.zeros(reps)
-
-			#Runs it for every rep
-			for i in range(reps):
-
-				#Loads coarse and sub data
-				filepath = data_dir + filename + 'd{:02d}_r{:02d}.hdf5'.format(d,i)
-				file = h5py.File(filepath,'r')
-				timesteps = file[str_activity].shape[0]
-
-				data_coarse = file[str_coarse][elec_base:elec_base+2,:]
-				data_sub = file[str_sub][elec_base:elec_base+2,:]
-
-				#Filters the signal
-				if bw_filter:
-					data_coarse[0,:] = avalanche.filter_bw_ch(data_coarse[0,:],bw_freqs,fs)
-					data_coarse[1,:] = avalanche.filter_bw_ch(data_coarse[1,:],bw_freqs,fs)
-
-				#Thresholds coarse data and bins data
-				data_coarse_bin_0 = avalanche.bin_data(avalanche.threshold_ch(data_coarse[0,:], threshold), bs)
-				data_coarse_bin_1 = avalanche.bin_data(avalanche.threshold_ch(data_coarse[1,:], threshold), bs)
-				data_sub_bin_0 = avalanche.bin_data(avalanche.convert_timestamps(data_sub[0,:],timesteps), bs)
-				data_sub_bin_1 = avalanche.bin_data(avalanche.convert_timestamps(data_sub[1,:],timesteps), bs)
-														
-				#Calculates correlations
-				corr_coarse[i] = np.corrcoef(data_coarse_bin_0, data_coarse_bin_1)[0,1]
-				corr_sub[i] = np.corrcoef(data_sub_bin_0, data_sub_bin_1)[0,1]
-
-				#Calculates rates
-				timescale_s = 2*1e-3*bs*data_coarse_bin_0.size
-				rate_coarse[i] = (np.sum(data_coarse_bin_0) + np.sum(data_coarse_bin_1))/2/timescale_s
-				rate_sub[i] = (np.sum(data_sub_bin_0) + np.sum(data_sub_bin_1))/2/timescale_s
-
-				file.close()	
-
-			print('d = {:02d}: coarse = {:0.2f} ({:0.2f} Hz), sub = {:0.2f} ({:0.2f} Hz)'.format(d,np.mean(corr_coarse), np.mean(rate_coarse),np.mean(corr_sub), np.mean(rate_sub[i])))
-
-			#Saves results
-			str_savefolder = data_dir + save_dir + '/'
-			if not os.path.exists(str_savefolder):
-				os.makedirs(str_savefolder)
+		#Correlation matrices of every rep, for all binsizes at once
+		tasks = [(data_dir + filename + 'd{:02d}_r{:02d}.hdf5'.format(d,i), binsize, threshold, bw_filter) for i in range(reps)]
+		results_reps = pool_map(_corr_rep, tasks, jobs)
+		dist = results_reps[0][1]
+
+		str_savefolder = data_dir + save_dir + '/'
+		if not os.path.exists(str_savefolder):
+			os.makedirs(str_savefolder)
+
+		for bs in binsize:
+			corr = {datatype: np.array([result[0][datatype]['corr'][bs] for result in results_reps]) for datatype in datatypes}
+			rate = {datatype: np.array([result[0][datatype]['rate'][bs] for result in results_reps]) for datatype in datatypes}
+
+			#Legacy output: first electrode pair
+			corr_coarse, corr_sub = corr['coarse'][:,0,1], corr['sub'][:,0,1]
+			rate_coarse, rate_sub = np.mean(rate['coarse'][:,:2], axis=1), np.mean(rate['sub'][:,:2], axis=1)
+			print('d = {:02d}, b = {:02d}: coarse = {:0.2f} ({:0.2f} Hz), sub = {:0.2f} ({:0.2f} Hz)'.format(d,bs,np.mean(corr_coarse), np.mean(rate_coarse),np.mean(corr_sub), np.mean(rate_sub)))
 			str_savefile = str_savefolder + filename + '_d{:02d}_b{:02d}_th{:0.1f}_rep{:02d}.tsv'.format(d,bs,threshold,reps)
 			with open(str_savefile, 'w') as f:
-				np.savetxt(f,(corr_coarse,corr_sub, rate_coarse, rate_sub),delimiter='\t',header='coarse\tsub\trate_coarse\trate_sub')	
+				np.savetxt(f,(corr_coarse,corr_sub, rate_coarse, rate_sub),delimiter='\t',header='coarse\tsub\trate_coarse\trate_sub')
+
+			#Correlation vs distance, averaged over pairs and reps
+			dist_pairs, corr_coarse_mean, corr_coarse_std, n_pairs = correlation.corr_vs_distance(np.nanmean(corr['coarse'], axis=0), dist)
+			_, corr_sub_mean, corr_sub_std, _ = correlation.corr_vs_distance(np.nanmean(corr['sub'], axis=0), dist)
+			str_savefile = str_savefolder + filename + '_d{:02d}_b{:02d}_th{:0.1f}_rep{:02d}_corr_dist.tsv'.format(d,bs,threshold,reps)
+			np.savetxt(str_savefile,(dist_pairs,corr_coarse_mean,corr_coarse_std,corr_sub_mean,corr_sub_std,n_pairs),delimiter='\t',header='dist\tcoarse_mean\tcoarse_std\tsub_mean\tsub_std\tn_pairs')
+
+def pipeline_tasks(data_dir, datasets, stages, threshold, binsize, bw_filter, reps=None):
+	"""Builds the task graph raw hdf5 -> thresholded hdf5 -> pS/alpha/mav/corr tsv files for a list of datasets (see analysis.pipeline).
+
+	Args:
+	    data_dir (str): Location of the hdf5 datasets
+	    datasets (list): Dataset names, without '_rXX.hdf5' (see parser.sim_find_unique)
+	    stages (list): Stages to run, from 'threshold', 'save_ps', 'save_ps_alpha', 'save_mav' and 'save_corr'. 'save_mav' and 'save_corr' apply to datasets ending in 'dXX', grouping all XX.
+	    threshold (float): Threshold to use
+	    binsize (list): Bin-sizes (in timesteps) to use for the avalanches
+	    bw_filter (bool): Whether to bandpass the coarse signal with a butterworth 4th order filter
+	    reps (None, optional): Number of repetitions (default: all '_rXX.hdf5' files of each dataset)
+
+	Returns:
+	    list: Tasks
+	"""
+
+	#Definitions
+	if bw_filter:
+		dir_threshold = 'thresholded_filtered/'
+		dir_analyzed = 'analyzed_filtered/'
+	else:
+		dir_threshold = 'thresholded_unfiltered/'
+		dir_analyzed = 'analyzed_unfiltered/'
+	datatypes = ['coarse', 'sub']
+
+	tasks = []
+	groups = {}
+	for filename in sorted(datasets):
+
+		#Repetitions and thresholded file of the dataset
+		reps_dataset = reps
+		if reps_dataset is None:
+			reps_dataset = len(glob.glob(data_dir + glob.escape(filename) + '_r[0-9][0-9].hdf5'))
+		filepath_raw = [data_dir + filename + '_r{:02d}.hdf5'.format(rep) for rep in range(reps_dataset)]
+		filename_th = filename + '_th{:0.1f}'.format(threshold)
+		filepath_th = data_dir + dir_threshold + filename_th + '.hdf5'
+		dir_save = data_dir + dir_analyzed + filename_th + '_rep{:02d}/'.format(reps_dataset)
+		deps = ['threshold:' + filename] if 'threshold' in stages else []
+
+		if 'threshold' in stages:
+			tasks.append(pipeline.task('threshold:' + filename, save_threshold,
+				kwargs={'data_dir': data_dir, 'filename': filename, 'threshold': threshold, 'reps': reps_dataset, 'bw_filter': bw_filter},
+				inputs=filepath_raw,
+				outputs=[filepath_th]))
+
+		if 'save_ps' in stages:
+			tasks.append(pipeline.task('save_ps:' + filename, save_ps,
+				kwargs={'data_dir': data_dir, 'filename': filename_th, 'binsize': binsize, 'bw_filter': bw_filter, 'reps': reps_dataset},
+				inputs=[filepath_th],
+				outputs=[dir_save + 'pS_' + datatype + '_b{:02d}.tsv'.format(b) for datatype in datatypes for b in binsize],
+				deps=deps))
+
+		if 'save_ps_alpha' in stages:
+			tasks.append(pipeline.task('save_ps_alpha:' + filename, save_ps_alpha,
+				kwargs={'data_dir': data_dir, 'filename': filename_th, 'binsize': binsize, 'bw_filter': bw_filter, 'reps': reps_dataset},
+				inputs=[filepath_th],
+				outputs=[dir_save + 'alpha_' + datatype + '.tsv' for datatype in datatypes],
+				deps=deps))
+
+		#Groups datasets differing only by the inter-electrode distance
+		match = re.match(r'^(.*)d(\d{2})$', filename)
+		if match is not None:
+			groups.setdefault(match.group(1), []).append((int(match.group(2)), filename, filepath_raw, filepath_th, reps_dataset))
+
+	for filename_base, group in sorted(groups.items()):
+		d_list = [entry[0] for entry in group]
+		reps_group = min([entry[4] for entry in group])
+
+		if 'save_mav' in stages:
+			deps = ['threshold:' + entry[1] for entry in group] if 'threshold' in stages else []
+			tasks.append(pipeline.task('save_mav:' + filename_base, save_mav,
+				kwargs={'data_dir': data_dir, 'filename': filename_base, 'd_list': d_list, 'binsize': binsize, 'threshold': threshold, 'bw_filter': bw_filter},
+				inputs=[entry[3] for entry in group],
+				outputs=[data_dir + dir_analyzed + 'branching_mav/' + filename_base + 'b{:02d}_th{:0.1f}.tsv'.format(b, threshold) for b in binsize],
+				deps=deps))
+
+		if 'save_corr' in stages:
+			tasks.append(pipeline.task('save_corr:' + filename_base, save_corr,
+				kwargs={'data_dir': data_dir, 'filename': filename_base, 'd_list': d_list, 'binsize': binsize, 'threshold': threshold, 'bw_filter': bw_filter, 'reps': reps_group},
+				inputs=[path for entry in group for path in entry[2][:reps_group]],
+				outputs=[data_dir + 'correlations//' + filename_base + '_d{:02d}_b{:02d}_th{:0.1f}_rep{:02d}'.format(d, b, threshold, reps_group) + suffix for d in d_list for b in binsize for suffix in ['.tsv', '_corr_dist.tsv']]))
+
+	return tasks
 
 if __name__ == "__main__":
 
@@ -425,6 +496,11 @@ if __name__ == "__main__":
 	datafolder = args.datafolder
 	datamask   = args.datamask
 	bw_filter  = args.bw_filter
+	chunk_size = args.chunk_size
+	jobs       = args.jobs
+	stages     = args.stages
+	force      = args.force
+	n_boot     = args.n_boot
 
 	#Does the requested operation
 	if mode == 'save_plot':
@@ -447,7 +523,9 @@ if __name__ == "__main__":
 				filename=dataset_list[i],
 				threshold=threshold,
 				reps=reps,
-				bw_filter=bw_filter)
+				bw_filter=bw_filter,
+				chunk_size=chunk_size,
+				jobs=jobs)
 
 	elif mode == 'save_ps':
 		dataset_list = parser.sim_find_thresholded(datafolder, bw_filter, datamask)
@@ -456,7 +534,8 @@ if __name__ == "__main__":
 			save_ps(datafolder,
 				filename=dataset_list[i],
 				binsize=binsize,
-				bw_filter=bw_filter)
+				bw_filter=bw_filter,
+				jobs=jobs)
 
 	elif mode == 'save_ps_alpha':
 		dataset_list = parser.sim_find_thresholded(datafolder, bw_filter, datamask)
@@ -465,7 +544,9 @@ if __name__ == "__main__":
 			save_ps_alpha(datafolder,
 				filename=dataset_list[i],
 				binsize=binsize,
-				bw_filter=bw_filter)
+				bw_filter=bw_filter,
+				jobs=jobs,
+				n_boot=n_boot)
 
 	elif mode == 'save_mav':
 		dataset_list, d_list = parser.sim_find_thresholded_no_d(datafolder, bw_filter, datamask)
@@ -476,7 +557,9 @@ if __name__ == "__main__":
 				d_list=d_list,
 				binsize=binsize,
 				threshold=threshold,
-				bw_filter=bw_filter)		
+				bw_filter=bw_filter,
+				jobs=jobs,
+				n_boot=n_boot)
 
 	elif mode == 'save_corr':
 		dataset_list,d_list = parser.sim_find_unique_no_d(datafolder)
@@ -489,4 +572,10 @@ if __name__ == "__main__":
 				binsize=binsize,
 				threshold=threshold,
 				bw_filter=bw_filter,
-				reps=reps)
\ No newline at end of file
+				reps=reps,
+				jobs=jobs)
+
+	elif mode == 'pipeline':
+		dataset_list = parser.sim_find_unique(datafolder, datamask)
+		tasks = pipeline_tasks(datafolder, dataset_list, stages, threshold, binsize, bw_filter)
+		pipeline.run(tasks, datafolder + '.pipeline/', jobs=jobs, force=force)
@@ -1,41 +1,28 @@
 import os
-import numpy as np
-from itertools import product
 import multiprocessing as mp
+from itertools import product
+from analysis import parser, pipeline
+from run_analysis import pipeline_tasks
 
-def run_cmd(m, h, de):
-
-    if (l_m.index(m) != l_h.index(h)): return
-
-    mask = f"'m{m:.5f}_h{h:.3e}_d{de:02d}'"
-
-    # cmd = f"python ./run_analysis.py --mode threshold --bw_filter True --reps 50 --datafolder ../dat/ --datamask {mask}"
-    # os.system(cmd)
-    # print(f"{cmd} done")
-
-    # cmd = f"python ./run_analysis.py --mode save_ps -b '1,2,4,8,16,32' --bw_filter True --datafolder ../dat/ --datamask {mask}"
-    # os.system(cmd)
-    # print(f"{cmd} done")
-
-    cmd = f"python ./run_analysis.py --mode save_ps_alpha -b '1,2,4,8,16,32' --bw_filter True --datafolder ../dat/ --datamask {mask}"
-    os.system(cmd)
-    print(f"{cmd} done")    
-
-    return mask
+if __name__ == "__main__":
 
-# set directory to the location of this script file to use relative paths
-os.chdir(os.path.dirname(__file__))
+    # set directory to the location of this script file to use relative paths
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
-l_m = [   0.0,    0.9,   0.98,  0.996,  0.999]
-l_h = [2.0e-3, 2.0e-4, 4.0e-5, 8.0e-6, 2.0e-6]
-l_de = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    datafolder = '../dat/'
+    stages = ['threshold', 'save_ps', 'save_ps_alpha']
+    binsize = [1, 2, 4, 8, 16, 32]
+    threshold = 3
+    bw_filter = True
 
-arg_list = product(l_m, l_h, l_de)
-print(arg_list)
+    l_m = [   0.0,    0.9,   0.98,  0.996,  0.999]
+    l_h = [2.0e-3, 2.0e-4, 4.0e-5, 8.0e-6, 2.0e-6]
+    l_de = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
 
-num_proc = 4
-if mp.cpu_count() is not None:
-    num_proc = mp.cpu_count()
+    # m and h are paired, de spans all values
+    masks = [f"m{m:.5f}_h{h:.3e}_d{de:02d}" for (m, h), de in product(zip(l_m, l_h), l_de)]
+    datasets = sorted(set(d for mask in masks for d in parser.sim_find_unique(datafolder, mask)))
 
-with mp.Pool(processes=num_proc) as pool:
-    results = pool.starmap(run_cmd, arg_list)
+    # only stages whose inputs changed are rerun, e.g. adding a de value only analyzes its datasets
+    tasks = pipeline_tasks(datafolder, datasets, stages, threshold, binsize, bw_filter)
+    pipeline.run(tasks, datafolder + '.pipeline/', jobs=mp.cpu_count() or 4)
@@ -92,15 +92,17 @@ class electrode_sampling {
     at_history.reserve(par.cache);
   }
 
-  // set the neuron contributions based on the topology
+  // set the neuron contributions based on the topology, stored in the
+  // network as a [neurons x electrodes] array
   template <typename TOPOLOGY>
-  void set_contributions(vec <neuron *> &neurons, TOPOLOGY &tp) {
+  void set_contributions(vec <neuron *> &neurons, network &net,
+                         TOPOLOGY &tp) {
     printf("setting contributions to electrodes\n");
 
+    net.contributions.assign(neurons.size()*electrodes.size(), 0.);
     for (size_t i = 0; i < neurons.size(); i++) {
       neuron *src = neurons[i];
       // electrode contributions and (alternative) minimum distance fix
-      src->electrode_contributions.reserve(electrodes.size());
       for (size_t k = 0; k < electrodes.size(); k++) {
         electrode *e = electrodes[k];
         double rik_squ = tp.get_dist_squ(src, e);
@@ -113,7 +115,7 @@ class electrode_sampling {
 
         // coarse sampling contribution
         double irik = pow(rik_squ, par.gamma/2.);
-        src->electrode_contributions.push_back(irik);
+        net.contributions[i*electrodes.size()+k] = irik;
 
         // subsampling closest neurons
         if (rik_squ < e->closest_neuron_distance_squ) {
@@ -214,6 +216,22 @@ class electrode_sampling {
     at_last = num_active;
   }
 
+  // same as n calls of measure_step(time, 0, true) in a row, without
+  // activity. electrodes were reset by the last call of measure_step
+  inline void measure_quiet_steps(size_t n) {
+    if (n == 0) return;
+    update_act_hist(at_hist_2d, at_last, 0);
+    if (n > 1) {
+      update_act_hist(at_hist_2d, 0, 0);
+      at_hist_2d[0][0] += n-2;
+    }
+    at_history.insert(at_history.end(), n, 0);
+    for (size_t i = 0; i < electrodes.size(); i++) {
+      cs_histories[i].insert(cs_histories[i].end(), n, real_t(0.));
+    }
+    at_last = 0;
+  }
+
   ~electrode_sampling() {
     if (h5dset_cs > 0) H5Dclose(h5dset_cs);
     if (h5dset_ss > 0) H5Dclose(h5dset_ss);
@@ -234,20 +252,35 @@ class dynamic_branching {
     double h      = 4e-5;   // drive (probability for spontaneous activation)
   } par;
 
-  // we need the neuron (and electrode) vector in order to update things
+  // we need the neuron (and electrode) vector in order to update things,
+  // connections and contributions are read from the network
   vec <neuron *>    &neurons;
+  network           &net;
   vec <electrode *> &electrodes;
 
-  // keep track of active neurons
-  std::deque <neuron *> active_neurons;
+  // keep track of active neurons (ids). a neuron is active in the current
+  // step if its entry in active_step equals step, so that neurons do not
+  // need to be reset
+  vec <uint32_t> active_neurons;
+  vec <uint32_t> active_step;
+  uint32_t step = 1;
   size_t num_active_new = 0;
   size_t num_active_old = 0;
 
-  dynamic_branching(vec <neuron *> &n_,
+  // spread by skipping connections (see spread_skipping), if possible
+  bool skip_connections = false;
+
+  // spontaneous activations are drawn over the sequence of all neurons in
+  // all time steps: number of neurons until the next one, from the first
+  // neuron of the next step
+  size_t drive_next = 0;
+
+  dynamic_branching(vec <neuron *> &n_, network &net_,
                     vec <electrode *> &e_, double m_, double h_) :
-    neurons(n_), electrodes(e_) {
+    neurons(n_), net(net_), electrodes(e_) {
     par.m = m_;
     par.h = h_;
+    active_step.resize(neurons.size(), 0);
     printf("setting up dynamics\n\tcoalesence compensation: ");
     #ifdef NOCC
     printf("No\n");
@@ -256,34 +289,28 @@ class dynamic_branching {
     #endif
     printf("\tm: %.3e\n", par.m);
     printf("\th: %.3e\n", par.h);
+    if (par.h > 0.) {
+      set_gdis_param(std::min(par.h, 1.));
+      drive_next = gdis(rng);
+    }
   }
 
   // multiply all outgoing probabilities with par.m
-  void scale_activation_probabilities(vec <neuron *> &neurons) {
+  void scale_activation_probabilities() {
     printf("scaling activation probabilities to m = %.2f\n", par.m);
-    for (size_t i = 0; i < neurons.size(); i++) {
-      neuron *src = neurons[i];
-      for (size_t j = 0; j < src->outgoing_probability.size(); j++) {
-        src->outgoing_probability[j] *= par.m;
-      }
+    for (size_t c = 0; c < net.probability.size(); c++) {
+      net.probability[c] *= par.m;
     }
 
     // consistency checks and some insight into how local connectivity is
     // integrated probability, should equal one
     double k0 = 0., k1=0., k2=0., k3=0., p = 0.;
-    for (size_t i = 0; i < neurons.size(); i++) {
-      neuron *src = neurons[i];
+    for (size_t i = 0; i < net.size(); i++) {
       double p_temp = 0.;
-      for (size_t j = 0; j < src->outgoing.size(); j++) {
-        if (src->outgoing_probability.size() == 1) {
-          // all connections share same probability (orlandi topology)
-          p_temp += src->outgoing_probability[0];
-          // printf("%lu %lu %.4f\n", i, j, src->outgoing_probability[0]);
-        } else {
-          // different prob for every connection (local gauss topology)
-          p_temp += src->outgoing_probability[j];
-          // printf("%lu %lu %.4f\n", i, j, src->outgoing_probability[0]);
-        }
+      for (size_t j = 0; j < net.degree(i); j++) {
+        // same probability for all connections (orlandi topology) or
+        // different prob for every connection (local gauss topology)
+        p_temp += net.get_probability(i, j);
         if (p_temp < 1./3./par.m) k0 += 1;
         if (p_temp < 1./2./par.m) k1 += 1;
         if (p_temp < 2./3./par.m) k2 += 1;
@@ -291,11 +318,23 @@ class dynamic_branching {
       }
       p += p_temp;
     }
-    p  /= double(neurons.size());
-    k0 /= double(neurons.size());
-    k1 /= double(neurons.size());
-    k2 /= double(neurons.size());
-    k3 /= double(neurons.size());
+    p  /= double(net.size());
+
+    // skipping connections needs non-increasing probabilities
+    skip_connections = true;
+    for (size_t i = 0; i < net.size(); i++) {
+      for (size_t j = 1; j < net.degree(i); j++) {
+        if (net.get_probability(i, j) > net.get_probability(i, j-1))
+          skip_connections = false;
+      }
+    }
+    printf("\tspreading: %s\n",
+           skip_connections ? "skipping connections" : "per connection");
+
+    k0 /= double(net.size());
+    k1 /= double(net.size());
+    k2 /= double(net.size());
+    k3 /= double(net.size());
     printf("\tintegrated probability per neuron: %.2f\n", p);
     printf("\tnumber of connections responsible for probability:\n");
     printf("\t\tp 1/3 ~ %.2f | p 1/2 ~ %.2f | p 2/3 ~ %.2f | p 1 ~ %.2f \n",
@@ -303,16 +342,87 @@ class dynamic_branching {
     // would be good to do the same for the distance to the kth neuron
   }
 
-  inline void activate_neuron(neuron *n) {
+  inline bool is_active(size_t n) {
+    return active_step[n] == step;
+  }
+
+  inline void activate_neuron(size_t n) {
     // manually check not to activate already active neurons!
-    n->active = true;
+    active_step[n] = step;
     num_active_new += 1;
-    active_neurons.push_back(n);
+    active_neurons.push_back(uint32_t(n));
     // update electrodes
+    const float *contributions = &net.contributions[n*electrodes.size()];
     for (size_t i = 0; i < electrodes.size(); i++) {
       electrode *e = electrodes[i];
-      e->cs_signal += n->electrode_contributions[i];
-      if (e->closest_neuron == n) e->ss_signal = true;
+      e->cs_signal += contributions[i];
+      if (e->closest_neuron == neurons[n]) e->ss_signal = true;
+    }
+  }
+
+  // connection j of src was drawn to activate. moves j along if the
+  // activation is reassigned to a farther connection
+  inline void activate_target(size_t src, size_t &j, size_t &num_recurrent) {
+    const uint32_t *outgoing = &net.targets[net.offsets[src]];
+    #ifdef NOCC
+    // simple recurrent activations. if target already active, skip.
+    if (!is_active(outgoing[j])) {
+      activate_neuron(outgoing[j]);
+    }
+    #else
+    // coalesence compensation
+    // if random number says to activate, try current target.
+    // if current target already active, try the next closest (farther)
+    // connected neuron until successful or no more candidates
+    size_t num_outgoing = net.degree(src);
+    if (!is_active(outgoing[j])) {
+      activate_neuron(outgoing[j]);
+      num_recurrent += 1;
+    } else if (num_recurrent < num_outgoing) {
+      bool reassigned = false;
+      while (!reassigned && j+1 < num_outgoing) {
+        j += 1;
+        if (!is_active(outgoing[j])) {
+          activate_neuron(outgoing[j]);
+          num_recurrent += 1;
+          reassigned = true;
+        }
+      }
+    } else {
+      printf("\n\n num recurrenct reached limit! src id: %lu\n\n", src);
+    }
+    #endif
+  }
+
+  // one random number for every outgoing connection
+  inline void spread_per_connection(size_t src) {
+    size_t num_recurrent = 0;
+    for (size_t j = 0; j < net.degree(src); j++) {
+      if (udis(rng) < net.get_probability(src, j)) {
+        activate_target(src, j, num_recurrent);
+      }
+    }
+  }
+
+  // same statistics as spread_per_connection, drawing only ~m numbers.
+  // needs probabilities that do not increase along the (distance sorted)
+  // connections: from connection j, the number of connections skipped until
+  // the next candidate is geometric with p_j, which bounds all following
+  // probabilities, and the candidate k is accepted with p_k/p_j (thinning)
+  inline void spread_skipping(size_t src) {
+    size_t num_recurrent = 0;
+    size_t num_outgoing  = net.degree(src);
+    size_t j = 0;
+    while (j < num_outgoing) {
+      double p_bound = std::min(net.get_probability(src, j), 1.);
+      if (p_bound <= 0.) break;
+      j += gdis(rng, std::geometric_distribution<size_t>::param_type(p_bound));
+      if (j >= num_outgoing) break;
+      double p_j = net.get_probability(src, j);
+      if (p_j >= p_bound || udis(rng)*p_bound < p_j) {
+        activate_target(src, j, num_recurrent);
+      }
+      j += 1;
     }
   }
 
@@ -326,60 +436,29 @@ class dynamic_branching {
     num_active_old     = num_active_new;
     num_active_new     = 0;
 
-    // spontanious activation and resetting
-    for (size_t i = 0; i < neurons.size(); i++) {
-      if (udis(rng) < par.h) {
-        activate_neuron(neurons[i]);
-      } else {
-        neurons[i]->active = false;
+    // resetting. neurons of the last step are no longer active in a new
+    // step. only when the step counter wraps around, reset explicitly
+    step += 1;
+    if (step == 0) {
+      std::fill(active_step.begin(), active_step.end(), 0);
+      step = 1;
+    }
+
+    // spontanious activation. instead of one random number per neuron, draw
+    // the (geometric) number of neurons skipped until the next activation.
+    // same statistics and order, but cost ~ N*h instead of N
+    if (par.h > 0.) {
+      while (drive_next < neurons.size()) {
+        activate_neuron(drive_next);
+        drive_next += 1 + gdis(rng);
       }
+      drive_next -= neurons.size();
     }
 
     // spread activity. if active, no activation possible
     for (size_t i = 0; i < num_active_old; i++) {
-      neuron *src = active_neurons[i];
-      size_t num_recurrent = 0;
-      for (size_t j = 0; j < src->outgoing.size(); j++) {
-        double p_threshold;
-        if (src->outgoing_probability.size() == 1)
-          // same probability for all outgoing connections
-          p_threshold = src->outgoing_probability[0];
-        else
-          // different probability for every outgoing connection
-          p_threshold = src->outgoing_probability[j];
-        #ifdef NOCC
-        // simple recurrent activations. if target already active, skip.
-        if (!src->outgoing[j]->active
-            && udis(rng) < p_threshold) {
-          activate_neuron(src->outgoing[j]);
-        }
-        #else
-        // coalesence compensation
-        // if random number says to activate, try current target.
-        // if current target already active, try the next closest (farther)
-        // connected neuron until successful or no more candidates
-        if (udis(rng) < p_threshold) {
-          if (!src->outgoing[j]->active) {
-            activate_neuron(src->outgoing[j]);
-            num_recurrent += 1;
-          } else if (num_recurrent < src->outgoing.size()) {
-            bool reassigned = false;
-            while (!reassigned && j+1 < src->outgoing.size()) {
-              j += 1;
-              if (!src->outgoing[j]->active) {
-                activate_neuron(src->outgoing[j]);
-                num_recurrent += 1;
-                reassigned = true;
-              }
-            }
-          } else {
-            printf("\n\n num recurrenct reached limit! src id: %lu\n\n",
-                   src->id);
-          }
-        }
-        #endif
-
-      }
+      if (skip_connections) spread_skipping(active_neurons[i]);
+      else                  spread_per_connection(active_neurons[i]);
     }
     assert(active_neurons.size() == num_active_new+num_active_old);
 
@@ -391,6 +470,16 @@ class dynamic_branching {
     num_active = num_active_new;
   }
 
+  // without active neurons, the following steps stay quiet until the next
+  // spontaneous activation. skips them and returns their number (only call
+  // if the last step had no active neurons)
+  inline size_t skip_quiet_steps(size_t max_steps) {
+    if (par.h <= 0.) return max_steps;
+    size_t num_quiet = std::min(drive_next/neurons.size(), max_steps);
+    drive_next -= num_quiet*neurons.size();
+    return num_quiet;
+  }
+
   void write_dynamic_details(hid_t h5file) {
     if (h5file < 0) {
       printf("invalid h5file, no dynamic details written");
@@ -2,26 +2,23 @@
 #define FPS_NEURO_TYPES
 
 #include <vector>
+#include <limits>
+#include <cstdint>
 
 class electrode;
 class neuron {
  public:
-  bool   active;
   double x;
   double y;
   double R_d;       // [um] radius of dendritic tree
   double l;         // [um] total length of the axon
   size_t id;        // needs to match index of neuron in the vector!
-  std::vector< neuron * >    outgoing;
+  // failed connection attempts (orlandi), connections are in the network
   std::vector< neuron * >    rejected;
-  std::vector< double >      outgoing_probability;
-  std::vector< electrode * > electrodes;
-  std::vector< double >      electrode_contributions;
 
   neuron(size_t id_ = 0,
          double x_ = std::numeric_limits<double>::max(),
          double y_ = std::numeric_limits<double>::max()) {
-    active = false;
     x = x_;
     y = y_;
     id = id_;
@@ -48,4 +45,37 @@ class electrode {
   }
 };
 
+// compact store of the connections (compressed sparse rows) and of the
+// electrode contributions of all neurons. connections of neuron i, sorted by
+// distance, are targets[offsets[i]] to targets[offsets[i+1]-1]
+class network {
+ public:
+  std::vector< size_t >   offsets;        // N+1 row offsets
+  std::vector< uint32_t > targets;        // target id of every connection
+  std::vector< float >    probability;    // per connection, or per neuron
+  bool per_connection = true;             // if all connections of a neuron
+                                          // share their probability: false
+  std::vector< float >    contributions;  // [N*NE] spike contribution to
+                                          // the electrodes (coarse signal)
+
+  void clear(size_t num_connections = 0) {
+    std::vector< size_t >().swap(offsets);
+    std::vector< uint32_t >().swap(targets);
+    std::vector< float >().swap(probability);
+    offsets.push_back(0);
+    targets.reserve(num_connections);
+    if (per_connection) probability.reserve(num_connections);
+  }
+
+  inline size_t size() { return offsets.size()-1; }
+
+  inline size_t degree(size_t i) { return offsets[i+1]-offsets[i]; }
+
+  // probability of the j-th connection of neuron i
+  inline double get_probability(size_t i, size_t j) {
+    if (per_connection) return probability[offsets[i]+j];
+    else                return probability[i];
+  }
+};
+
 #endif
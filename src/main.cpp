@@ -79,6 +79,7 @@ int main(int argc, char *argv[]) {
   double sys_size, xy_offset;
   size_t cc;
   std::vector<neuron *> neurons;
+  network net;
 
   init_rng(1000+seed);
   h5file = hdf5_create_file(path);
@@ -118,9 +119,9 @@ int main(int argc, char *argv[]) {
   tpl.par.std = sigma;
   #endif
   if (write_detail > 0)
-    tpl.init(neurons, h5file, sam.electrodes, pow(sam.par.d_zone, 2.));
+    tpl.init(neurons, net, h5file, sam.electrodes, pow(sam.par.d_zone, 2.));
   else
-    tpl.init(neurons, -1, sam.electrodes, pow(sam.par.d_zone, 2.));
+    tpl.init(neurons, net, -1, sam.electrodes, pow(sam.par.d_zone, 2.));
   tpl.print_parameters();
 
   // check that electrode array is within the culture
@@ -133,18 +134,18 @@ int main(int argc, char *argv[]) {
   }
 
   // set contribution strength of spikes to electrode signals
-  sam.set_contributions(neurons, tpl);
+  sam.set_contributions(neurons, net, tpl);
 
   // set up dynamics and adjust recurrent activation probability to m
-  auto dyn = dynamic_branching(neurons, sam.electrodes, m_micro, h);
-  dyn.scale_activation_probabilities(neurons);
+  auto dyn = dynamic_branching(neurons, net, sam.electrodes, m_micro, h);
+  dyn.scale_activation_probabilities();
 
   // write details to file
   sam.write_sampling_details(h5file);
   dyn.write_dynamic_details(h5file);
   tpl.write_topology_details(h5file);
   if (write_detail > 0) {
-    tpl.write_connectivty_matrix(neurons, h5file);
+    tpl.write_connectivty_matrix(neurons, net, h5file);
     tpl.write_neuron_details(neurons, h5file);
   }
 
@@ -157,7 +158,7 @@ int main(int argc, char *argv[]) {
 
   // hack to save some time by initializing to target activity of 1Hz
   for (size_t i = 0; i < size_t(1.*neurons.size()*delta_t/1000.); i++) {
-    dyn.activate_neuron(neurons.at(size_t(udis(rng)*neurons.size())));
+    dyn.activate_neuron(size_t(udis(rng)*neurons.size()));
   }
 
   printf("thermalizing for %.0e steps\n", thrm_steps);
@@ -167,6 +168,7 @@ int main(int argc, char *argv[]) {
   }
 
   size_t num_active;
+  size_t print_steps = std::max(size_t(time_steps*5./100.), size_t(1));
   printf("simulating for %.0e time steps\n", time_steps);
   for (size_t i = 0; i < size_t(time_steps); i++) {
     if(is_percent(i, size_t(time_steps), 5.) || have_passed_hours(6.)) {
@@ -186,6 +188,26 @@ int main(int argc, char *argv[]) {
       sam.write_histories();
       reset_act_hist(sam.at_hist_2d);
     }
+
+    // event driven: without activity, jump to the next spontaneous
+    // activation, filling the histories up to each write. stops before the
+    // next progress message (every 5%)
+    if (num_active == 0) {
+      size_t next_print = (i/print_steps+1)*print_steps;
+      size_t num_quiet  = dyn.skip_quiet_steps(
+                            std::min(size_t(time_steps), next_print)-i-1);
+      while (num_quiet > 0) {
+        size_t n = std::min(num_quiet,
+                            sam.par.cache - i%sam.par.cache);
+        sam.measure_quiet_steps(n);
+        i += n;
+        num_quiet -= n;
+        if(i%sam.par.cache==0) {
+          sam.write_histories();
+          reset_act_hist(sam.at_hist_2d);
+        }
+      }
+    }
   }
   sam.write_histories();
 
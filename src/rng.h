@@ -14,6 +14,7 @@ std::uniform_real_distribution<> udis(0, 1);
 std::normal_distribution<>       ndis(0, 1);
 std::binomial_distribution<int>  bdis(10, 0.5);
 std::weibull_distribution<>      rdis(2.0, 1.0);  // rayligh distribution
+std::geometric_distribution<size_t> gdis(0.5);    // failures before success
 
 void init_rng(int seed=314) {
   rng.seed(seed);
@@ -32,6 +33,10 @@ inline void set_ndis_param(double mean, double std) {
   ndis.param(std::normal_distribution<>::param_type(mean, std));
 }
 
+inline void set_gdis_param(double p) {
+  gdis.param(std::geometric_distribution<size_t>::param_type(p));
+}
+
 // convert parameters from weibull to rayligh distribution
 inline void set_rdis_param(double std) {
   double a = 2.0;
@@ -90,7 +90,7 @@ class topology_local_gauss {
   // ------------------------------------------------------------------ //
 
   template <typename T1>
-  void init(vec <neuron *> &neurons, hid_t h5file, const vec <T1 *> &avoid_xy, double avoid_radius_squ) {
+  void init(vec <neuron *> &neurons, network &net, hid_t h5file, const vec <T1 *> &avoid_xy, double avoid_radius_squ) {
 
     // need to add a check that it is possible to distribute all the neurons
     // in the given space
@@ -126,54 +126,71 @@ class topology_local_gauss {
       neurons.push_back(n);
     }
 
-    // create physical connections with hard limit given by par.d_max
+    // cell list: neurons sorted into a periodic grid of cells at least d_max
+    // wide, so partners are within the 3x3 cells around the source. with
+    // fewer than 3 cells per side, one cell holds all neurons
+    size_t nc = size_t(par.L/par.d_max);
+    if (nc < 3) nc = 1;
+    vec < vec <neuron *> > cells(nc*nc);
+    vec <size_t> cell_x(neurons.size()), cell_y(neurons.size());
+    for (size_t i = 0; i < neurons.size(); i++) {
+      cell_x[i] = std::min(size_t(neurons[i]->x/par.L*nc), nc-1);
+      cell_y[i] = std::min(size_t(neurons[i]->y/par.L*nc), nc-1);
+      cells[cell_y[i]*nc+cell_x[i]].push_back(neurons[i]);
+    }
+    int nb = (nc == 1) ? 0 : 1;
+
+    // create physical connections with hard limit given by par.d_max,
+    // written directly to the network with their activation probabilities
+    // (synapctic weight, effective interaction radius) set via std (sigma)
     printf("connecting neurons with radius %.2e [um]\n", par.d_max);
+    printf("\tcell list: %lux%lu cells\n", nc, nc);
+    if (neurons.size() > std::numeric_limits<uint32_t>::max()) {
+      printf("too many neurons for the network store\n");
+      exit(-1);
+    }
     double dist_squ_limit  = par.d_max*par.d_max;
+    double sigma_squ       = 2.*pow(par.std*par.d_N, 2.);
     size_t num_connections = 0;
+    net.per_connection = true;
+    net.clear(size_t(neurons.size()*par.K*1.05));
     for (size_t i = 0; i < neurons.size(); i++) {
       neuron *src = neurons[i];
       vec <std::pair <double, neuron *> > sortable;
       sortable.reserve(size_t(par.K*1.1));
 
-      for (size_t j = 0; j < neurons.size(); j++) {
-        neuron *tar = neurons[j];
-        if (src == tar) continue;
-        double dist_squ = get_dist_squ(src, tar);
-        if (dist_squ < dist_squ_limit) {
-          sortable.push_back( std::make_pair(dist_squ, tar) );
-          num_connections += 1;
+      for (int dy = -nb; dy <= nb; dy++) {
+        for (int dx = -nb; dx <= nb; dx++) {
+          size_t cx = (cell_x[i] + nc + dx) % nc;
+          size_t cy = (cell_y[i] + nc + dy) % nc;
+          vec <neuron *> &cell = cells[cy*nc+cx];
+          for (size_t j = 0; j < cell.size(); j++) {
+            neuron *tar = cell[j];
+            if (src == tar) continue;
+            double dist_squ = get_dist_squ(src, tar);
+            if (dist_squ < dist_squ_limit) {
+              sortable.push_back( std::make_pair(dist_squ, tar) );
+              num_connections += 1;
+            }
+          }
         }
       }
-      // sort outgoing connections by distance
+      // sort outgoing connections by distance (independent of the order in
+      // which candidates were found)
       sort(sortable.begin(), sortable.end());
-      src->outgoing.reserve(sortable.size());
-      for (size_t j = 0; j < sortable.size(); j++)
-        src->outgoing.push_back(sortable[j].second);
-
-      if(i==0 || is_percent(i, size_t(neurons.size()), 10.)) {
-        printf("\t%s, %lu/%lu\n", time_now().c_str(), i, neurons.size());
-      }
-    }
 
-    // set synapctic weight (effective interaction radius) via std (sigma)
-    double sigma_squ = 2.*pow(par.std*par.d_N, 2.);
-    for (size_t i = 0; i < neurons.size(); i++) {
-      neuron *src   = neurons[i];
-      size_t n_cout = src->outgoing.size();
-      src->outgoing_probability.reserve(n_cout);
+      // activation probabilities based on distance, normalized
       double norm = 0.;
-
-      // activation probabilities based on distance
-      for (size_t j = 0; j < n_cout; j++) {
-        double dij_squ = get_dist_squ(src, src->outgoing[j]);
-        double pij     = exp(-dij_squ/sigma_squ);
-        src->outgoing_probability.push_back(pij);
-        norm += pij;
+      for (size_t j = 0; j < sortable.size(); j++)
+        norm += exp(-sortable[j].first/sigma_squ);
+      for (size_t j = 0; j < sortable.size(); j++) {
+        net.targets.push_back(uint32_t(sortable[j].second->id));
+        net.probability.push_back(exp(-sortable[j].first/sigma_squ)/norm);
       }
+      net.offsets.push_back(net.targets.size());
 
-      // normalize probabilities
-      for (size_t j = 0; j < n_cout; j++) {
-        src->outgoing_probability[j] /= norm;
+      if(i==0 || is_percent(i, size_t(neurons.size()), 10.)) {
+        printf("\t%s, %lu/%lu\n", time_now().c_str(), i, neurons.size());
       }
     }
 
@@ -186,27 +203,27 @@ class topology_local_gauss {
     printf("\tconnections created within: d_max=%.2e [um]\n", par.d_max);
     printf("\taverage distance between nearest neighbours: %.2e [um]\n", par.d_N);
     printf("\t\t(measured: %e)\n",
-           measure_avg_nearest_neighbour_distance(neurons));
+           measure_avg_nearest_neighbour_distance(neurons, net));
   }
 
   // constructor overload. call init after setting custom parameters
-  void init(vec <neuron *> &neurons, hid_t h5file = -1) {
+  void init(vec <neuron *> &neurons, network &net, hid_t h5file = -1) {
     vec <neuron *> placeholder;
-    init(neurons, h5file, placeholder, 0.0);
+    init(neurons, net, h5file, placeholder, 0.0);
   }
 
   // ------------------------------------------------------------------ //
   // debug helper
   // ------------------------------------------------------------------ //
 
-  double measure_avg_nearest_neighbour_distance(vec <neuron *> &neurons) {
+  double measure_avg_nearest_neighbour_distance(vec <neuron *> &neurons,
+                                                network &net) {
     double avg_dist = 0;
     for (size_t i = 0; i < neurons.size(); i++) {
       double shortest_distance = std::numeric_limits<double>::max();
-      for (size_t j = 0; j < neurons[i]->outgoing.size(); j++) {
-        // if (neurons[i] == j) continue;
-        assert(neurons[i] != neurons[i]->outgoing[j]);
-        double d = get_dist_squ(neurons[i], neurons[i]->outgoing[j]);
+      for (size_t c = net.offsets[i]; c < net.offsets[i+1]; c++) {
+        assert(i != net.targets[c]);
+        double d = get_dist_squ(neurons[i], neurons[net.targets[c]]);
         if (d < shortest_distance) shortest_distance = d;
       }
       avg_dist += sqrt(shortest_distance);
@@ -215,11 +232,12 @@ class topology_local_gauss {
     return avg_dist;
   }
 
-  double measure_avg_connection_length(vec <neuron *> &neurons) {
+  double measure_avg_connection_length(vec <neuron *> &neurons,
+                                       network &net) {
     double avg_dist = 0;
     for (size_t i = 0; i < neurons.size(); i++) {
-      for (size_t j = 0; j < neurons[i]->outgoing.size(); j++) {
-        double d = get_dist_squ(neurons[i], neurons[i]->outgoing[j]);
+      for (size_t c = net.offsets[i]; c < net.offsets[i+1]; c++) {
+        double d = get_dist_squ(neurons[i], neurons[net.targets[c]]);
         avg_dist += sqrt(d);
       }
     }
@@ -269,14 +287,15 @@ class topology_local_gauss {
     }
   }
 
-  void write_connectivty_matrix(vec <neuron *> &neurons, hid_t h5file) {
+  void write_connectivty_matrix(vec <neuron *> &neurons, network &net,
+                                hid_t h5file) {
     hid_t h5_matrix = hdf5_create_appendable_nd(
                           h5file, "/connectivity_matrix", H5T_NATIVE_HSIZE,
                           neurons.size(), neurons.size());
     for (size_t i = 0; i < neurons.size(); i++) {
       vec <size_t> row(neurons.size(), 0);
-      for (size_t j = 0; j < neurons[i]->outgoing.size(); j++)
-        row[ neurons[i]->outgoing[j]->id ] = 1;
+      for (size_t c = net.offsets[i]; c < net.offsets[i+1]; c++)
+        row[ net.targets[c] ] = 1;
       hdf5_append_nd(h5_matrix, row, H5T_NATIVE_HSIZE, i, 0);
     }
     H5Dclose(h5_matrix);
@@ -167,7 +167,7 @@ class topology_orlandi {
   // ------------------------------------------------------------------ //
 
   template <typename T1>
-  void init(vec <neuron *> &neurons, hid_t h5file, const vec <T1 *> &avoid_xy, double avoid_radius_squ) {
+  void init(vec <neuron *> &neurons, network &net, hid_t h5file, const vec <T1 *> &avoid_xy, double avoid_radius_squ) {
 
     // need to add a check that it is possible to distribute all the neurons
     // in the given space
@@ -252,6 +252,15 @@ class topology_orlandi {
     set_udis_param(0.0, 1.0);   // uniform dist min=0 max=1
     set_rdis_param(par.std_l);  // rayleigh dist with std (=800)
 
+    // connections are written directly to the network, with a (constant)
+    // probability per neuron
+    if (neurons.size() > std::numeric_limits<uint32_t>::max()) {
+      printf("too many neurons for the network store\n");
+      exit(-1);
+    }
+    net.per_connection = false;
+    net.clear();
+
     for (size_t i = 0; i < neurons.size(); i++) {
       neuron *n = neurons[i];
       axon  *ax = new axon();
@@ -317,20 +326,22 @@ class topology_orlandi {
             double dist_squ = get_dist_squ(n, tar);
             sortable.push_back( std::make_pair(dist_squ, tar) );
             num_outgoing += 1;
-          } else
+          } else if (h5file >= 0) {
             // remember failed connection attempts  so we can plot them.
             n->rejected.push_back(neurons[j]);
+          }
         }
       }
 
       // sort outgoing connections by distance
       sort(sortable.begin(), sortable.end());
       for (size_t j = 0; j < sortable.size(); j++)
-        n->outgoing.push_back(sortable[j].second);
+        net.targets.push_back(uint32_t(sortable[j].second->id));
+      net.offsets.push_back(net.targets.size());
 
       // set (constant) outgoing porbablity to 1/number_connections
-      if (sortable.size() > 0)
-        n->outgoing_probability.push_back(1./double(sortable.size()));
+      net.probability.push_back(
+        sortable.size() > 0 ? 1./double(sortable.size()) : 0.);
 
       delete ax;
     }
@@ -344,9 +355,9 @@ class topology_orlandi {
   }
 
   // constructor overload. call init after setting custom parameters
-  void init(vec <neuron *> &neurons, hid_t h5file = -1) {
+  void init(vec <neuron *> &neurons, network &net, hid_t h5file = -1) {
     vec <neuron *> placeholder;
-    init(neurons, h5file, placeholder, 0.0);
+    init(neurons, net, h5file, placeholder, 0.0);
   }
 
   // ------------------------------------------------------------------ //
@@ -371,14 +382,16 @@ class topology_orlandi {
   }
 
   // 0 no connection, 1 successfull connection, 2 intersec but no connection
-  void write_connectivty_matrix(vec <neuron *> &neurons, hid_t h5file) {
+  // (failed attempts are only remembered if init was given the h5file)
+  void write_connectivty_matrix(vec <neuron *> &neurons, network &net,
+                                hid_t h5file) {
     hid_t h5_matrix = hdf5_create_appendable_nd(
                           h5file, "/connectivity_matrix", H5T_NATIVE_HSIZE,
                           neurons.size(), neurons.size());
     for (size_t i = 0; i < neurons.size(); i++) {
       vec <size_t> row(neurons.size(), 0);
-      for (size_t j = 0; j < neurons[i]->outgoing.size(); j++)
-        row[ neurons[i]->outgoing[j]->id ] = 1;
+      for (size_t c = net.offsets[i]; c < net.offsets[i+1]; c++)
+        row[ net.targets[c] ] = 1;
       for (size_t j = 0; j < neurons[i]->rejected.size(); j++)
         row[ neurons[i]->rejected[j]->id ] = 2;
       hdf5_append_nd(h5_matrix, row, H5T_NATIVE_HSIZE, i, 0);
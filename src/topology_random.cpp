@@ -89,7 +89,7 @@ class topology_random {
   // ------------------------------------------------------------------ //
 
   template <typename T1>
-  void init(vec <neuron *> &neurons, hid_t h5file, const vec <T1 *> &avoid_xy, double avoid_radius_squ) {
+  void init(vec <neuron *> &neurons, network &net, hid_t h5file, const vec <T1 *> &avoid_xy, double avoid_radius_squ) {
 
     printf("placing neurons on random topology\n");
     for (size_t i = 0; i < neurons.size(); i++) delete neurons[i];
@@ -123,9 +123,19 @@ class topology_random {
       neurons.push_back(n);
     }
 
-    // create hard-wired connections
+    // create hard-wired connections, written directly to the network.
+    // optionally set effective interaction radius via std (sigma), else
+    // set (constant) outgoing porbablity to 1/number_connections
+    // (std = 0, non-local interaction)
     printf("connecting neurons with K=%lu random partners\n", par.K);
+    if (neurons.size() > std::numeric_limits<uint32_t>::max()) {
+      printf("too many neurons for the network store\n");
+      exit(-1);
+    }
+    double sigma_squ       = 2.*pow(par.std*par.d_N, 2.);
     size_t num_connections = 0;
+    net.per_connection = (par.std > 0.);
+    net.clear(neurons.size()*par.K);
     for (size_t i = 0; i < neurons.size(); i++) {
       neuron *src = neurons[i];
       vec <std::pair <double, neuron *> > sortable;
@@ -144,47 +154,27 @@ class topology_random {
 
       // sort outgoing connections by distance
       sort(sortable.begin(), sortable.end());
-      src->outgoing.reserve(sortable.size());
       for (size_t j = 0; j < sortable.size(); j++)
-        src->outgoing.push_back(sortable[j].second);
+        net.targets.push_back(uint32_t(sortable[j].second->id));
+
+      if (net.per_connection) {
+        // activation probabilities based on distance, normalized
+        double norm = 0.;
+        for (size_t j = 0; j < sortable.size(); j++)
+          norm += exp(-sortable[j].first/sigma_squ);
+        for (size_t j = 0; j < sortable.size(); j++)
+          net.probability.push_back(exp(-sortable[j].first/sigma_squ)/norm);
+      } else {
+        net.probability.push_back(
+          sortable.size() > 0 ? 1./double(sortable.size()) : 0.);
+      }
+      net.offsets.push_back(net.targets.size());
 
       // if(i==0 || is_percent(i, size_t(neurons.size()), 10.)) {
       //   printf("\t%s, %lu/%lu\n", time_now().c_str(), i, neurons.size());
       // }
     }
 
-    // optionally set effective interaction radius via std (sigma)
-    if (par.std > 0.) {
-      double sigma_squ = 2.*pow(par.std*par.d_N, 2.);
-      for (size_t i = 0; i < neurons.size(); i++) {
-        neuron *src   = neurons[i];
-        size_t n_cout = src->outgoing.size();
-        src->outgoing_probability.reserve(n_cout);
-        double norm = 0.;
-
-        // activation probabilities based on distance
-        for (size_t j = 0; j < n_cout; j++) {
-          double dij_squ = get_dist_squ(src, src->outgoing[j]);
-          double pij     = exp(-dij_squ/sigma_squ);
-          src->outgoing_probability.push_back(pij);
-          norm += pij;
-        }
-
-        // normalize probabilities
-        for (size_t j = 0; j < src->outgoing_probability.size(); j++) {
-          src->outgoing_probability[j] /= norm;
-        }
-      }
-    } else {
-      // set (constant) outgoing porbablity to 1/number_connections
-      // std = 0, non-local interaction
-      for (size_t i = 0; i < neurons.size(); i++) {
-        neuron *n = neurons[i];
-        if (n->outgoing.size() > 0)
-          n->outgoing_probability.push_back(1./double(n->outgoing.size()));
-      }
-    }
-
     // print details
     printf("init done\n");
     printf("number of neurons placed: %lu\n", neurons.size());
@@ -199,9 +189,9 @@ class topology_random {
   }
 
   // constructor overload. call init after setting custom parameters
-  void init(vec <neuron *> &neurons, hid_t h5file = -1) {
+  void init(vec <neuron *> &neurons, network &net, hid_t h5file = -1) {
     vec <neuron *> placeholder;
-    init(neurons, h5file, placeholder, 0.0);
+    init(neurons, net, h5file, placeholder, 0.0);
   }
 
   // ------------------------------------------------------------------ //
@@ -223,11 +213,12 @@ class topology_random {
     return avg_dist;
   }
 
-  double measure_avg_connection_length(vec <neuron *> &neurons) {
+  double measure_avg_connection_length(vec <neuron *> &neurons,
+                                       network &net) {
     double avg_dist = 0;
     for (size_t i = 0; i < neurons.size(); i++) {
-      for (size_t j = 0; j < neurons[i]->outgoing.size(); j++) {
-        double d = get_dist_squ(neurons[i], neurons[i]->outgoing[j]);
+      for (size_t c = net.offsets[i]; c < net.offsets[i+1]; c++) {
+        double d = get_dist_squ(neurons[i], neurons[net.targets[c]]);
         avg_dist += sqrt(d);
       }
     }
@@ -278,14 +269,15 @@ class topology_random {
     }
   }
 
-  void write_connectivty_matrix(vec <neuron *> &neurons, hid_t h5file) {
+  void write_connectivty_matrix(vec <neuron *> &neurons, network &net,
+                                hid_t h5file) {
     hid_t h5_matrix = hdf5_create_appendable_nd(
                           h5file, "/connectivity_matrix", H5T_NATIVE_HSIZE,
                           neurons.size(), neurons.size());
     for (size_t i = 0; i < neurons.size(); i++) {
       vec <size_t> row(neurons.size(), 0);
-      for (size_t j = 0; j < neurons[i]->outgoing.size(); j++)
-        row[ neurons[i]->outgoing[j]->id ] = 1;
+      for (size_t c = net.offsets[i]; c < net.offsets[i+1]; c++)
+        row[ net.targets[c] ] = 1;
       hdf5_append_nd(h5_matrix, row, H5T_NATIVE_HSIZE, i, 0);
     }
     H5Dclose(h5_matrix);